@@ -1,5 +1,6 @@
 import numpy as np
 import copy
+import threading
 
 from objectives.objective_function import ObjectiveFunction
 from objectives.angle_distance import AngleDistance
@@ -9,6 +10,7 @@ from objectives.personal_space_cost import PersonalSpaceCost
 
 from trajectory.trajectory import SystemConfig, Trajectory
 from utils.fmm_map import FmmMap
+from utils.fmm_map_cache import FmmMapCache
 from agents.agent_base import AgentBase
 from params.central_params import create_agent_params
 
@@ -16,6 +18,8 @@ from params.central_params import create_agent_params
 class Agent(AgentBase):
     sim_t: float = None   # global simulator time that all agents know
     sim_dt: float = None  # simulator (world) refresh rate
+    # notified whenever the global simulator time advances (see set_sim_t)
+    sim_t_changed: threading.Condition = threading.Condition()
 
     def __init__(self, start, goal, name):
         # Dynamics and movement attributes
@@ -74,7 +78,9 @@ class Agent(AgentBase):
     @staticmethod
     def set_sim_t(t):
         # all agents know the same world time
-        Agent.sim_t = t
+        with Agent.sim_t_changed:
+            Agent.sim_t = t
+            Agent.sim_t_changed.notify_all()
 
     @staticmethod
     def restart_coloring():
@@ -105,6 +111,13 @@ class Agent(AgentBase):
 
         self.planner_data = self.planner.optimize(self.planned_next_config,
                                                   self.goal_config)
+        self.follow_planner_data()
+
+    def follow_planner_data(self):
+        """
+        Appends the next (control horizon) segment of the planned trajectory
+        in self.planner_data to the agent's trajectory
+        """
         traj_segment = \
             Trajectory.new_traj_clip_along_time_axis(self.planner_data['trajectory'],
                                                      self.params.control_horizon,
@@ -118,6 +131,35 @@ class Agent(AgentBase):
                                                track_trajectory_acceleration=tr_acc)
         self.enforce_termination_conditions()
 
+    @staticmethod
+    def update_batch(agents, sim_state=None):
+        """ Runs update() for many agents at once, planning for all of them in
+        a single batched pass (see SamplingPlanner.optimize_batch) """
+        for a in agents:
+            a.sense(sim_state)
+        Agent.plan_batch(agents)
+        for a in agents:
+            a.act()
+
+    @staticmethod
+    def plan_batch(agents):
+        """
+        Runs plan() for every (still acting) agent in one batched pass, all the
+        agents must plan with the same kind of planner on the one control pipeline
+        """
+        agents = [a for a in agents if not a.end_acting]
+        if len(agents) == 0:
+            return
+        for a in agents:
+            assert(hasattr(a, 'planner'))
+        assert(Agent.sim_dt is not None)
+        all_planner_data = \
+            type(agents[0].planner).optimize_batch([a.planner for a in agents],
+                                                   [a.planned_next_config for a in agents])
+        for a, planner_data in zip(agents, all_planner_data):
+            a.planner_data = planner_data
+            a.follow_planner_data()
+
     def act(self):
         """ A utility method to initialize a config object
         from a particular timestep of a given trajectory object"""
@@ -232,6 +274,9 @@ class Agent(AgentBase):
                 pass
             else:
                 assert False
+        # the last plan was optimized for the previous objective
+        if hasattr(self, 'planner'):
+            self.planner.forget_last_plan()
 
     @staticmethod
     def _init_psc_objective(params):
@@ -258,7 +303,8 @@ class Agent(AgentBase):
                                                              self.obstacle_map.get_map_size_2()),
                                                          dx=self.obstacle_map.get_dx(),
                                                          map_origin_2=self.obstacle_map.get_map_origin_2(),
-                                                         mask_grid_mn=obstacle_occupancy_grid)
+                                                         mask_grid_mn=obstacle_occupancy_grid,
+                                                         cache=FmmMapCache.get_shared_cache(params.fmm_map_cache))
         Agent._update_fmm_map(self)
 
     @staticmethod
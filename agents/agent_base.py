@@ -287,33 +287,30 @@ class AgentBase(object):
         fashion to the system starting from start_config.
         """
         x0_n1d, _ = self.system_dynamics.parse_trajectory(start_config)
-        applied_actions = []
-        states = [x0_n1d * 1.]
-        x_next_n1d = x0_n1d * 1.
-        for t in range(T):
-            u_n1f = control_nk2[:, t:t + 1]
-            x_next_n1d = self.system_dynamics.simulate(x_next_n1d,
-                                                       u_n1f, mode=sim_mode)
-
-            # Append the applied action to the action list
-            if sim_mode == 'ideal':
-                applied_actions.append(u_n1f)
-            elif sim_mode == 'realistic':
+        if sim_mode == 'ideal':
+            # The applied actions are the commanded ones, so the whole
+            # rollout can be simulated at once
+            x_nkd = self.system_dynamics.simulate_ideal_T(x0_n1d, control_nk2, T)
+            u_nkf = control_nk2[:, :T]
+        elif sim_mode == 'realistic':
+            # The states and applied actions are written into preallocated buffers
+            n, d = x0_n1d.shape[0], x0_n1d.shape[2]
+            x_nkd = np.empty((n, T + 1, d), dtype=np.result_type(x0_n1d, control_nk2))
+            u_nkf = np.empty((n, T, control_nk2.shape[2]), dtype=control_nk2.dtype)
+            x_nkd[:, 0] = x0_n1d[:, 0]
+            for t in range(T):
+                self.system_dynamics.simulate_into(x_nkd[:, t], control_nk2[:, t], x_nkd[:, t + 1],
+                                                   mode=sim_mode)
                 # TODO: This line is intended for a real hardware setup.
                 # If running this code on a real robot the user will need to
                 # implement hardware.state_dx such that it reflects the current
                 # sensor reading of the robot's applied actions
-                applied_actions.append(
-                    np.array(self.system_dynamics.hardware.state_dx * 1.)[None, None])
-            else:
-                assert(False)
-
-            states.append(x_next_n1d)
+                u_nkf[:, t] = np.array(self.system_dynamics.hardware.state_dx * 1.)[None]
+        else:
+            assert(False)
 
         commanded_actions_nkf = np.concatenate(
-            [control_nk2[:, :T], u_n1f], axis=1)
-        u_nkf = np.concatenate(applied_actions, axis=1)
-        x_nkd = np.concatenate(states, axis=1)
+            [control_nk2[:, :T], control_nk2[:, T - 1:T]], axis=1)
         trajectory = self.system_dynamics.assemble_trajectory(x_nkd,
                                                               u_nkf,
                                                               pad_mode='repeat')
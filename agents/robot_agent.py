@@ -2,6 +2,8 @@ from utils.utils import generate_config_from_pos_3
 from agents.agent import Agent
 from agents.robot_utils import clip_vel, clip_posn, send_sim_state, send_to_joystick, force_connect
 from agents.robot_utils import establish_handshake, listen_once, close_sockets
+from agents.robot_utils import default_channel, open_channel
+from agents.robot_utils import open_joystick_record, load_joystick_record, replay_joystick_data
 from trajectory.trajectory import SystemConfig
 from params.central_params import create_robot_params
 import numpy as np
@@ -9,6 +11,9 @@ import time
 
 
 class RobotAgent(Agent):
+    # socket channel to the joystick, one per simulator process (or server session)
+    channel = default_channel
+
     def __init__(self, name, start_config, goal_config):
         super().__init__(start_config,
                          goal_config,
@@ -48,6 +53,9 @@ class RobotAgent(Agent):
         self.num_cmds_per_batch = 1
         # maximum number of times that the robot will repeat the last command if in asynch-mode
         self.remaining_repeats = self.params.robot_params.max_repeats
+        # (optionally) record every joystick message, or replay a past recording
+        self.joystick_record = None
+        self.replaying = self.params.robot_params.replay_joystick
 
     def get_num_executed(self):
         return int(np.floor(len(self.joystick_inputs) / self.num_cmds_per_batch))
@@ -226,23 +234,42 @@ class RobotAgent(Agent):
                 robot_on=False,
                 termination_cause=self.termination_cause
             )
-            send_to_joystick(quit_message)
+            send_to_joystick(quit_message, RobotAgent.channel)
         except:
             return
 
     def listen_to_joystick(self):
+        episode_name = self.world_state.get_episode_name()
+        if self.replaying:
+            # feed the recorded joystick messages instead of listening to a joystick
+            records = load_joystick_record(self.params.robot_params,
+                                           episode_name)
+            replay_joystick_data(self, records)
+            return
+        if self.params.robot_params.record_joystick:
+            self.joystick_record = \
+                open_joystick_record(self.params.robot_params, episode_name)
         # send initial world state (specific episode metadata)
-        send_to_joystick(self.world_state.to_json(send_metadata=True))
+        send_to_joystick(self.world_state.to_json(send_metadata=True),
+                         RobotAgent.channel)
         while not self.get_end_acting():
             listen_once(self)
+        if self.joystick_record is not None:
+            self.joystick_record.close()
+            self.joystick_record = None
 
     def force_connect_self(self):
-        force_connect()
+        if self.replaying:
+            # the replay thread finishes on its own once the robot powers off
+            return
+        force_connect(RobotAgent.channel)
 
     @staticmethod
     def establish_joystick_handshake(p):
-        establish_handshake(p)
+        # sessions hosted by a SimulatorServer communicate over their own channel
+        RobotAgent.channel = open_channel(p.robot_params.session_id)
+        establish_handshake(p, RobotAgent.channel)
 
     @staticmethod
     def close_robot_sockets():
-        close_sockets()
+        close_sockets(RobotAgent.channel)
@@ -2,12 +2,12 @@ import numpy as np
 import json
 import socket
 import threading
+import time
 import os
-from utils.utils import euclidean_dist2, iter_print, conn_recv
+from utils.utils import euclidean_dist2, iter_print, conn_recv, session_name, touch
 from utils.utils import color_red, color_reset, color_green
 from params.central_params import create_robot_params
-
-lock = threading.Lock()  # for asynchronous data sending
+from agents.agent import Agent
 
 
 def clip_vel(vel, bounds):
@@ -43,16 +43,38 @@ def clip_posn(sim_dt: float, old_pos3: list, new_pos3: list, v_bounds: list, eps
 
 """BEGIN socket utils"""
 
-joystick_receiver_socket = None
-joystick_sender_socket = None
-recv_ID = create_robot_params().recv_ID
-send_ID = create_robot_params().send_ID
 
-# clear sockets to be used
-if os.path.exists(recv_ID):
-    os.remove(recv_ID)
-if os.path.exists(send_ID):
-    os.remove(send_ID)
+class JoystickChannel(object):
+    """The socket identifiers and sockets used by a single robot<->joystick
+    session. Sessions hosted by the same machine (see simulators/simulator_server.py)
+    each get their own channel so their socket paths never collide."""
+
+    def __init__(self, session_id=None):
+        robot_params = create_robot_params()
+        self.session_id = session_id
+        self.recv_ID = session_name(robot_params.recv_ID, session_id)
+        self.send_ID = session_name(robot_params.send_ID, session_id)
+        self.receiver_socket = None
+        self.sender_socket = None
+        self.lock = threading.Lock()  # for asynchronous data sending
+        self.clear_socket_files()
+
+    def clear_socket_files(self):
+        # clear sockets to be used
+        if os.path.exists(self.recv_ID):
+            os.remove(self.recv_ID)
+        if os.path.exists(self.send_ID):
+            os.remove(self.send_ID)
+
+
+# channel used when running a single simulator-joystick pair
+default_channel = JoystickChannel()
+
+
+def open_channel(session_id=None):
+    if session_id is None:
+        return default_channel
+    return JoystickChannel(session_id)
 
 
 def send_sim_state(robot):
@@ -60,35 +82,33 @@ def send_sim_state(robot):
     if robot.joystick_requests_world == 0:
         world_state = \
             robot.world_state.to_json(robot_on=not robot.get_end_acting())
-        send_to_joystick(world_state)
+        send_to_joystick(world_state, robot.channel)
         # immediately note that the world has been sent:
         robot.joystick_requests_world = -1
 
 
-def send_to_joystick(message: str):
-    with lock:
+def send_to_joystick(message: str, channel: JoystickChannel = default_channel):
+    with channel.lock:
         assert(isinstance(message, str))
-        global joystick_sender_socket
         # Create a TCP/IP socket
-        joystick_sender_socket = \
+        channel.sender_socket = \
             socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         # Connect the socket to the port where the server is listening
         try:
-            joystick_sender_socket.connect(send_ID)
-        except ConnectionRefusedError:
-            # abort and dont send data
+            channel.sender_socket.connect(channel.send_ID)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # abort and dont send data (also when there is no joystick, ie. replaying)
             return
         # Send data
-        joystick_sender_socket.sendall(bytes(message, "utf-8"))
-        joystick_sender_socket.close()
+        channel.sender_socket.sendall(bytes(message, "utf-8"))
+        channel.sender_socket.close()
 
 
 def listen_once(robot):
     """Constantly connects to the robot listener socket and receives information from the
     joystick about the input commands as well as the world requests
     """
-    global joystick_receiver_socket
-    connection, _ = joystick_receiver_socket.accept()
+    connection, _ = robot.channel.receiver_socket.accept()
     data_b, response_len = conn_recv(connection, buffr_amnt=128)
     # close connection to be reaccepted when the joystick sends data
     connection.close()
@@ -97,6 +117,8 @@ def listen_once(robot):
         if robot.get_end_acting():
             robot.joystick_requests_world = 0
         else:
+            if robot.joystick_record is not None:
+                record_joystick_data(robot, data_str)
             manage_data(robot, data_str)
 
 
@@ -110,7 +132,9 @@ def is_keyword(robot, data_str: str):
         robot.joystick_ready = True
         return True
     elif "algo: " in data_str:
-        robot.algo_name = data_str[len("algo: "):]
+        # sessions get their own output directory even when running the same algorithm
+        robot.algo_name = session_name(data_str[len("algo: "):],
+                                       robot.channel.session_id)
         return True
     elif data_str == "abandon":
         robot.power_off()
@@ -129,59 +153,60 @@ def manage_data(robot, data_str: str):
             robot.joystick_inputs.append(np_data)
 
 
-def establish_joystick_receiver_connection():
+def establish_joystick_receiver_connection(channel: JoystickChannel = default_channel):
     """This is akin to a server connection (robot is server)"""
-    global joystick_receiver_socket
-    joystick_receiver_socket = \
+    channel.receiver_socket = \
         socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    joystick_receiver_socket.bind(recv_ID)
+    channel.receiver_socket.bind(channel.recv_ID)
     # wait for a connection
-    joystick_receiver_socket.listen(1)
+    channel.receiver_socket.listen(1)
     print("Waiting for Joystick connection...")
-    connection, client = joystick_receiver_socket.accept()
+    connection, client = channel.receiver_socket.accept()
     print("%sRobot <-- Joystick (receiver) connection established%s" %
           (color_green, color_reset))
     return connection, client
 
 
-def establish_joystick_sender_connection():
+def establish_joystick_sender_connection(channel: JoystickChannel = default_channel):
     """This is akin to a client connection (joystick is client)"""
-    global joystick_sender_socket
-    joystick_sender_socket = socket.socket(socket.AF_UNIX,
-                                           socket.SOCK_STREAM)
+    channel.sender_socket = socket.socket(socket.AF_UNIX,
+                                          socket.SOCK_STREAM)
     try:
-        joystick_sender_socket.connect(send_ID)
+        channel.sender_socket.connect(channel.send_ID)
     except:
         print("%sUnable to connect to joystick%s" %
               (color_red, color_reset))
         print("Make sure you have a joystick instance running")
         exit(1)
-    assert(joystick_sender_socket is not None)
+    assert(channel.sender_socket is not None)
     print("%sRobot --> Joystick (sender) connection established%s" %
           (color_green, color_reset))
 
 
-def close_sockets():
-    global joystick_sender_socket
-    global joystick_receiver_socket
-    joystick_sender_socket.close()
-    joystick_receiver_socket.close()
+def close_sockets(channel: JoystickChannel = default_channel):
+    if channel.sender_socket is not None:
+        channel.sender_socket.close()
+    if channel.receiver_socket is not None:
+        channel.receiver_socket.close()
 
 
-def force_connect():
+def force_connect(channel: JoystickChannel = default_channel):
     s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     # connect to the socket to break the accept() wait
-    s.connect(recv_ID)
+    s.connect(channel.recv_ID)
 
 
-def establish_handshake(p):  # NOTE: p is a DotMap
+def establish_handshake(p, channel: JoystickChannel = default_channel):  # NOTE: p is a DotMap
     if p.episode_params.without_robot:
         # lite-mode episode does not include a robot or joystick
         return
+    if p.robot_params.replay_joystick:
+        # the recorded joystick commands are replayed instead
+        return
     import time
-    establish_joystick_receiver_connection()
+    establish_joystick_receiver_connection(channel)
     time.sleep(0.01)
-    establish_joystick_sender_connection()
+    establish_joystick_sender_connection(channel)
     # send the preliminary episodes that the socnav is going to run
     json_dict = {}
     json_dict['episodes'] = list(p.episode_params.tests.keys())
@@ -189,9 +214,61 @@ def establish_handshake(p):  # NOTE: p is a DotMap
     # Create a TCP/IP socket
     send_episodes_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     # Connect the socket to the port where the server is listening
-    send_episodes_socket.connect(send_ID)
+    send_episodes_socket.connect(channel.send_ID)
     send_episodes_socket.sendall(bytes(episodes, "utf-8"))
     send_episodes_socket.close()
 
 
 """ END socket utils """
+
+"""BEGIN record utils"""
+
+
+def joystick_record_path(robot_params, episode_name: str):
+    from params.central_params import get_path_to_socnav
+    return os.path.join(get_path_to_socnav(), robot_params.joystick_record_dir,
+                        episode_name + ".jsonl")
+
+
+def open_joystick_record(robot_params, episode_name: str):
+    """Opens the (json lines) file that every joystick message is recorded to"""
+    abs_path = joystick_record_path(robot_params, episode_name)
+    touch(abs_path)
+    return open(abs_path, 'w')
+
+
+def record_joystick_data(robot, data_str: str):
+    # NOTE: the messages are recorded at the (simulator) time they were received
+    record = {'sim_t': robot.sim_t,
+              'wall_t': time.time(),
+              'data': data_str}
+    robot.joystick_record.write(json.dumps(record) + "\n")
+
+
+def load_joystick_record(robot_params, episode_name: str):
+    """Loads the recorded joystick messages of an episode, ordered by sim_t"""
+    abs_path = joystick_record_path(robot_params, episode_name)
+    if not os.path.exists(abs_path):
+        print("%sNo joystick record for episode \"%s\" at %s%s" %
+              (color_red, episode_name, abs_path, color_reset))
+        exit(1)
+    with open(abs_path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def replay_joystick_data(robot, records: list, epsilon: float = 1e-6):
+    """Feeds the recorded joystick messages to the robot at the same simulator
+    times they were originally received, without a joystick process"""
+    for record in records:
+        # wait for the simulator to reach the time the message was received
+        with Agent.sim_t_changed:
+            while not robot.get_end_acting() and robot.sim_t < record['sim_t'] - epsilon:
+                # (woken up when sim_t advances, or after a sim dt to notice the robot powering off)
+                Agent.sim_t_changed.wait(timeout=Agent.sim_dt or 0.05)
+        if robot.get_end_acting():
+            break
+        manage_data(robot, record['data'])
+
+
+""" END record utils """
@@ -1,6 +1,7 @@
 import os
 import pickle
 import numpy as np
+from control_pipelines import pipeline_store
 
 
 class ControlPipelineBase(object):
@@ -25,10 +26,9 @@ class ControlPipelineBase(object):
         p.planning_horizon_s = p.spline_params.max_final_time
         p.planning_horizon = int(
             np.ceil(p.planning_horizon_s / p.system_dynamics_params.dt))
-        # ensures that there will be at most one ControlPipeline generated at any time because they are
-        # very memory intensive, set to false to produce a separate control pipeline for each agent/planner
-        # which could theoretically allow for true parallelism, but is not as useful in our multithreaded model
-        # (due to the python GIL)
+        # there is only ever one ControlPipeline (they are very memory intensive) which every planner plans on
+        # (in its own workspace). When true the planners also take turns planning, set to false to let them plan
+        # concurrently, which is not as useful in our multithreaded model (due to the python GIL)
         p.only_one_system = True
         ControlPipelineBase.only_one_system = p.only_one_system
         return p
@@ -70,8 +70,13 @@ class ControlPipelineBase(object):
         by generate_control_pipeline function.
         """
         if file_format == '.pkl':
-            with open(filename, 'wb') as f:
+            # write to a temporary file first so an interrupted save never leaves a truncated pickle at filename
+            tmp_filename = filename + '.tmp'
+            with open(tmp_filename, 'wb') as f:
                 pickle.dump(data, f)
+            os.replace(tmp_filename, filename)
+        elif file_format == pipeline_store.MANIFEST_FORMAT:
+            pipeline_store.save_data_bin(data, filename)
         else:
             raise NotImplementedError
 
@@ -82,7 +87,13 @@ class ControlPipelineBase(object):
         """
         return np.array([os.path.isfile(p) for p in self.pipeline_files]).all()
 
-    def valid_file_names(self, file_format='.pkl'):
+    def file_format(self):
+        """The file format of the saved pipeline, either pickles or the memory-mapped store."""
+        if self.params.store_format == 'mmap':
+            return pipeline_store.MANIFEST_FORMAT
+        return '.pkl'
+
+    def valid_file_names(self, file_format=None):
         """
         This function should return the list of the names of all files that a control pipeline should create.
         """
@@ -1,12 +1,19 @@
 from utils import utils
 import os
 import sys
-import copy
+import time
+import threading
+import shutil
+import multiprocessing
 import numpy as np
 from optCtrl.lqr import LQRSolver
 from trajectory.trajectory import Trajectory, SystemConfig
+from utils.precision import get_float_dtype
 from control_pipelines.base import ControlPipelineBase
 from control_pipelines.control_pipeline_v0_helper import ControlPipelineV0Helper
+from control_pipelines import pipeline_store
+from control_pipelines.waypoint_index import WaypointIndex
+from utils.angle_utils import angle_normalize
 
 
 class ControlPipelineV0(ControlPipelineBase):
@@ -22,6 +29,7 @@ class ControlPipelineV0(ControlPipelineBase):
                                             params.binning_parameters.num_bins)
         self.helper = ControlPipelineV0Helper()
         self.instance_variables_loaded = False
+        self.load_lock = threading.Lock()
         super(ControlPipelineV0, self).__init__(params)
 
     @classmethod
@@ -33,128 +41,197 @@ class ControlPipelineV0(ControlPipelineBase):
             cls.pipeline = cls(params)
         else:
             assert(utils.check_dotmap_equality(cls.pipeline.params, params))
-        # can deepcopy for true parallelism, but due to the GIL (since our gen_agents are threaded)
-        # it would be better to simply use the same pipeline
-        if(cls.only_one_system):  # part of the base
-            return cls.pipeline
-        else:
-            return copy.deepcopy(cls.pipeline)
+        # The precomputed data is never written to (plan() only writes into the workspace of the planner) so every
+        # planner shares the one pipeline instead of a deepcopy. With the memory-mapped store the data is also shared
+        # (through the page cache) by every process that uses the same pipeline.
+        return cls.pipeline
 
-    def plan(self, start_config, goal_config=None, greedy=False):
-        """Computes which velocity bin start_config belongs to and returns the corresponding waypoints, horizons,
-        lqr_trajectories, and LQR controllers. If goal_config is none, returns data for all the precomputed waypoints.
-        Else returns data only for the closest waypoint to goal_config"""
+    def new_workspace(self):
+        """Returns a new workspace (the world coordinate buffers) to plan with, see ControlPipelineV0Workspace."""
+        return ControlPipelineV0Workspace(len(self.start_velocities))
 
+    def plan(self, start_config, goal_config=None, greedy=False, workspace=None):
+        """Computes which velocity bin start_config belongs to and returns the corresponding waypoints, horizons,
+        lqr_trajectories, and LQR controllers. If goal_config is none (or not greedy), returns data for all the
+        precomputed waypoints. Else returns data only for the closest waypoint to goal_config. The lqr trajectories (in
+        world coordinates) are written to workspace which defaults to the pipeline's own workspace, planners that plan
+        concurrently must each use their own (see new_workspace).
+        NOTE: in either mode only the lqr trajectories are converted to world coordinates (and only their positions and
+        headings when planning to all the waypoints, that is all the objectives need), the waypoints, spline
+        trajectories and controllers are returned in egocentric coordinates, see waypt_to_world_coordinates and
+        controllers_to_world_coordinates to convert (only) the chosen one."""
+        if workspace is None:
+            workspace = self.workspace
         # Compute the closest velocity bin for this starting configuration
         idx = self._compute_bin_idx_for_start_velocities(
             start_config.speed_nk1()[:, :, 0])[0]
-        # Convert waypoints for this velocity bin into world coordinates
-        self.waypt_configs_world[idx] = \
-            self.system_dynamics.to_world_coordinates(start_config, self.waypt_configs[idx],
-                                                      self.waypt_configs_world[idx],
-                                                      mode='assign')
-        # Setup world coordinate tensors if needed
-        self._ensure_world_coordinate_tensors_exist(goal_config)
+        # Bins of the memory-mapped store are only materialized when first needed
+        self._ensure_bin_loaded(idx)
         # Generate the sub-trajectories from the initial (start) config to either the closest
         # waypoint to the goal (which could get into greedy problems) or simply ALL of the
         # waypoints which can then be ranked by the evaluation function and optimized well.
-        if not greedy or goal_config is None:
+        to_all_waypoints = not greedy or goal_config is None
+        # Setup world coordinate tensors if needed
+        self._ensure_world_coordinate_tensors_exist(workspace, idx,
+                                                    None if to_all_waypoints else goal_config)
+        if to_all_waypoints:
             waypt_configs, horizons, trajectories_lqr, trajectories_spline, controllers = \
-                self._plan_to_all_waypoints(idx, start_config)
+                self._plan_to_all_waypoints(idx, start_config, workspace)
         else:
             waypt_configs, horizons, trajectories_lqr, trajectories_spline, controllers = \
-                self._plan_to_a_waypoint(idx, start_config, goal_config)
+                self._plan_to_a_waypoint(idx, start_config, goal_config, workspace)
 
         trajectories_lqr.update_valid_mask_nk()
         return waypt_configs, horizons, trajectories_lqr, trajectories_spline, controllers
 
-    def _plan_to_all_waypoints(self, idx, start_config):
+    def waypt_to_world_coordinates(self, start_config, waypt_configs, batch_idx):
+        """Converts the (egocentric) waypoint at batch_idx, as returned by plan() when planning to all the
+        waypoints, to the world coordinate frame of start_config."""
+        return self.system_dynamics.to_world_coordinates(start_config, waypt_configs[batch_idx], mode='new')
+
+    def controllers_to_world_coordinates(self, start_config, controllers, batch_idx):
+        """Returns the (egocentric) LQR controllers at batch_idx, as returned by plan() when planning to all the
+        waypoints, in the world coordinate frame of start_config (K_nkfd is only converted if
+        convert_K_to_world_coordinates is set)."""
+        K_nkfd = controllers['K_nkfd'][batch_idx:batch_idx + 1]
+        k_nkf1 = controllers['k_nkf1'][batch_idx:batch_idx + 1]
+        if self.params.convert_K_to_world_coordinates:
+            K_nkfd = self.system_dynamics.convert_K_to_world_coordinates(start_config, K_nkfd, mode='new')
+        return {'K_nkfd': K_nkfd, 'k_nkf1': k_nkf1}
+
+    def closest_waypt_idxs(self, idx, start_config, goal_config, k=1):
+        """
+        Returns the indices of the k closest (in wrapped [x, y, theta] l2 distance) waypoints of the velocity bin
+        idx to goal_config (in world coordinates) when planning from start_config, closest first.
+        """
+        self._ensure_bin_loaded(idx)
+        # The closest waypoints are the same in the egocentric frame so only the goal has to be converted
+        goal_config_egocentric = self.system_dynamics.to_egocentric_coordinates(start_config, goal_config,
+                                                                                mode='new')
+        waypt_idxs, _ = self.waypt_indices[idx].query(goal_config_egocentric, k=k)
+        return waypt_idxs
+
+    def waypt_index(self, waypt_configs):
+        """
+        Returns the k-d tree (see WaypointIndex) over waypt_configs, the (egocentric) waypoints of a velocity bin as
+        returned by plan(), or a new one if they are not the waypoints of a bin.
+        """
+        for idx, bin_waypt_configs in enumerate(self.waypt_configs):
+            if bin_waypt_configs is waypt_configs:
+                return self.waypt_indices[idx]
+        return WaypointIndex(waypt_configs)
+
+    def _plan_to_all_waypoints(self, idx, start_config, workspace):
         """
         Return all the waypoints, corresponding spline horizons, LQR trajectories and controllers corresponding to the
-        velocity_bin idx. This function is typically used during the expert planning.
+        velocity_bin idx. This function is typically used during the expert planning. Only the LQR trajectories are
+        converted to world coordinates.
         """
-        self.trajectories_world[0] = \
+        workspace.trajectories_world[idx] = \
             self.system_dynamics.to_world_coordinates(start_config,
                                                       self.lqr_trajectories[idx],
-                                                      self.trajectories_world[0],
+                                                      workspace.trajectories_world[idx],
                                                       mode='assign')
         controllers = {'K_nkfd': self.K_nkfd[idx], 'k_nkf1': self.k_nkf1[idx]}
-        if self.params.convert_K_to_world_coordinates:
-            controllers['K_nkfd'] = \
-                self.system_dynamics.convert_K_to_world_coordinates(start_config,
-                                                                    self.K_nkfd[idx],
-                                                                    self.Ks_world_nkfd[idx],
-                                                                    mode='assign')
-        waypt_configs = self.waypt_configs_world[idx]
+        waypt_configs = self.waypt_configs[idx]
         horizons = self.horizons[idx]
-        trajectories_lqr = self.trajectories_world[0]
-        trajectories_spline = self.spline_trajectories_world[0]
+        trajectories_lqr = workspace.trajectories_world[idx]
+        # There usually is not enough memory to hold both the lqr and spline trajectories in the world frame
+        # so the (egocentric) spline trajectories are returned as is
+        trajectories_spline = self.spline_trajectories[idx]
         return waypt_configs, horizons, trajectories_lqr, trajectories_spline, controllers
 
-    def _plan_to_a_waypoint(self, idx, start_config, goal_config):
+    def _plan_to_a_waypoint(self, idx, start_config, goal_config, workspace):
         """
         Find the closest waypoint to the goal_config and return the associated waypoint, spline horizon, trajectory, and lqr controllers.
+        Only the LQR trajectory is converted to world coordinates (see plan).
         """
-        waypt_idx = self.helper.compute_closest_waypt_idx(goal_config,
-                                                          self.waypt_configs_world[idx])
-        waypt_configs = self.waypt_configs_world[idx][waypt_idx]
+        waypt_idx = self.closest_waypt_idxs(idx, start_config, goal_config)[0]
+        waypt_configs = self.waypt_configs[idx][waypt_idx]
         horizons = self.horizons[idx][waypt_idx:waypt_idx + 1]
+        trajectory_spline = self.spline_trajectories[idx][waypt_idx]
 
         self.system_dynamics.to_world_coordinates(start_config, self.lqr_trajectories[idx][waypt_idx],
-                                                  self.trajectories_world[0], mode='assign')
+                                                  workspace.trajectory_world, mode='assign')
 
         # If LQR controller data is being ignored just return the first element
         if self.params.discard_LQR_controller_data:
             waypt_idx = 0
-        else:
-            self.system_dynamics.to_world_coordinates(start_config, self.spline_trajectories[idx][waypt_idx],
-                                                      self.spline_trajectories_world[0], mode='assign')
-
         controllers = {'K_nkfd': self.K_nkfd[idx][waypt_idx:waypt_idx + 1],
                        'k_nkf1': self.k_nkf1[idx][waypt_idx:waypt_idx + 1]}
-
-        if self.params.convert_K_to_world_coordinates:
-            controllers['K_nkfd'] = \
-                self.system_dynamics.convert_K_to_world_coordinates(start_config,
-                                                                    controllers['K_nkfd'],
-                                                                    self.Ks_world_nkfd[0],
-                                                                    mode='assign')
-        return waypt_configs, horizons, self.trajectories_world[0], self.spline_trajectories_world[0], controllers
+        return waypt_configs, horizons, workspace.trajectory_world, trajectory_spline, controllers
+
+    def plan_batch(self, start_configs):
+        """Plans from every one of start_configs (a list of SystemConfig's with n=1, i.e. one per agent) to all the
+        precomputed waypoints of its velocity bin. The start configs are grouped by velocity bin and the waypoints and
+        lqr trajectories of every group are converted to world coordinates in one batched operation. Returns a list
+        with a dictionary for every group where 'idxs' are the indices (into start_configs) of the group and
+        'trajectories_lqr' stack the (world coordinate) lqr trajectories of every start config in the group along the
+        batch dimension, i.e. have a batch size of len(idxs) * (size of the bin). The (egocentric) waypoints, horizons,
+        spline trajectories and controllers are those of the bin (shared by the group)."""
+        speeds_m1 = np.array([config.speed_nk1()[0, 0] for config in start_configs])
+        bin_idxs = self._compute_bin_idx_for_start_velocities(speeds_m1)
+        groups = []
+        for idx in np.unique(bin_idxs):
+            idxs = np.where(bin_idxs == idx)[0]
+            self._ensure_bin_loaded(idx)
+            ref_pos3_m3 = np.array([start_configs[i].position_and_heading_nk3()[0, 0]
+                                    for i in idxs], dtype=get_float_dtype())
+            trajectories_lqr = self._batch_to_world_coordinates(ref_pos3_m3, self.lqr_trajectories[idx],
+                                                                Trajectory)
+            trajectories_lqr.update_valid_mask_nk()
+            groups.append({'idxs': idxs,
+                           'waypt_configs': self.waypt_configs[idx],
+                           'horizons': self.horizons[idx],
+                           'trajectories_lqr': trajectories_lqr,
+                           'trajectories_spline': self.spline_trajectories[idx],
+                           'controllers': {'K_nkfd': self.K_nkfd[idx], 'k_nkf1': self.k_nkf1[idx]}})
+        return groups
+
+    def _batch_to_world_coordinates(self, ref_pos3_m3, traj_egocentric, cls):
+        """Converts traj_egocentric to the world coordinate frame of every one of the (m) reference [x, y, theta]
+        configurations at once. Returns a new cls object with a batch size of m * traj_egocentric.n"""
+        m, n, k = ref_pos3_m3.shape[0], traj_egocentric.n, traj_egocentric.k
+        cos_m111 = np.cos(ref_pos3_m3[:, 2]).reshape((m, 1, 1, 1))
+        sin_m111 = np.sin(ref_pos3_m3[:, 2]).reshape((m, 1, 1, 1))
+        position_1nk2 = traj_egocentric.position_nk2()[None]
+        x_1nk1, y_1nk1 = position_1nk2[:, :, :, 0:1], position_1nk2[:, :, :, 1:2]
+        position_mnk2 = np.concatenate([cos_m111 * x_1nk1 - sin_m111 * y_1nk1,
+                                        sin_m111 * x_1nk1 + cos_m111 * y_1nk1], axis=3) + \
+            ref_pos3_m3[:, None, None, :2]
+        heading_mnk1 = angle_normalize(traj_egocentric.heading_nk1()[None] +
+                                       ref_pos3_m3[:, None, None, 2:3])
+
+        def tile(arr_nk1):
+            # the speeds (and the valid horizons) are the same in every coordinate frame
+            return np.tile(arr_nk1, (m,) + (1,) * (arr_nk1.ndim - 1))
+        track_acceleration = traj_egocentric.acceleration_nk1().size > 0
+        return cls(dt=traj_egocentric.dt, n=m * n, k=k,
+                   position_nk2=position_mnk2.reshape((m * n, k, 2)),
+                   speed_nk1=tile(traj_egocentric.speed_nk1()),
+                   acceleration_nk1=tile(traj_egocentric.acceleration_nk1()) if track_acceleration else None,
+                   heading_nk1=heading_mnk1.reshape((m * n, k, 1)),
+                   angular_speed_nk1=tile(traj_egocentric.angular_speed_nk1()),
+                   angular_acceleration_nk1=tile(traj_egocentric.angular_acceleration_nk1())
+                   if track_acceleration else None,
+                   valid_horizons_n1=tile(traj_egocentric.valid_horizons_n1),
+                   direct_init=True, track_trajectory_acceleration=track_acceleration)
 
     def generate_control_pipeline(self, params=None):
         print("Generating control pipeline, this may take some time...")
-        p = self.params
-        # Initialize spline, cost function, lqr solver
-        waypoints_egocentric = self._sample_egocentric_waypoints(vf=0.)
-        self._init_pipeline()
-        pipeline_data = self.helper.empty_data_dictionary()
-
         if not self._incorrectly_binned_data_exists():
+            # Every initial bin is saved once it is generated so an interrupted generation resumes where it left off
+            self._generate_initial_bins()
+            pipeline_data = self.helper.empty_data_dictionary()
             for v0 in self.start_velocities:
-                if p.verbose:
-                    print('Initial Bin: v0={:.3f}'.format(v0))
-                start_config = \
-                    self.system_dynamics.init_egocentric_robot_config(dt=p.system_dynamics_params.dt,
-                                                                      n=self.waypoint_grid.n, v=v0)
-                goal_config = SystemConfig.copy(waypoints_egocentric)
-                start_config, goal_config, horizons_n1 = self._dynamically_fit_spline(
-                    start_config, goal_config)
-                lqr_trajectory, K_nkfd, k_nkf1 = self._lqr(start_config)
-                # TODO: Put the initial bin information in here too. This will make debugging much easier.
-                data_bin = {'start_configs': start_config,
-                            'waypt_configs': goal_config,
-                            'start_speeds': self.spline_trajectory.speed_nk1()[:, 0],
-                            'spline_trajectories': Trajectory.copy(self.spline_trajectory),
-                            'horizons': horizons_n1,
-                            'lqr_trajectories': lqr_trajectory,
-                            'K_nkfd': K_nkfd,
-                            'k_nkf1': k_nkf1}
+                data_bin = self.helper.load_and_process_data(self._data_file_name(v0=v0, initial_bin=True))
                 self.helper.append_data_bin_to_pipeline_data(
                     pipeline_data, data_bin)
             # This data is incorrectly binned by velocity so collapse it all into one bin before saving it.
             pipeline_data = self.helper.concat_data_across_binning_dim(
                 pipeline_data)
             self._save_incorrectly_binned_data(pipeline_data)
+            self._remove_initial_bins()
         else:
             pipeline_data = self._load_incorrectly_binned_data()
         pipeline_data = self._rebin_data_by_initial_velocity(pipeline_data)
@@ -163,32 +240,90 @@ class ControlPipelineV0(ControlPipelineBase):
         for i, v0 in enumerate(self.start_velocities):
             filename = self._data_file_name(v0=v0)
             data_bin = self.helper.prepare_data_for_saving(pipeline_data, i)
-            self.save_control_pipeline(data_bin, filename)
+            self.save_control_pipeline(data_bin, filename, self.file_format())
+
+    def _generate_initial_bins(self):
+        """Generate (and save) the data of every initial velocity bin that has not been generated yet. The bins are
+        distributed over a pool of num_generation_workers processes."""
+        p = self.params
+        todo_v0s = [v0 for v0 in self.start_velocities
+                    if not os.path.isfile(self._data_file_name(v0=v0, initial_bin=True))]
+        num_done = len(self.start_velocities) - len(todo_v0s)
+        if num_done > 0:
+            print("Resuming control pipeline generation, {:d}/{:d} bins already generated".format(
+                num_done, len(self.start_velocities)))
+        num_workers = p.num_generation_workers
+        if num_workers <= 0:
+            num_workers = multiprocessing.cpu_count()
+        num_workers = min(num_workers, len(todo_v0s))
+        start_t = time.time()
+        if num_workers <= 1:
+            self._init_pipeline()
+            bin_results = (self._generate_initial_bin(v0) for v0 in todo_v0s)
+            self._report_initial_bins(bin_results, num_done, start_t)
+        else:
+            with multiprocessing.Pool(num_workers, initializer=_init_generation_worker,
+                                      initargs=(p,)) as pool:
+                bin_results = pool.imap_unordered(_generate_initial_bin_in_worker, todo_v0s)
+                self._report_initial_bins(bin_results, num_done, start_t)
+
+    def _report_initial_bins(self, bin_results, num_done, start_t):
+        for v0, n, bin_t in bin_results:
+            num_done += 1
+            print("Generated bin {:d}/{:d} (v0={:.3f}, {:d} waypoints) in {:.2f}s, {:.2f}s total".format(
+                num_done, len(self.start_velocities), v0, n, bin_t, time.time() - start_t))
+
+    def _generate_initial_bin(self, v0):
+        """Fit the splines and LQR controllers from the initial velocity v0 to every egocentric waypoint and save them
+        to the initial bin file of v0. Assumes _init_pipeline has been called. Returns (v0, number of waypoints kept,
+        time taken)."""
+        p = self.params
+        bin_start_t = time.time()
+        start_config = \
+            self.system_dynamics.init_egocentric_robot_config(dt=p.system_dynamics_params.dt,
+                                                              n=self.waypoint_grid.n, v=v0)
+        goal_config = SystemConfig.copy(self.waypoints_egocentric)
+        start_config, goal_config, horizons_n1 = self._dynamically_fit_spline(
+            start_config, goal_config)
+        lqr_trajectory, K_nkfd, k_nkf1 = self._lqr(start_config)
+        # TODO: Put the initial bin information in here too. This will make debugging much easier.
+        data_bin = {'start_configs': start_config,
+                    'waypt_configs': goal_config,
+                    'start_speeds': self.spline_trajectory.speed_nk1()[:, 0],
+                    'spline_trajectories': Trajectory.copy(self.spline_trajectory),
+                    'horizons': horizons_n1,
+                    'lqr_trajectories': lqr_trajectory,
+                    'K_nkfd': K_nkfd,
+                    'k_nkf1': k_nkf1}
+        self.save_control_pipeline(data_bin, self._data_file_name(v0=v0, initial_bin=True),
+                                   self.file_format())
+        return v0, start_config.n, time.time() - bin_start_t
+
+    def _remove_initial_bins(self):
+        for v0 in self.start_velocities:
+            filename = self._data_file_name(v0=v0, initial_bin=True)
+            if filename.endswith(pipeline_store.MANIFEST_FORMAT):
+                shutil.rmtree(pipeline_store.array_dir_name(filename))
+            os.remove(filename)
 
     def _dynamically_fit_spline(self, start_config, goal_config):
         """Fit a spline between start_config and goal_config only keeping points that are dynamically feasible within
         the planning horizon."""
         p = self.params
-        times_nk = np.tile(np.linspace(0., p.planning_horizon_s, p.planning_horizon)[
-                           None], [self.waypoint_grid.n, 1])
         final_times_n1 = np.ones(
-            (self.waypoint_grid.n, 1), dtype=np.float32) * p.planning_horizon_s
+            (self.waypoint_grid.n, 1), dtype=get_float_dtype()) * p.planning_horizon_s
         self.spline_trajectory.fit(
             start_config, goal_config, final_times_n1=final_times_n1)
-        self.spline_trajectory.eval_spline(times_nk, calculate_speeds=True)
-        self.spline_trajectory.rescale_spline_horizon_to_dynamically_feasible_horizon(
+        # Only the valid splines are kept (and evaluated)
+        valid_idxs = self.spline_trajectory.fit_dynamically_feasible_on_time_grid(
+            p.planning_horizon_s, p.planning_horizon,
             speed_max_system=self.system_dynamics.v_bounds[1],
             angular_speed_max_system=self.system_dynamics.w_bounds[1], minimum_horizon=p.minimum_spline_horizon)
+        horizons_n1 = self.spline_trajectory.final_times_n1[:, 0]
 
-        valid_idxs = self.spline_trajectory.find_trajectories_within_a_horizon(
-            p.planning_horizon_s)
-        horizons_n1 = self.spline_trajectory.final_times_n1
-
-        # Only keep the valid problems and corresponding splines and horizons
+        # Only keep the valid problems and corresponding horizons
         start_config.gather_across_batch_dim(valid_idxs)
         goal_config.gather_across_batch_dim(valid_idxs)
-        horizons_n1 = np.take(horizons_n1, valid_idxs)
-        self.spline_trajectory.gather_across_batch_dim(valid_idxs)
         return start_config, goal_config, horizons_n1
 
     def _lqr(self, start_config):
@@ -202,17 +337,39 @@ class ControlPipelineV0(ControlPipelineBase):
         return lqr_res['trajectory_opt'], lqr_res['K_opt_nkfd'], lqr_res['k_opt_nkf1']
 
     def _init_pipeline(self):
-        """Initialize Spline, LQR, and LQR cost functions for use in planning. """
+        """Initialize Spline, LQR, and LQR cost functions (and the egocentric waypoints) for use in planning. """
         p = self.params
         self.spline_trajectory = p.spline_params.spline(dt=p.system_dynamics_params.dt, n=p.waypoint_params.n,
                                                         k=p.planning_horizon, params=p.spline_params)
         self.cost_fn = p.lqr_params.cost_fn(trajectory_ref=self.spline_trajectory, system=self.system_dynamics,
                                             params=p.lqr_params)
         self.lqr_solver = LQRSolver(
-            T=p.planning_horizon - 1, dynamics=self.system_dynamics, cost=self.cost_fn)
+            T=p.planning_horizon - 1, dynamics=self.system_dynamics, cost=self.cost_fn,
+            backend=p.lqr_params.get('backend', 'numpy'))
+        # the egocentric waypoints every initial bin is generated to
+        self.waypoints_egocentric = self._sample_egocentric_waypoints(vf=0.)
+
+    def does_pipeline_exist(self):
+        """
+        Check whether a pipeline exists already or not. Pipelines that were saved as pickles are converted to the
+        memory-mapped store (once) when the store is in use.
+        """
+        if super(ControlPipelineV0, self).does_pipeline_exist():
+            return True
+        if self.file_format() == '.pkl':
+            return False
+        pkl_files = self.valid_file_names(file_format='.pkl')
+        if not np.array([os.path.isfile(f) for f in pkl_files]).all():
+            return False
+        print("Converting the pickled control pipeline to the memory-mapped store...")
+        for pkl_file in pkl_files:
+            pipeline_store.convert_pickle_file(pkl_file)
+        return True
 
     def _load_control_pipeline(self, params=None):
-        if not self.instance_variables_loaded:
+        if self.file_format() == pipeline_store.MANIFEST_FORMAT:
+            self._load_control_pipeline_lazily()
+        elif not self.instance_variables_loaded:
             # Initialize a dictionary with keys corresponding to instance variables of the control pipeline and
             # values corresponding to empty lists
             pipeline_data = self.helper.empty_data_dictionary()
@@ -227,10 +384,48 @@ class ControlPipelineV0(ControlPipelineBase):
                     pipeline_data, data_bin)
             self._set_instance_variables(pipeline_data)
 
-    def _set_instance_variables(self, data):
+    def _load_control_pipeline_lazily(self):
+        """Only read the (small) manifests of the memory-mapped store, every velocity bin is materialized on the first
+        plan that needs it."""
+        if self.instance_variables_loaded:
+            return
+        pipeline_data = self.helper.empty_data_dictionary()
+        for key in pipeline_data.keys():
+            pipeline_data[key] = [None] * len(self.start_velocities)
+        bin_sizes = [pipeline_store.bin_size(filename)
+                     for filename in self.pipeline_files]
+        self._set_instance_variables(pipeline_data, bin_sizes=bin_sizes)
+        self.bins_loaded = [False] * len(self.start_velocities)
+
+    def _ensure_bin_loaded(self, idx):
+        if self.bins_loaded[idx]:
+            return
+        # planners sharing this pipeline may plan from the same (unloaded) bin concurrently
+        with self.load_lock:
+            if self.bins_loaded[idx]:
+                return
+            data_bin = self.helper.load_and_process_data(self.pipeline_files[idx],
+                                                         discard_lqr_controller_data=self.params.discard_LQR_controller_data,
+                                                         discard_precomputed_lqr_trajectories=self.params.discard_precomputed_lqr_trajectories,
+                                                         track_trajectory_acceleration=self.params.track_trajectory_acceleration)
+            for key in data_bin.keys():
+                getattr(self, key)[idx] = data_bin[key]
+            self.waypt_indices[idx] = WaypointIndex(self.waypt_configs[idx])
+            self.bins_loaded[idx] = True
+
+    def _set_instance_variables(self, data, bin_sizes=None):
         """Set the control pipelines instance variables from a data dictionary."""
+        if bin_sizes is None:
+            bin_sizes = [config.n for config in data['start_configs']]
+        # number of waypoints in every velocity bin
+        self.bin_sizes = bin_sizes
+        # whether or not the data of every velocity bin is in memory
+        self.bins_loaded = [True] * len(bin_sizes)
         self.start_configs = data['start_configs']
         self.waypt_configs = data['waypt_configs']
+        # k-d trees over the waypoints of every velocity bin, built when the bin is loaded (see _ensure_bin_loaded)
+        self.waypt_indices = [None if waypt_configs is None else WaypointIndex(waypt_configs)
+                              for waypt_configs in self.waypt_configs]
         self.start_speeds = data['start_speeds']
         self.spline_trajectories = data['spline_trajectories']
         self.horizons = data['horizons']
@@ -238,60 +433,31 @@ class ControlPipelineV0(ControlPipelineBase):
         self.K_nkfd = data['K_nkfd']
         self.k_nkf1 = data['k_nkf1']
 
-        # Initialize variable tensor for waypoints in world coordinates
-        dt = self.params.system_dynamics_params.dt
-        self.waypt_configs_world = [SystemConfig(
-            dt=dt, n=config.n, k=1, variable=True,
-            track_trajectory_acceleration=self.params.track_trajectory_acceleration) for config in data['start_configs']]
+        # The world coordinate buffers used when plan() is not given a workspace
+        self.workspace = self.new_workspace()
 
         self.instance_variables_loaded = True
 
         if self.params.verbose:
             N = self.params.waypoint_params.n
-            for v0, start_config in zip(self.start_velocities, self.start_configs):
-                print('Velocity: {:.3f}, {:.3f}% of goals kept({:d}).'.format(v0, 100. * start_config.n / N,
-                                                                              start_config.n))
+            for v0, n in zip(self.start_velocities, bin_sizes):
+                print('Velocity: {:.3f}, {:.3f}% of goals kept({:d}).'.format(v0, 100. * n / N, n))
 
-    def _ensure_world_coordinate_tensors_exist(self, goal_config=None):
+    def _ensure_world_coordinate_tensors_exist(self, workspace, idx, goal_config=None):
         """
-        Creates tensors to hold lqr and spline trajectories as well as lqr feedback matrices in world coordinates.
+        Creates the tensors of workspace that hold the lqr trajectories of the velocity bin idx in world
+        coordinates. If goal_config is given only the tensors for planning to a single waypoint are created.
         """
-        def _need_to_instantiate_tensors():
-            """
-            Check whether placeholders for lqr and spline trajectories in the world coordiante frame have been
-            instantiated. If they haven't been, or they are the wrong dimension then re-instantiate them.
-            """
-            if not (hasattr(self, 'trajectories_world') and hasattr(self, 'spline_trajectories_world')):
-                return True
-
-            if goal_config is None:
-                return not (len(self.trajectories_world) == len(self.start_configs))
-
-            return not (len(self.trajectories_world) == 1)
-
-        dt = self.params.system_dynamics_params.dt
-        if _need_to_instantiate_tensors():
-            if goal_config is None:
-                self.trajectories_world = [Trajectory(dt=dt, n=config.n, k=self.params.planning_horizon, variable=True,
-                                                      track_trajectory_acceleration=self.params.track_trajectory_acceleration)
-                                           for config in self.start_configs]
-                # There usually is not enough memory to instantiate a placeholder for both the lqr and spline
-                # trajectories in the world frame
-                self.spline_trajectories_world = self.spline_trajectories
-                if self.params.convert_K_to_world_coordinates:
-                    self.Ks_world_nkfd = [
-                        np.zeros_like(K) for K in self.K_nkfd]
-            else:
-                self.trajectories_world = [Trajectory(dt=dt, n=goal_config.n,
-                                                      k=self.params.planning_horizon,
-                                                      variable=True,
-                                                      track_trajectory_acceleration=self.params.track_trajectory_acceleration)]
-                self.spline_trajectories_world = [Trajectory(dt=dt, n=goal_config.n,
-                                                             k=self.params.planning_horizon,
-                                                             variable=True,
-                                                             track_trajectory_acceleration=self.params.track_trajectory_acceleration)]
-                if self.params.convert_K_to_world_coordinates:
-                    self.Ks_world_nkfd = [np.zeros_like(self.K_nkfd[0][0:1])]
+        p = self.params
+        dt = p.system_dynamics_params.dt
+        if goal_config is None:
+            if workspace.trajectories_world[idx] is None:
+                workspace.trajectories_world[idx] = Trajectory(dt=dt, n=self.bin_sizes[idx], k=p.planning_horizon,
+                                                               variable=True,
+                                                               track_trajectory_acceleration=p.track_trajectory_acceleration)
+        elif workspace.trajectory_world is None:
+            workspace.trajectory_world = Trajectory(dt=dt, n=goal_config.n, k=p.planning_horizon, variable=True,
+                                                    track_trajectory_acceleration=p.track_trajectory_acceleration)
 
     def _rebin_data_by_initial_velocity(self, data):
         """Take incorrecly binned data and rebins it according to the dynamically feasible initial velocity of
@@ -349,7 +515,7 @@ class ControlPipelineV0(ControlPipelineBase):
         bin_idxs = np.argmin(diff, axis=1)
         return bin_idxs
 
-    def valid_file_names(self, file_format='.pkl'):
+    def valid_file_names(self, file_format=None):
         filenames = []
         for v0 in self.start_velocities:
             filenames.append(self._data_file_name(
@@ -359,7 +525,7 @@ class ControlPipelineV0(ControlPipelineBase):
     def _save_incorrectly_binned_data(self, data):
         data_to_save = self.helper.prepare_data_for_saving(data, idx=0)
         filename = self._data_file_name(incorrectly_binned=True)
-        self.save_control_pipeline(data_to_save, filename)
+        self.save_control_pipeline(data_to_save, filename, self.file_format())
 
     def _load_incorrectly_binned_data(self):
         filename = self._data_file_name(incorrectly_binned=True)
@@ -372,10 +538,13 @@ class ControlPipelineV0(ControlPipelineBase):
         filename = self._data_file_name(incorrectly_binned=True)
         return os.path.isfile(filename)
 
-    def _data_file_name(self, file_format='.pkl', v0=None, incorrectly_binned=True):
-        """Returns the unique file name given either a starting velocity or incorrectly binned=True."""
+    def _data_file_name(self, file_format=None, v0=None, incorrectly_binned=True, initial_bin=False):
+        """Returns the unique file name given either a starting velocity or incorrectly binned=True. With initial_bin
+        the file name of the (not yet rebinned) data generated from the starting velocity v0 is returned."""
         # One of these must be True
         assert(v0 is not None or incorrectly_binned)
+        if file_format is None:
+            file_format = self.file_format()
 
         p = self.params
         base_dir = os.path.join(p.dir, 'control_pipeline_v0')
@@ -394,7 +563,9 @@ class ControlPipelineV0(ControlPipelineBase):
 
         utils.mkdir_if_missing(base_dir)
 
-        if v0 is not None:
+        if v0 is not None and initial_bin:
+            filename = 'initial_velocity_{:.3f}{:s}'.format(v0, file_format)
+        elif v0 is not None:
             filename = 'velocity_{:.3f}{:s}'.format(v0, file_format)
         elif incorrectly_binned:
             filename = 'incorrectly_binned{:s}'.format(file_format)
@@ -427,3 +598,33 @@ class ControlPipelineV0(ControlPipelineBase):
         wx_n11, wy_n11, wtheta_n11 = p.spline_params.spline.ensure_goals_valid(
             0.0, 0.0, wx_n11, wy_n11, wtheta_n11, epsilon=p.spline_params.epsilon)
         return [wx_n11, wy_n11, wtheta_n11, wv_n11, ww_n11]
+
+
+class ControlPipelineV0Workspace(object):
+    """
+    The world coordinate buffers that ControlPipelineV0.plan writes to. The precomputed pipeline data itself is
+    read-only, so many planners can share a single pipeline as long as each plans with its own workspace.
+    """
+
+    def __init__(self, num_bins):
+        # the lqr trajectories of every velocity bin in world coordinates, created the first time the bin is
+        # planned from
+        self.trajectories_world = [None] * num_bins
+        # the lqr trajectory when planning to a single waypoint
+        self.trajectory_world = None
+
+
+"""BEGIN generation worker utils"""
+
+# the control pipeline of every generation worker process, see _generate_initial_bins
+_worker_pipeline = None
+
+
+def _init_generation_worker(params):
+    global _worker_pipeline
+    _worker_pipeline = ControlPipelineV0(params)
+    _worker_pipeline._init_pipeline()
+
+
+def _generate_initial_bin_in_worker(v0):
+    return _worker_pipeline._generate_initial_bin(v0)
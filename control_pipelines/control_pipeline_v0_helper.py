@@ -1,8 +1,10 @@
 import pickle
 from trajectory.trajectory import Trajectory, SystemConfig
+from utils.precision import get_float_dtype
 import numpy as np
 import os
 from utils.angle_utils import angle_normalize
+from control_pipelines import pipeline_store
 
 
 class ControlPipelineV0Helper:
@@ -15,10 +17,10 @@ class ControlPipelineV0Helper:
         the closest (in wrapped l2 distance) precomputed waypoint."""
         # TODO: Potentially add linear and angular velocity here
         broadcasted_goal = np.ones(shape=waypt_configs.position_nk2().shape,
-                                   dtype=np.float32) * desired_waypt_config.position_nk2()[0]
+                                   dtype=get_float_dtype()) * desired_waypt_config.position_nk2()[0]
         diff_pos_nk2 = broadcasted_goal - waypt_configs.position_nk2()
         broadcasted_goal_angle = np.ones(shape=waypt_configs.heading_nk1().shape,
-                                         dtype=np.float32) * desired_waypt_config.heading_nk1()[0]
+                                         dtype=get_float_dtype()) * desired_waypt_config.heading_nk1()[0]
         diff_heading_nk1 = angle_normalize(broadcasted_goal_angle -
                                            waypt_configs.heading_nk1())
         # if(obstacle_map is not None):
@@ -57,7 +59,12 @@ class ControlPipelineV0Helper:
     def load_and_process_data(self, filename, discard_lqr_controller_data=False,
                               discard_precomputed_lqr_trajectories=False,
                               track_trajectory_acceleration=False):
-        """Load control pipeline data from a pickle file and process it so that it can be used by the pipeline."""
+        """Load control pipeline data from a pickle file (or the memory-mapped store) and process it so that it can
+        be used by the pipeline."""
+        if filename.endswith(pipeline_store.MANIFEST_FORMAT):
+            return self.load_and_process_mmap_data(filename, discard_lqr_controller_data,
+                                                   discard_precomputed_lqr_trajectories,
+                                                   track_trajectory_acceleration)
         if not os.path.exists(filename):
             # create the 'incorrectly_binned.pkl' if not there
             os.mknod(filename)
@@ -97,8 +104,8 @@ class ControlPipelineV0Helper:
             n = data['spline_trajectories']['n']
         if discard_lqr_controller_data:
             spline_trajectories = Trajectory(dt=dt, n=n, k=0)
-            K_nkfd = np.zeros((2, 1, 1, 1), dtype=np.float32)
-            k_nkf1 = np.zeros((2, 1, 1, 1), dtype=np.float32)
+            K_nkfd = np.zeros((2, 1, 1, 1), dtype=get_float_dtype())
+            k_nkf1 = np.zeros((2, 1, 1, 1), dtype=get_float_dtype())
         else:
             spline_trajectories = create_traj_if_not_already(data['spline_trajectories'],
                                                              track_trajectory_acceleration)
@@ -125,6 +132,43 @@ class ControlPipelineV0Helper:
                           'k_nkf1': k_nkf1}
         return data_processed
 
+    def load_and_process_mmap_data(self, filename, discard_lqr_controller_data=False,
+                                   discard_precomputed_lqr_trajectories=False,
+                                   track_trajectory_acceleration=False):
+        """Load control pipeline data from the memory-mapped store. The Trajectory and SystemConfig objects are built
+        directly on top of the (read-only) memory-mapped arrays so no data is copied into this process."""
+        data = pipeline_store.load_data_bin(filename)
+
+        def create_from_store(key):
+            obj_type, numpy_repr = data[key]
+            t = SystemConfig if obj_type == 'SystemConfig' else Trajectory
+            return t.init_from_numpy_repr(track_trajectory_acceleration=track_trajectory_acceleration,
+                                          direct_init=True, **numpy_repr)
+
+        dt = data['lqr_trajectories'][1]['dt']
+        if discard_precomputed_lqr_trajectories:
+            lqr_trajectories = Trajectory(dt=dt, n=data['lqr_trajectories'][1]['n'], k=0)
+        else:
+            lqr_trajectories = create_from_store('lqr_trajectories')
+        if discard_lqr_controller_data:
+            spline_trajectories = Trajectory(dt=dt, n=data['spline_trajectories'][1]['n'], k=0)
+            K_nkfd = np.zeros((2, 1, 1, 1), dtype=get_float_dtype())
+            k_nkf1 = np.zeros((2, 1, 1, 1), dtype=get_float_dtype())
+        else:
+            spline_trajectories = create_from_store('spline_trajectories')
+            K_nkfd = data['K_nkfd']
+            k_nkf1 = data['k_nkf1']
+
+        data_processed = {'start_speeds': data['start_speeds'],
+                          'start_configs': create_from_store('start_configs'),
+                          'waypt_configs': create_from_store('waypt_configs'),
+                          'spline_trajectories': spline_trajectories,
+                          'horizons': data['horizons'],
+                          'lqr_trajectories': lqr_trajectories,
+                          'K_nkfd': K_nkfd,
+                          'k_nkf1': k_nkf1}
+        return data_processed
+
     def gather_across_batch_dim(self, data, idxs):
         """ For each key in data gather idxs across the batch dimension creating a new data dictionary."""
         data_bin = {}
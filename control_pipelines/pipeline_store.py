@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import pickle
+import numpy as np
+
+"""
+A memory-mapped store for the control pipeline data. Every data bin (i.e. velocity bin) is
+saved as a small json manifest (e.g. velocity_0.000.json) next to a directory of raw .npy
+arrays (e.g. velocity_0.000/lqr_trajectories.position_nk2.npy). The arrays are opened with
+np.load(mmap_mode='r') so loading is near instant and all the processes using the same
+pipeline share the OS page cache instead of unpickling private copies.
+"""
+
+MANIFEST_FORMAT = '.json'
+STORE_VERSION = 1
+# the fields of a Trajectory/SystemConfig numpy representation (see Trajectory.to_numpy_repr)
+TRAJECTORY_SCALARS = ['dt', 'n', 'k']
+# the keys of the pipeline data holding Trajectory/SystemConfig objects
+OBJECT_TYPES = {'start_configs': 'SystemConfig',
+                'waypt_configs': 'SystemConfig',
+                'spline_trajectories': 'Trajectory',
+                'lqr_trajectories': 'Trajectory'}
+
+
+def _to_numpy_repr(elem):
+    """Returns the numpy representation (a dictionary) of a Trajectory/SystemConfig object
+    or of its already pickled dictionary/DotMap representation"""
+    if hasattr(elem, 'to_numpy_repr'):
+        return elem.to_numpy_repr()
+    if hasattr(elem, 'toDict'):  # DotMap
+        return elem.toDict()
+    return dict(elem)
+
+
+def array_dir_name(filename):
+    """The directory holding the arrays of the manifest filename"""
+    return os.path.splitext(filename)[0]
+
+
+def save_data_bin(data_bin, filename):
+    """Save a data bin (a dictionary of arrays, Trajectory and SystemConfig objects) as
+    raw .npy arrays plus a json manifest at filename."""
+    array_dir = array_dir_name(filename)
+    if not os.path.exists(array_dir):
+        os.makedirs(array_dir)
+    manifest = {'version': STORE_VERSION, 'entries': {}}
+    for key, elem in data_bin.items():
+        if key in OBJECT_TYPES:
+            repr = _to_numpy_repr(elem)
+            entry = {'type': OBJECT_TYPES[key], 'arrays': {},
+                     'scalars': {s: _to_scalar(repr[s]) for s in TRAJECTORY_SCALARS}}
+        else:
+            repr = {'array': np.asarray(elem)}
+            entry = {'type': 'array', 'arrays': {}}
+        for field, arr in repr.items():
+            if field in TRAJECTORY_SCALARS:
+                continue
+            arr = np.ascontiguousarray(arr)
+            array_file = '{:s}.{:s}.npy'.format(key, field)
+            np.save(os.path.join(array_dir, array_file), arr)
+            entry['arrays'][field] = {'file': array_file,
+                                      'shape': list(arr.shape),
+                                      'dtype': str(arr.dtype)}
+        manifest['entries'][key] = entry
+    # write the manifest last so a partially written bin is never considered valid
+    with open(filename, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def _to_scalar(x):
+    return np.asarray(x).item()
+
+
+def load_manifest(filename):
+    with open(filename, 'r') as f:
+        manifest = json.load(f)
+    assert(manifest['version'] == STORE_VERSION)
+    return manifest
+
+
+def bin_size(filename):
+    """Returns the number of waypoints (batch size) in a data bin without loading any arrays"""
+    manifest = load_manifest(filename)
+    return int(manifest['entries']['start_configs']['scalars']['n'])
+
+
+def load_data_bin(filename, mmap_mode='r'):
+    """Load the numpy representation of a data bin. Every key maps to either a (memory-mapped)
+    array or to a (type, numpy representation dictionary) tuple for Trajectory/SystemConfig objects."""
+    manifest = load_manifest(filename)
+    array_dir = array_dir_name(filename)
+    data = {}
+    for key, entry in manifest['entries'].items():
+        arrays = {}
+        for field, array_entry in entry['arrays'].items():
+            arrays[field] = np.load(os.path.join(array_dir, array_entry['file']),
+                                    mmap_mode=mmap_mode)
+        if entry['type'] == 'array':
+            data[key] = arrays['array']
+        else:
+            repr = dict(entry['scalars'])
+            repr.update(arrays)
+            data[key] = (entry['type'], repr)
+    return data
+
+
+def convert_pickle_file(pkl_filename, remove_pickle=False):
+    """Convert a pickled data bin to the memory-mapped store (saved next to it)"""
+    with open(pkl_filename, 'rb') as f:
+        data_bin = pickle.load(f)
+    filename = os.path.splitext(pkl_filename)[0] + MANIFEST_FORMAT
+    save_data_bin(data_bin, filename)
+    if remove_pickle:
+        os.remove(pkl_filename)
+    return filename
+
+
+def convert_pipeline_dir(pipeline_dir, remove_pickle=False, verbose=True):
+    """Convert every pickled data bin (recursively) under pipeline_dir to the memory-mapped store"""
+    converted = []
+    for root, _, files in os.walk(pipeline_dir):
+        for f in sorted(files):
+            if not f.endswith('.pkl'):
+                continue
+            pkl_filename = os.path.join(root, f)
+            if os.path.getsize(pkl_filename) == 0:
+                continue  # empty placeholder file
+            filename = convert_pickle_file(pkl_filename, remove_pickle)
+            converted.append(filename)
+            if verbose:
+                print("Converted {:s} -> {:s}".format(pkl_filename, filename))
+    return converted
+
+
+if __name__ == '__main__':
+    # usage: PYTHONPATH='.' python3 control_pipelines/pipeline_store.py [pipeline_dir] [--remove-pickle]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) > 0:
+        pipeline_dir = args[0]
+    else:
+        from params.central_params import create_control_pipeline_params
+        pipeline_dir = create_control_pipeline_params().dir
+    convert_pipeline_dir(pipeline_dir,
+                         remove_pickle='--remove-pickle' in sys.argv)
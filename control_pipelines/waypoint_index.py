@@ -0,0 +1,48 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from utils.angle_utils import angle_normalize
+
+
+class WaypointIndex(object):
+    """
+    A k-d tree over the (egocentric) waypoints of a velocity bin in [x, y, theta] space, where the distance between
+    headings is wrapped (i.e. the same distance as ControlPipelineV0Helper.compute_closest_waypt_idx).
+    """
+
+    def __init__(self, waypt_configs):
+        self.n = waypt_configs.n
+        pos_n2 = waypt_configs.position_nk2()[:, 0]
+        heading_n1 = angle_normalize(waypt_configs.heading_nk1()[:, 0])
+        # The waypoints are also added with their heading shifted by -2pi and 2pi so that the (unwrapped) closest
+        # points to a normalized heading are at the wrapped distance
+        points_n3 = np.concatenate([pos_n2, heading_n1], axis=1).astype(np.float64)
+        self.points_n3 = points_n3
+        points_3n3 = [points_n3 + np.array([0., 0., shift]) for shift in [0., -2. * np.pi, 2. * np.pi]]
+        self.tree = cKDTree(np.concatenate(points_3n3, axis=0))
+
+    def query(self, waypt_config, k=1):
+        """
+        Returns the indices of the k closest waypoints to waypt_config (with a batch size of 1), closest first, and
+        their distances.
+        """
+        k = min(k, self.n)
+        point_3 = np.array([waypt_config.position_nk2()[0, 0, 0], waypt_config.position_nk2()[0, 0, 1],
+                            angle_normalize(waypt_config.heading_nk1()[0, 0, 0])], dtype=np.float64)
+        # every waypoint is in the tree 3 times so the 3k closest points include k distinct waypoints
+        dists, idxs = self.tree.query(point_3, k=3 * k)
+        idxs = np.mod(np.atleast_1d(idxs), self.n)
+        _, first = np.unique(idxs, return_index=True)
+        first = np.sort(first)[:k]
+        return idxs[first], np.atleast_1d(dists)[first]
+
+    def query_radius(self, waypt_idxs, radius):
+        """
+        Returns the (sorted) indices of all the waypoints within radius of any of the waypoints at waypt_idxs
+        (including themselves).
+        """
+        waypt_idxs = np.atleast_1d(np.asarray(waypt_idxs, dtype=np.int64))
+        near_n = np.zeros(self.n, dtype=bool)
+        near_n[waypt_idxs] = True
+        for idxs in self.tree.query_ball_point(self.points_n3[waypt_idxs], r=radius):
+            near_n[np.mod(np.asarray(idxs, dtype=np.int64), self.n)] = True
+        return np.where(near_n)[0]
@@ -1,5 +1,6 @@
 from costs.cost import DiscreteCost
 from utils.angle_utils import angle_normalize
+from utils.precision import as_float
 import numpy as np
 
 
@@ -39,8 +40,8 @@ class QuadraticRegulatorRef(DiscreteCost):
 
         x_dim, u_dim = self._x_dim, self._u_dim
 
-        C_gg = np.diag(p.quad_coeffs)
-        c_g = np.array(p.linear_coeffs, dtype=np.float32)
+        C_gg = np.diag(as_float(p.quad_coeffs))
+        c_g = as_float(p.linear_coeffs)
         # Check dimensions
         assert ((np.all(
             np.equal(C_gg[:x_dim, x_dim:], np.transpose(C_gg[x_dim:, :x_dim])))))
@@ -6,6 +6,7 @@ from utils.utils import *
 from params.central_params import create_joystick_params, get_path_to_socnav, create_robot_params, get_seed
 from simulators.sim_state import SimState
 from simulators.episode import Episode
+from joystick_py.joystick_logger import AgentLogWriter
 
 
 # seed the random number generator
@@ -36,29 +37,33 @@ class JoystickBase():
         # flipped bc joystick-recv = robot-send & vice versa
         self.send_ID = create_robot_params().recv_ID
         self.recv_ID = create_robot_params().send_ID
+        # unique id of the session hosted by a simulator server (if any)
+        self.session_id = None
+        if self.joystick_params.use_server:
+            self.init_session()
         print("Initiated joystick locally (AF_UNIX) at \"%s\" & \"%s\"" %
               (self.send_ID, self.recv_ID))
         # potentially add more fields based off the params
         self.param_based_init()
 
     def param_based_init(self):
-        # data tracking with pandas
+        # data tracking with an append-only (csv) log
         if self.joystick_params.write_pandas_log:
-            import pandas as pd
-            global pd
-            self.pd_df = None    # pandas dataframe for writing to a csv
-            self.agent_log = {}  # log of all the agents as updated by sensing
+            # (append-only) log of all the agents as updated by sensing
+            self.agent_logger = None
+            self.dirname = None
 
-        # keeping an explicit log of every sim_state indexed by time
+        # keeping a (bounded) log of the latest sim_states indexed by time
         if self.joystick_params.track_sim_states:
-            self.sim_states = {}  # log of simulator states indexed by time
+            from simulators.sim_state import SimStateHistory
+            self.sim_states = \
+                SimStateHistory(window=self.joystick_params.sim_states_window)
 
         # tracking velocity and acceleration of the agents from the sim states
         if self.joystick_params.track_vel_accel:
-            global velocities
-            from simulators.sim_state import compute_all_velocities as velocities
-            global accelerations
-            from simulators.sim_state import compute_all_accelerations as accelerations
+            from simulators.sim_state import AgentKinematicsTracker
+            self.kinematics_tracker = \
+                AgentKinematicsTracker(window=self.joystick_params.vel_accel_window)
             self.velocities = {}     # velocities of all agents as sensed by the joystick
             self.accelerations = {}  # accelerations of all agents as sensed by the joystick
 
@@ -201,6 +206,8 @@ class JoystickBase():
             print("\npowering off joystick, robot terminated with: %s%s%s" %
                   (term_color, term_status, color_reset))
             self.joystick_on = False
+            if self.joystick_params.write_pandas_log:
+                self.close_logs()
             return False  # robot is off, do not continue
         else:
             self.sim_state_now = SimState.from_json(sim_state_json)
@@ -217,16 +224,21 @@ class JoystickBase():
                    self.current_ep.get_time_budget()),
                   sep=' ', end="", flush=True)
 
-            # self.track_vel_accel(self.sim_state_now)  # TODO: remove
+            # update the velocities & accelerations from the newest sim_state
+            if self.joystick_params.track_vel_accel:
+                self.track_vel_accel(self.sim_state_now)
 
             if self.joystick_params.write_pandas_log:
                 # used for file IO such as pandas logging
                 # NOTE: this MUST match the directory name in Simulator
-                self.dirname = 'tests/socnav/' + "test_" + self.algorithm_name + "/" +\
+                dirname = 'tests/socnav/' + "test_" + \
+                    session_name(self.algorithm_name, self.session_id) + "/" + \
                     self.current_ep.get_name() + "/joystick_data"
-                # Write the Agent's trajectory data into a pandas file
+                if self.agent_logger is None or dirname != self.dirname:
+                    self.dirname = dirname
+                    self.init_logs()
+                # Append the Agent's trajectory data to the log
                 self.update_logs(self.sim_state_now)
-                self.write_pandas()
         return True
 
     def update_knowledge_from_episode(self, current_world, init_ep: bool = False):
@@ -261,43 +273,50 @@ class JoystickBase():
 
     def track_vel_accel(self, current_world):
         assert(self.joystick_params.track_vel_accel)
-        # TODO: ensure the sim_states are sorted by their time, so that traversing
-        # the hash map maintains relative order of when they entered
-        sim_state_list = list(self.sim_states.values())
-        sim_t = current_world.get_sim_t()
-        self.velocities[sim_t] = velocities(sim_state_list)
-        self.accelerations[sim_t] = accelerations(sim_state_list)
+        # only the newest sim_state is needed, the past is kept in the tracker
+        self.kinematics_tracker.update(current_world)
+        # latest velocities & accelerations of all agents, keyed by name
+        self.velocities = self.kinematics_tracker.get_velocities()
+        self.accelerations = self.kinematics_tracker.get_accelerations()
+
+    """ BEGIN LOG UTILS """
 
-    """ BEGIN PANDAS UTILS """
+    def init_logs(self):
+        assert self.joystick_params.write_pandas_log
+        # close the log of the last episode (if any)
+        self.close_logs()
+        abs_path = \
+            os.path.join(get_path_to_socnav(), self.dirname, 'agent_data.csv')
+        self.agent_logger = \
+            AgentLogWriter(abs_path,
+                           flush_interval_s=self.joystick_params.log_flush_interval_s)
+
+    def close_logs(self):
+        if self.agent_logger is not None:
+            self.agent_logger.close()
+            if self.joystick_params.verbose:
+                print("%sWrote %d rows to the agent log%s" %
+                      (color_green, self.agent_logger.num_rows, color_reset))
+            self.agent_logger = None
 
     def update_logs(self, world_state: SimState):
-        self.update_log_of_type('robots', world_state)
-        self.update_log_of_type('gen_agents', world_state)
-        self.update_log_of_type('prerecs', world_state)
+        rows = []
+        rows.extend(self.log_rows_of_type('robots', world_state))
+        rows.extend(self.log_rows_of_type('gen_agents', world_state))
+        rows.extend(self.log_rows_of_type('prerecs', world_state))
+        self.agent_logger.log(rows)
 
-    def update_log_of_type(self, agent_type: str, world_state: SimState):
+    def log_rows_of_type(self, agent_type: str, world_state: SimState):
         from simulators.sim_state import get_agents_from_type
         agents_of_type = get_agents_from_type(world_state, agent_type)
+        sim_t = world_state.get_sim_t()
+        rows = []
         for a in agents_of_type.keys():
-            if a not in self.agent_log.keys():
-                # initialize dict for a specific agent if dosent already exist
-                self.agent_log[a] = {}
-            self.agent_log[a][world_state.get_sim_t()] = \
-                agents_of_type[a].get_current_config().to_3D_numpy()
-
-    def write_pandas(self):
-        assert self.joystick_params.write_pandas_log
-        pd_df = pd.DataFrame(self.agent_log)
-        abs_path = \
-            os.path.join(get_path_to_socnav(), self.dirname, 'agent_data.csv')
-        if not os.path.exists(abs_path):
-            touch(abs_path)  # Just as the bash command
-        pd_df.to_csv(abs_path)
-        if self.joystick_params.verbose:
-            print("%sUpdated pandas dataframe%s" %
-                  (color_green, color_reset))
+            pos3 = agents_of_type[a].get_current_config().to_3D_numpy()
+            rows.append([sim_t, a, pos3[0], pos3[1], pos3[2]])
+        return rows
 
-    """ END PANDAS UTILS """
+    """ END LOG UTILS """
 
     """ BEGIN SOCKET UTILS """
 
@@ -327,17 +346,44 @@ class JoystickBase():
         if self.joystick_params.print_data:
             print("sent", message)
 
-    def init_send_conn(self):
-        """Creates the initial handshake between the joystick and the robot to
-        have a communication channel with the external robot process """
-        self.robot_sender_socket = \
-            socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    def init_session(self):
+        """Requests a session from a running simulator server, which gives the
+        joystick its own (isolated) socket identifiers"""
+        server_ID = create_robot_params().server_ID
         try:
-            self.robot_sender_socket.connect(self.send_ID)
+            session = request_session(server_ID, "session: " + self.algorithm_name)
         except:
-            print("%sUnable to connect to robot%s" % (color_red, color_reset))
-            print("Make sure you have a simulation instance running")
+            print("%sUnable to connect to simulator server%s" %
+                  (color_red, color_reset))
+            print("Make sure you have a simulator server instance running")
             exit(1)
+        self.session_id = session['session_id']
+        # flipped bc joystick-recv = robot-send & vice versa
+        self.send_ID = session['recv_ID']
+        self.recv_ID = session['send_ID']
+        print("Joined session %s at \"%s\" & \"%s\"" %
+              (self.session_id, self.send_ID, self.recv_ID))
+
+    def init_send_conn(self):
+        """Creates the initial handshake between the joystick and the robot to
+        have a communication channel with the external robot process """
+        # a queued session waits (up to session_timeout_s) for a free worker of the server
+        wait_until = time.time() + self.joystick_params.session_timeout_s
+        while True:
+            self.robot_sender_socket = \
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.robot_sender_socket.connect(self.send_ID)
+                break
+            except:
+                self.robot_sender_socket.close()
+                if self.session_id is None or time.time() > wait_until:
+                    print("%sUnable to connect to robot%s" %
+                          (color_red, color_reset))
+                    print("Make sure you have a simulation instance running")
+                    exit(1)
+                # the session is queued until the server has a free worker
+                time.sleep(0.1)
         print("%sRobot <-- Joystick (sender) connection established%s" %
               (color_green, color_reset))
         assert(self.robot_sender_socket)
@@ -0,0 +1,72 @@
+import os
+import csv
+import time
+import threading
+from queue import Queue, Empty
+from utils.utils import touch
+
+
+class AgentLogWriter(object):
+    """Append-only log of the agents' positions as sensed by the joystick.
+    Rows are buffered and appended to the csv file in batches by a background
+    writer thread, so logging never blocks the joystick's sense-plan-act loop
+    and the cost per sensed SimState stays constant over an episode."""
+
+    columns = ['sim_t', 'agent', 'x', 'y', 'theta']
+
+    def __init__(self, abs_path: str, flush_interval_s: float = 1.0,
+                 flush_rows: int = 1000):
+        """
+        Args:
+            abs_path (str): the csv file to (over)write with the log
+            flush_interval_s (float, optional): maximum time rows are buffered. Defaults to 1.0.
+            flush_rows (int, optional): number of buffered rows that triggers a write. Defaults to 1000.
+        """
+        self.abs_path = abs_path
+        self.flush_interval_s = flush_interval_s
+        self.flush_rows = flush_rows
+        if not os.path.exists(abs_path):
+            touch(abs_path)  # Just as the bash command
+        # start a fresh log (with a header) for every episode
+        with open(abs_path, 'w', newline='') as f:
+            csv.writer(f).writerow(self.columns)
+        self.num_rows = 0
+        self.row_queue = Queue()
+        self.writer_thread = threading.Thread(target=self._write_loop,
+                                              daemon=True)
+        self.writer_thread.start()
+
+    def log(self, rows: list):
+        """Queue rows of (sim_t, agent, x, y, theta) to be written"""
+        if len(rows) > 0:
+            self.row_queue.put(rows)
+
+    def close(self):
+        """Write all the remaining rows and join the writer thread"""
+        self.row_queue.put(None)
+        self.writer_thread.join()
+
+    def _write_loop(self):
+        buffer = []
+        last_flush_t = time.time()
+        while True:
+            try:
+                rows = self.row_queue.get(timeout=self.flush_interval_s)
+            except Empty:
+                rows = []
+            if rows is None:  # closing
+                break
+            buffer.extend(rows)
+            if len(buffer) >= self.flush_rows or \
+                    time.time() - last_flush_t >= self.flush_interval_s:
+                self._flush(buffer)
+                buffer = []
+                last_flush_t = time.time()
+        self._flush(buffer)
+
+    def _flush(self, buffer: list):
+        if len(buffer) == 0:
+            return
+        with open(self.abs_path, 'a', newline='') as f:
+            csv.writer(f).writerows(buffer)
+        self.num_rows += len(buffer)
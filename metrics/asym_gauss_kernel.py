@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class AsymGaussKernel(object):
+    """
+    The asymmetric gaussians of cost_functions.asym_gauss centered around a set of (m) agents, with the per agent
+    terms (the rotation of the heading and the variances) computed once so that large sets of points can be evaluated
+    in a single fused pass.
+
+    In the frame of an agent (u along its heading, v to its sides) the gaussian is
+        exp(-(u^2 / (2 sigma^2) + v^2 / (2 sig_s^2)))
+    where sigma = sig_theta in front of the agent (u > 0), sig_theta / 3 behind it and sig_s = sig_theta / 4, which
+    is the same as the rotated a, b, c coefficients of asym_gauss without any arctan2 or per point sigma selection.
+
+    Optionally exp is approximated with a lookup table (linearly interpolated) whose absolute error is bounded by
+    lut_max_error.
+    """
+    # constants of u^2 and v^2 in the exponent (in units of 1 / sig_theta^2)
+    front_coeff = 0.5
+    rear_coeff = 4.5
+    side_coeff = 8.
+
+    # lookup tables of exp(-z) shared by all the kernels, indexed by (size, z_max, dtype)
+    _exp_luts = {}
+
+    def __init__(self, pos_m3, sig_theta_m=None, dtype=np.float64, lut_size=None, lut_z_max=16.):
+        """
+        pos_m3: [x, y, theta] of the centers of the gaussians
+        sig_theta_m: the variance in the direction of motion of every agent, if None it has to be given at every
+        evaluation (i.e. per point)
+        lut_size: number of intervals of the exp lookup table (None uses np.exp)
+        """
+        self.dtype = np.dtype(dtype)
+        pos_m3 = np.asarray(pos_m3, dtype=np.float64).reshape((-1, 3))
+        self.m = pos_m3.shape[0]
+        self.xc_m = pos_m3[:, 0].astype(self.dtype)
+        self.yc_m = pos_m3[:, 1].astype(self.dtype)
+        self.cos_m = np.cos(pos_m3[:, 2]).astype(self.dtype)
+        self.sin_m = np.sin(pos_m3[:, 2]).astype(self.dtype)
+        self.inv_sig2_m = None
+        if sig_theta_m is not None:
+            sig_theta_m = np.broadcast_to(np.asarray(sig_theta_m, dtype=np.float64), (self.m,))
+            self.inv_sig2_m = (1. / sig_theta_m ** 2).astype(self.dtype)
+
+        self.lut = None
+        if lut_size is not None:
+            self.lut = AsymGaussKernel._exp_lut(lut_size, lut_z_max, self.dtype)
+            step = lut_z_max / lut_size
+            # interpolation error of exp(-z) on [0, z_max] and the cut off beyond z_max
+            self.lut_max_error = step ** 2 / 8. + np.exp(-lut_z_max)
+
+    @classmethod
+    def _exp_lut(cls, size, z_max, dtype):
+        key = (size, z_max, dtype)
+        if key not in cls._exp_luts:
+            z = np.linspace(0., z_max, size + 1)
+            table = np.exp(-z)
+            # beyond z_max the gaussian is cut off to 0
+            table[-1] = 0.
+            slope = np.append(np.diff(table), 0.)
+            cls._exp_luts[key] = (table.astype(dtype), slope.astype(dtype), dtype.type(size / z_max), size)
+        return cls._exp_luts[key]
+
+    def _exp_neg(self, z):
+        """exp(-z) for z >= 0, overwriting z"""
+        if self.lut is None:
+            return np.exp(np.negative(z, out=z), out=z)
+        table, slope, inv_step, size = self.lut
+        np.multiply(z, inv_step, out=z)
+        np.minimum(z, size, out=z)
+        idx = z.astype(np.intp)
+        z -= idx
+        return table[idx] + z * slope[idx]
+
+    def _evaluate(self, x, y, xc, yc, cos, sin, inv_sig2):
+        dx = np.subtract(x, xc, dtype=self.dtype)
+        dy = np.subtract(y, yc, dtype=self.dtype)
+        u = cos * dx + sin * dy
+        v = cos * dy
+        v -= sin * dx
+        coeff = np.where(u > 0, self.dtype.type(self.front_coeff), self.dtype.type(self.rear_coeff))
+        z = u
+        z *= u
+        z *= coeff
+        v *= v
+        v *= self.dtype.type(self.side_coeff)
+        z += v
+        z *= inv_sig2
+        return self._exp_neg(z)
+
+    def _inv_sig2(self, sig_theta, agent_idxs=None):
+        if sig_theta is None:
+            assert(self.inv_sig2_m is not None)
+            return self.inv_sig2_m if agent_idxs is None else self.inv_sig2_m[agent_idxs]
+        sig_theta = np.asarray(sig_theta, dtype=self.dtype)
+        return 1. / (sig_theta * sig_theta)
+
+    def evaluate(self, x, y, sig_theta=None):
+        """
+        The gaussian of every agent at every point (x, y) (of any but equal shapes), in an array of shape
+        x.shape + (m,). sig_theta (if given) is broadcast to that shape.
+        """
+        x, y = np.asarray(x)[..., None], np.asarray(y)[..., None]
+        return self._evaluate(x, y, self.xc_m, self.yc_m, self.cos_m, self.sin_m, self._inv_sig2(sig_theta))
+
+    def evaluate_sum(self, x, y, sig_theta=None):
+        """The sum over all the agents of the gaussians at every point (x, y)"""
+        if self.m == 0:
+            return np.zeros(np.shape(x), dtype=self.dtype)
+        return np.sum(self.evaluate(x, y, sig_theta=sig_theta), axis=-1)
+
+    def evaluate_pairs(self, x_p, y_p, agent_idxs_p, sig_theta=None):
+        """The gaussian of agent agent_idxs_p[i] at the point (x_p[i], y_p[i]) for every pair i"""
+        return self._evaluate(x_p, y_p, self.xc_m[agent_idxs_p], self.yc_m[agent_idxs_p], self.cos_m[agent_idxs_p],
+                              self.sin_m[agent_idxs_p], self._inv_sig2(sig_theta, agent_idxs_p))
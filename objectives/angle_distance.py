@@ -1,13 +1,15 @@
 import numpy as np
 
 from utils.angle_utils import angle_normalize
-from objectives.objective_function import Objective
+from objectives.objective_function import Objective, stack_objective_params
+from utils.voxel_map_utils import compute_voxel_functions
 
 
 class AngleDistance(Objective):
     """
     Compute the angular distance to the optimal path.
     """
+    pointwise = True
 
     def __init__(self, params, fmm_map):
         self.p = params
@@ -20,6 +22,27 @@ class AngleDistance(Objective):
     def evaluate_objective(self, trajectory):
         optimal_angular_orientation_nk = self.fmm_map.fmm_angle_map.compute_voxel_function(
             trajectory.position_nk2())
+        return self.evaluate_objective_from_voxels(trajectory, optimal_angular_orientation_nk[:, :, None])
+
+    def voxel_maps(self):
+        return [self.fmm_map.fmm_angle_map]
+
+    def evaluate_objective_from_voxels(self, trajectory, voxel_values_nkc):
+        optimal_angular_orientation_nk = voxel_values_nkc[:, :, 0]
         angular_dist_to_optimal_path_nk = angle_normalize(
             trajectory.heading_nk1()[:, :, 0] - optimal_angular_orientation_nk)
         return self.p.angle_cost * np.power(np.abs(angular_dist_to_optimal_path_nk), self.p.power)
+
+    @staticmethod
+    def evaluate_objective_batch(objectives, trajectory):
+        """Evaluate the objectives of many agents (each with their own fmm map) in one pass, see
+        ObjectiveFunction.evaluate_function_batch"""
+        m, k = len(objectives), trajectory.k
+        position_mnk2 = trajectory.position_nk2().reshape((m, -1, k, 2))
+        optimal_angular_orientation_mnk = compute_voxel_functions(
+            [o.fmm_map.fmm_angle_map for o in objectives], position_mnk2)
+        angular_dist_to_optimal_path_mnk = angle_normalize(
+            trajectory.heading_nk1().reshape((m, -1, k)) - optimal_angular_orientation_mnk)
+        angle_cost_m11, power_m11 = stack_objective_params(objectives, ['angle_cost', 'power'])
+        cost_mnk = angle_cost_m11 * np.power(np.abs(angular_dist_to_optimal_path_mnk), power_m11)
+        return cost_mnk.reshape((-1, k))
@@ -1,5 +1,6 @@
 import numpy as np
-from objectives.objective_function import Objective
+from objectives.objective_function import Objective, stack_objective_params
+from utils.voxel_map_utils import compute_voxel_functions
 
 
 class GoalDistance(Objective):
@@ -7,6 +8,7 @@ class GoalDistance(Objective):
     Define the goal reaching objective.
     """
     tag = 'goal_distance'
+    pointwise = True
 
     def __init__(self, params, fmm_map):
         self.p = params
@@ -19,5 +21,25 @@ class GoalDistance(Objective):
         return self.fmm_map.fmm_distance_map.compute_voxel_function(trajectory.position_nk2())
 
     def evaluate_objective(self, trajectory):
-        dist_to_goal_nk = self.compute_dist_to_goal_nk(trajectory)
+        return self.evaluate_objective_from_voxels(
+            trajectory, self.compute_dist_to_goal_nk(trajectory)[:, :, None])
+
+    def voxel_maps(self):
+        return [self.fmm_map.fmm_distance_map]
+
+    def evaluate_objective_from_voxels(self, trajectory, voxel_values_nkc):
+        dist_to_goal_nk = voxel_values_nkc[:, :, 0]
         return self.p.goal_cost * np.power(dist_to_goal_nk, self.p.power) - self.cost_at_margin
+
+    @staticmethod
+    def evaluate_objective_batch(objectives, trajectory):
+        """Evaluate the objectives of many agents (each with their own fmm map) in one pass, see
+        ObjectiveFunction.evaluate_function_batch"""
+        m, k = len(objectives), trajectory.k
+        position_mnk2 = trajectory.position_nk2().reshape((m, -1, k, 2))
+        dist_to_goal_mnk = compute_voxel_functions(
+            [o.fmm_map.fmm_distance_map for o in objectives], position_mnk2)
+        goal_cost_m11, power_m11 = stack_objective_params(objectives, ['goal_cost', 'power'])
+        cost_at_margin_m11 = np.array([o.cost_at_margin for o in objectives]).reshape((m, 1, 1))
+        cost_mnk = goal_cost_m11 * np.power(dist_to_goal_mnk, power_m11) - cost_at_margin_m11
+        return cost_mnk.reshape((-1, k))
@@ -1,12 +1,35 @@
 import numpy as np
 from simulators.sim_state import SimState
+from utils.voxel_map_utils import StackedVoxelMap
+from utils.precision import as_float, get_float_dtype
 # from objectives.personal_space_cost import PersonalSpaceCost
 
 
 class Objective(object):
+    # whether evaluate_objective also takes the sim_state_hist (i.e. depends on the other agents)
+    uses_sim_state_hist = False
+    # whether the value at every time step only depends on the trajectory at that time step, which lets the
+    # objective function evaluate it on the valid time steps only (see ObjectiveFunction.evaluate_function)
+    pointwise = False
+
     def evaluate_objective(self, trajectory):
         raise NotImplementedError
 
+    def voxel_maps(self):
+        """The voxel maps this objective looks up at the trajectory positions. The objective function looks up the
+        voxel maps of all its objectives together, see evaluate_objective_from_voxels."""
+        return []
+
+    def evaluate_objective_from_voxels(self, trajectory, voxel_values_nkc):
+        """Evaluate the objective given the values (n, k, c) of its c voxel_maps at the trajectory positions."""
+        raise NotImplementedError
+
+
+def stack_objective_params(objectives, keys):
+    """Returns the parameters keys of every objective (of many agents) as (m, 1, 1) arrays."""
+    return [as_float([o.p[key] for o in objectives]).reshape((-1, 1, 1))
+            for key in keys]
+
 
 class ObjectiveFunction(object):
     """
@@ -16,6 +39,8 @@ class ObjectiveFunction(object):
     def __init__(self, params):
         self.params = params
         self.objectives = []
+        # the voxel maps of the objectives stacked into one multi-channel grid (see _lookup_voxel_maps)
+        self.stacked_voxel_map = None
 
     def add_objective(self, objective):
         """
@@ -32,30 +57,87 @@ class ObjectiveFunction(object):
 
         objective_values_by_tag = []
 
-        for objective in self.objectives:
-            try:
-                obj_value = objective.evaluate_objective(trajectory)
-            # importing PersonalSpaceCost leads to circular dependency
-            # TODO: figure out a better way to do this
-            # maybe import here and then an isinstance?
-            except TypeError:
-                obj_value = objective.evaluate_objective(trajectory, sim_state_hist)
+        voxel_values = self._lookup_voxel_maps(trajectory)
+        for objective, voxel_values_nkc in zip(self.objectives, voxel_values):
+            if voxel_values_nkc is None:
+                obj_value = self._evaluate_objective(objective, trajectory, sim_state_hist)
+            else:
+                obj_value = objective.evaluate_objective_from_voxels(trajectory, voxel_values_nkc)
             objective_values_by_tag += [[objective.tag, obj_value]]
         return objective_values_by_tag
 
+    def _lookup_voxel_maps(self, trajectory):
+        """
+        Look up the voxel maps of all the objectives (i.e. the obstacle and goal fmm maps) at the trajectory
+        positions in one pass, so the voxel indices and interpolation weights are computed only once. Returns the
+        (n, k, c) values of the c voxel maps of every objective, or None for the objectives that are evaluated on
+        their own (when there is nothing to share or the maps are not on the same voxel grid).
+        """
+        voxel_maps_by_objective = [objective.voxel_maps() for objective in self.objectives]
+        voxel_maps = [voxel_map for maps in voxel_maps_by_objective for voxel_map in maps]
+        if len(voxel_maps) < 2:
+            return [None] * len(self.objectives)
+        stacked = self.stacked_voxel_map
+        if stacked is None or len(stacked.voxel_maps) != len(voxel_maps) or \
+                any(a is not b for a, b in zip(stacked.voxel_maps, voxel_maps)):
+            if not all(voxel_maps[0].has_same_grid(voxel_map) for voxel_map in voxel_maps):
+                return [None] * len(self.objectives)
+            stacked = self.stacked_voxel_map = StackedVoxelMap(voxel_maps)
+        values_nkc = stacked.compute_voxel_functions(trajectory.position_nk2())
+        voxel_values, c = [], 0
+        for maps in voxel_maps_by_objective:
+            voxel_values.append(None if len(maps) == 0 else values_nkc[:, :, c:c + len(maps)])
+            c += len(maps)
+        return voxel_values
+
+    @staticmethod
+    def _evaluate_objective(objective, trajectory, sim_state_hist=None):
+        if objective.uses_sim_state_hist:
+            return objective.evaluate_objective(trajectory, sim_state_hist)
+        return objective.evaluate_objective(trajectory)
+
     def evaluate_function(self, trajectory, sim_state_hist=None):
         """
         Evaluate the entire objective function corresponding to a system trajectory or traj+sim_state.
         sim_states are only relevant for personal_space cost functions
         """
-        objective_values_by_tag = self.evaluate_function_by_objective(
-            trajectory, sim_state_hist)
+        if self.params.packed_evaluation and self.params.obj_type == 'valid_mean' and \
+                all(objective.pointwise for objective in self.objectives):
+            objective_values_by_tag = self._evaluate_function_by_objective_packed(
+                trajectory, sim_state_hist)
+        else:
+            objective_values_by_tag = self.evaluate_function_by_objective(
+                trajectory, sim_state_hist)
         objective_function_values = 0.
         for tag, objective_values in objective_values_by_tag:
             objective_function_values += self._reduce_objective_values(
                 trajectory, objective_values)
         return objective_function_values
 
+    def _evaluate_function_by_objective_packed(self, trajectory, sim_state_hist=None):
+        """
+        Evaluate each (pointwise) objective only on the valid time steps of the trajectory, packed into a single
+        trajectory, so no map lookups are done on the padding past the valid horizons. The values are scattered
+        back to (n, k) with zeros past the valid horizons, which the valid_mean reduction masks out anyway, so the
+        objective function values are identical to evaluating the whole trajectory.
+        """
+        from trajectory.trajectory import Trajectory
+        valid_nk = trajectory.valid_mask_nk > 0.
+        num_valid = int(np.count_nonzero(valid_nk))
+        packed_trajectory = Trajectory(dt=trajectory.dt, n=1, k=num_valid,
+                                       position_nk2=trajectory.position_nk2()[valid_nk][None],
+                                       speed_nk1=trajectory.speed_nk1()[valid_nk][None],
+                                       heading_nk1=trajectory.heading_nk1()[valid_nk][None],
+                                       angular_speed_nk1=trajectory.angular_speed_nk1()[valid_nk][None],
+                                       direct_init=True, track_trajectory_acceleration=False)
+        packed_trajectory.update_valid_mask_nk()
+        objective_values_by_tag = []
+        for tag, packed_values in self.evaluate_function_by_objective(packed_trajectory, sim_state_hist):
+            objective_values_nk = np.zeros(valid_nk.shape, dtype=np.result_type(packed_values))
+            objective_values_nk[valid_nk] = np.broadcast_to(packed_values, (1, num_valid))[0]
+            objective_values_by_tag += [[tag, objective_values_nk]]
+        return objective_values_by_tag
+
     def _reduce_objective_values(self, trajectory, objective_values):
         """Reduce objective_values according to
         self.params.obj_type."""
@@ -68,3 +150,49 @@ class ObjectiveFunction(object):
         else:
             assert False
         return res
+
+    @staticmethod
+    def evaluate_function_batch(obj_fns, trajectory, sim_state_hists=None):
+        """
+        Evaluate the objective functions of many (m) agents in one pass. trajectory stacks the (n) trajectories of
+        every agent along the batch dimension, i.e. has a batch size of m * n, and the values are returned as a
+        (m * n) array. Every objective function must be made up of the same kinds of objectives (in the same order).
+        Objectives that implement evaluate_objective_batch are evaluated for every agent at once, the rest are
+        evaluated agent by agent.
+        """
+        m, k = len(obj_fns), trajectory.k
+        n = trajectory.n // m
+        if sim_state_hists is None:
+            sim_state_hists = [None] * m
+        objective_function_values = 0.
+        for j, objective in enumerate(obj_fns[0].objectives):
+            objectives = [obj_fn.objectives[j] for obj_fn in obj_fns]
+            assert(all(type(o) is type(objective) for o in objectives))
+            if hasattr(objective, 'evaluate_objective_batch'):
+                objective_values = objective.evaluate_objective_batch(objectives, trajectory)
+            else:
+                objective_values = np.zeros((m * n, k), dtype=get_float_dtype())
+                for i, agent_objective in enumerate(objectives):
+                    agent_trajectory = \
+                        ObjectiveFunction._agent_trajectory(trajectory, i * n, (i + 1) * n)
+                    # (broadcasts the values of objectives that do not depend on the waypoint)
+                    objective_values[i * n:(i + 1) * n] = \
+                        ObjectiveFunction._evaluate_objective(agent_objective, agent_trajectory,
+                                                              sim_state_hists[i])
+            objective_function_values += obj_fns[0]._reduce_objective_values(
+                trajectory, objective_values)
+        return objective_function_values
+
+    @staticmethod
+    def _agent_trajectory(trajectory, start, end):
+        """Returns the trajectories [start, end) of the batch as a new trajectory (without copying)."""
+        from trajectory.trajectory import Trajectory
+        agent_trajectory = Trajectory(dt=trajectory.dt, n=end - start, k=trajectory.k,
+                                      position_nk2=trajectory.position_nk2()[start:end],
+                                      speed_nk1=trajectory.speed_nk1()[start:end],
+                                      heading_nk1=trajectory.heading_nk1()[start:end],
+                                      angular_speed_nk1=trajectory.angular_speed_nk1()[start:end],
+                                      valid_horizons_n1=trajectory.valid_horizons_n1[start:end],
+                                      direct_init=True, track_trajectory_acceleration=False)
+        agent_trajectory.update_valid_mask_nk()
+        return agent_trajectory
@@ -1,6 +1,6 @@
 import numpy as np
 
-from objectives.objective_function import Objective
+from objectives.objective_function import Objective, stack_objective_params
 
 
 class ObstacleAvoidance(Objective):
@@ -9,6 +9,7 @@ class ObstacleAvoidance(Objective):
     obstacle than obstacle_margin1. Cost is normalized by a normalization factor ensuring
     the cost is 1 at obstacle_margin0.
     """
+    pointwise = True
 
     def __init__(self, params, obstacle_map):
         assert(params.obstacle_margin0 <= params.obstacle_margin1)
@@ -20,6 +21,35 @@ class ObstacleAvoidance(Objective):
     def evaluate_objective(self, trajectory):
         dist_to_obstacles_nk = self.obstacle_map.dist_to_nearest_obs(
             trajectory.position_nk2())
+        return self.evaluate_objective_from_voxels(trajectory, dist_to_obstacles_nk[:, :, None])
+
+    def voxel_maps(self):
+        # obstacle maps that do not interpolate a voxel map are looked up on their own
+        dist_voxel_map = self.obstacle_map.dist_voxel_map()
+        return [] if dist_voxel_map is None else [dist_voxel_map]
+
+    def evaluate_objective_from_voxels(self, trajectory, voxel_values_nkc):
+        dist_to_obstacles_nk = voxel_values_nkc[:, :, 0]
         infringement_nk = np.maximum(
             self.p.obstacle_margin1 - dist_to_obstacles_nk, 0)
         return self.p.obstacle_cost * np.power(infringement_nk / self.factor, self.p.power)
+
+    @staticmethod
+    def evaluate_objective_batch(objectives, trajectory):
+        """Evaluate the objectives of many agents in one pass, see ObjectiveFunction.evaluate_function_batch"""
+        m, k = len(objectives), trajectory.k
+        obstacle_map = objectives[0].obstacle_map
+        if all(o.obstacle_map is obstacle_map for o in objectives):
+            # the agents share the obstacle map of the environment
+            dist_to_obstacles_mnk = obstacle_map.dist_to_nearest_obs(
+                trajectory.position_nk2()).reshape((m, -1, k))
+        else:
+            position_mnk2 = trajectory.position_nk2().reshape((m, -1, k, 2))
+            dist_to_obstacles_mnk = np.stack([o.obstacle_map.dist_to_nearest_obs(position_mnk2[i])
+                                              for i, o in enumerate(objectives)])
+        margin1_m11, cost_m11, power_m11 = \
+            stack_objective_params(objectives, ['obstacle_margin1', 'obstacle_cost', 'power'])
+        factor_m11 = np.array([o.factor for o in objectives]).reshape((m, 1, 1))
+        infringement_mnk = np.maximum(margin1_m11 - dist_to_obstacles_mnk, 0)
+        cost_mnk = cost_m11 * np.power(infringement_mnk / factor_m11, power_m11)
+        return cost_mnk.reshape((-1, k))
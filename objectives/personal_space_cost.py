@@ -1,44 +1,74 @@
 # import numpy as np
+from scipy.spatial import cKDTree
 from objectives.objective_function import Objective
-from simulators.sim_state import SimState, get_all_agents
+from simulators.sim_state import SimState, SimStateHistory, get_all_agents
 from metrics.cost_functions import *
+from metrics.asym_gauss_kernel import AsymGaussKernel
+from utils.precision import get_float_dtype
 
 
 class PersonalSpaceCost(Objective):
     """
     Compute the cost of being in non ego gen_agents' path.
     """
+    uses_sim_state_hist = True
+    pointwise = True
 
     def __init__(self, params):
         self.p = params
         self.tag = 'personal_space_cost_per_nonego_agent'
+        # kernel of the latest agent positions (reused while they do not change)
+        self.kernel = None
+        self.kernel_pos_m3 = None
 
-    def evaluate_objective(self, trajectory, sim_state_hist: SimState):
+    def _kernel_for(self, agents_pos_m3):
+        if self.kernel is None or self.kernel_pos_m3 is not agents_pos_m3:
+            self.kernel = AsymGaussKernel(agents_pos_m3, dtype=self.p.get('kernel_dtype', None) or get_float_dtype(),
+                                          lut_size=self.p.get('kernel_lut_size', None))
+            self.kernel_pos_m3 = agents_pos_m3
+        return self.kernel
+
+    def evaluate_objective(self, trajectory, sim_state_hist):
         # get ego agent trajectory
-        ego_traj = trajectory.position_and_heading_nk3()
+        pos_nk2 = trajectory.position_nk2()
+        n, k = pos_nk2.shape[:2]
+        personal_space_cost_nk = np.zeros((n, k), dtype=get_float_dtype())
 
-        # get the last sim_state if it exists
-        if len(sim_state_hist) > 0:
-            sim_state = sim_state_hist[max(sim_state_hist.keys())]
+        if isinstance(sim_state_hist, SimStateHistory):
+            # the latest agent positions are already extracted by the history
+            if len(sim_state_hist) == 0:
+                return personal_space_cost_nk
+            agents_pos_m3 = sim_state_hist.get_agent_pos_m3()
         else:
-            return 0
-
-        # loop through each trajectory point
-        n, k, _ = ego_traj.shape
-        personal_space_cost = np.zeros((1, k))
-        for i in range(k):
-            ego_pos3 = ego_traj[0, i]  # (x,y,th)_self latest timestep
+            # get the last sim_state if it exists
+            if len(sim_state_hist) > 0:
+                sim_state = sim_state_hist[max(sim_state_hist.keys())]
+            else:
+                return personal_space_cost_nk
 
-            # iterate through every non ego agent
+            # every non ego agent
             agents = sim_state.get_all_agents() if isinstance(sim_state, SimState) else get_all_agents(sim_state)
+            agents_pos_m3 = np.array([agent_vals.get_pos3() for agent_vals in agents.values()]).reshape((-1, 3))
+        if len(agents_pos_m3) == 0:
+            return personal_space_cost_nk
 
-            for agent_name, agent_vals in agents.items():
-                agent_pos3 = agent_vals.get_pos3()  # (x,y,th)
-                theta = agent_pos3[2]
-                # gaussian centered around the non ego agent
-                # TODO actually account for velocity here
-                personal_space_cost[0, i] += asym_gauss_from_vel(x=ego_pos3[0], y=ego_pos3[1],
-                                           velx=np.cos(theta), vely=np.sin(theta),
-                                           xc=agent_pos3[0], yc=agent_pos3[1])
+        # gaussians centered around the non ego agents, at every point of every trajectory
+        # TODO actually account for velocity here (as in asym_gauss_from_vel the "speed" is that of the point)
+        kernel = self._kernel_for(agents_pos_m3)
+        cutoff_radius = self.p.get('cutoff_radius', None)
+        if cutoff_radius is None:
+            x_nk, y_nk = pos_nk2[:, :, 0], pos_nk2[:, :, 1]
+            sig_theta_nk1 = vel2sig(np.sqrt(x_nk ** 2 + y_nk ** 2))[:, :, None]
+            personal_space_cost_nk += kernel.evaluate_sum(x_nk, y_nk, sig_theta=sig_theta_nk1)
+        else:
+            # only the (agent, point) pairs within the cutoff radius of each other
+            pos_m2 = pos_nk2.reshape((-1, 2))
+            pairs = cKDTree(agents_pos_m3[:, :2]).sparse_distance_matrix(cKDTree(pos_m2), cutoff_radius,
+                                                                         output_type='ndarray')
+            agent_idxs, point_idxs = pairs['i'], pairs['j']
+            x_p, y_p = pos_m2[point_idxs, 0], pos_m2[point_idxs, 1]
+            values_p = kernel.evaluate_pairs(x_p, y_p, agent_idxs, sig_theta=vel2sig(np.sqrt(x_p ** 2 + y_p ** 2)))
+            personal_space_cost_nk += np.bincount(point_idxs, weights=values_p,
+                                                  minlength=n * k).reshape((n, k))
 
-        return self.p.psc_scale * personal_space_cost
+        return self.p.psc_scale * personal_space_cost_nk
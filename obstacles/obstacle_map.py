@@ -18,6 +18,13 @@ class ObstacleMap(object):
         """
         raise NotImplementedError
 
+    def dist_voxel_map(self):
+        """
+        Returns the voxel map that dist_to_nearest_obs interpolates, if
+        any (so it can be looked up together with other voxel maps).
+        """
+        return None
+
     def create_occupancy_grid_for_map(self, xs_nn, ys_nn):
         """
         Return an occupancy grid for the entire obstacle map where
@@ -78,6 +78,9 @@ class SBPDMap(ObstacleMap):
             pos_nk2)
         return distance_nk
 
+    def dist_voxel_map(self):
+        return self.fmm_map.fmm_distance_map
+
     def sample_point_112(self, rng, free_xy_map_m2=None):
         """
         Samples a real world x, y point in free space on the map.
@@ -1,5 +1,11 @@
+import math
 import numpy as np
 from utils.angle_utils import angle_normalize
+from utils.utils import color_yellow, color_reset
+try:
+    import numba
+except ImportError:
+    numba = None
 # Algorithms from Somil Init trajectory optimizer, variant of the classic LQR
 #######################################################################################################################
 # Steps for solving Trajectory Optimizer
@@ -26,14 +32,20 @@ class LQRSolver:
 
     """
 
-    def __init__(self, T, dynamics, cost):
+    def __init__(self, T, dynamics, cost, backend='numpy'):
         """
         T:              Length of horizon
         dynamics:       Discrete time plant dynamics, can be nonlinear
         cost:           instantaneous cost function
+        backend:        'numpy' to solve the Riccati recursion batched over n, or 'numba'
+                        for a jit compiled kernel (if numba is installed, else numpy is used)
         """
 
         self.T = T
+        if backend == 'numba' and _riccati_recursion_jit is None:
+            print('%sNumba is not installed, using the numpy LQR backend%s' %
+                  (color_yellow, color_reset))
+        self.backend = backend
         self.plant_dyn = dynamics
         self.cost = cost
 
@@ -104,36 +116,32 @@ class LQRSolver:
         trajectory. Here k_array_nTf1 and K_aaray_nTfd are
         tensors of dimension (n, self.T-1, f, 1) and (n, self.T-1, f, d) respectively.
         """
-        # with tf.name_scope('apply_control'):
         x0_n1d, _ = self.plant_dyn.parse_trajectory(start_config)
         assert(len(x0_n1d.shape) == 3)  # [n,1,x_dim]
         angle_dims = self.plant_dyn._angle_dims
-        actions = []
-        states = [x0_n1d * 1.]
         x_ref_nkd, u_ref_nkf = self.plant_dyn.parse_trajectory(trajectory)
-        x_next_n1d = x0_n1d * 1.
+
+        # The rollout is written into preallocated (time major) state and
+        # action buffers, so that every step works on contiguous arrays
+        def time_major(x_nk___):
+            return np.ascontiguousarray(np.moveaxis(x_nk___[:, :self.T], 1, 0))
+        x_ref_Tnd, u_ref_Tnf = time_major(x_ref_nkd), time_major(u_ref_nkf)
+        k_array_Tnf, K_array_Tnfd = time_major(k_array_nTf1[:, :, :, 0]), time_major(K_array_nTfd)
+        n, d, f = x0_n1d.shape[0], x0_n1d.shape[2], u_ref_nkf.shape[2]
+        u_dtype = np.result_type(x0_n1d, x_ref_nkd, u_ref_nkf, k_array_nTf1, K_array_nTfd)
+        x_Tnd = np.empty((self.T + 1, n, d), dtype=np.result_type(x0_n1d, u_dtype))
+        u_Tnf = np.empty((self.T, n, f), dtype=u_dtype)
+        error_nd = np.empty((n, d), dtype=np.result_type(x_Tnd, x_ref_nkd))
+        x_Tnd[0] = x0_n1d[:, 0]
         for t in range(self.T):
-            x_ref_n1d, u_ref_n1f = x_ref_nkd[:,
-                                             t:t + 1], u_ref_nkf[:, t:t + 1]
-            error_t_n1d = x_next_n1d - x_ref_n1d
-
-            # TODO: Currently calling numpy() here as tfe.DEVICE_PLACEMENT_SILENT
-            # is not working to place non-gpu ops (i.e. mod) on the cpu
-            # turning tensors into numpy arrays is a hack around this.
-            error_t_n1d = np.concatenate([error_t_n1d[:, :, :angle_dims],
-                                          angle_normalize(error_t_n1d[:, :,
-                                                                      angle_dims:angle_dims + 1]),
-                                          error_t_n1d[:, :, angle_dims + 1:]],
-                                         axis=2)
-            fdback_nf1 = np.matmul(
-                K_array_nTfd[:, t], np.transpose(error_t_n1d, axes=[0, 2, 1]))
-            u_n1f = u_ref_n1f + np.transpose(k_array_nTf1[:, t] + fdback_nf1,
-                                             axes=[0, 2, 1])
-            x_next_n1d = self.fwdSim(x_next_n1d, u_n1f, mode=sim_mode)
-            actions.append(u_n1f)
-            states.append(x_next_n1d)
-        u_nkf = np.concatenate(actions, axis=1)
-        x_nkd = np.concatenate(states, axis=1)
+            np.subtract(x_Tnd[t], x_ref_Tnd[t], out=error_nd)
+            error_nd[:, angle_dims] = angle_normalize(error_nd[:, angle_dims])
+            u_Tnf[t] = u_ref_Tnf[t] + (k_array_Tnf[t] + np.einsum('nfd,nd->nf', K_array_Tnfd[t], error_nd))
+            if self.plant_dyn.isStochastic:
+                x_Tnd[t + 1] = self.fwdSim(x_Tnd[t][:, None], u_Tnf[t][:, None], mode=sim_mode)[:, 0]
+            else:
+                self.plant_dyn.simulate_into(x_Tnd[t], u_Tnf[t], x_Tnd[t + 1], mode=sim_mode)
+        x_nkd, u_nkf = np.moveaxis(x_Tnd, 0, 1), np.moveaxis(u_Tnf, 0, 1)
         trajectory = self.plant_dyn.assemble_trajectory(x_nkd,
                                                         u_nkf,
                                                         pad_mode='repeat')
@@ -146,76 +154,79 @@ class LQRSolver:
         system (delta_x, delta_u, t).
         Need to approximate the dynamics/costs along the given trajectory.
         Dynamics needs a time-varying first-order approximation.
-        Costs need time-varying second-order approximation. """
-        # with tf.name_scope('back_prop'):
+        Costs need time-varying second-order approximation.
+        Returns the feedforward and feedback gains as tensors of dimension
+        (n, self.T, f, 1) and (n, self.T, f, d) respectively."""
         angle_dims = self.plant_dyn._angle_dims
         lqr_sys = self.build_lqr_system(trajectory)
         x_nkd, u_nkf = self.plant_dyn.parse_trajectory(trajectory)
 
-        # k (feedforward) and K (feedback) are lists of length self.T
-        # where each element is a tensor of dimension (n, f, 1)
-        # and (n, f, d) respectively.
-        fdfwd_Tnf1 = [None] * self.T
-        fdbck_gain_Tnfd = [None] * self.T
+        # The errors of the first order approximation of the dynamics
+        # at every time step (with the angle dimension wrapped)
+        error_nTd = lqr_sys['f_nkd'][:, :self.T] - x_nkd[:, 1:self.T + 1]
+        error_nTd[:, :, angle_dims] = angle_normalize(error_nTd[:, :, angle_dims])
+
+        if self.backend == 'numba' and _riccati_recursion_jit is not None:
+            n, d, f = error_nTd.shape[0], error_nTd.shape[2], u_nkf.shape[2]
+            dtype = np.result_type(lqr_sys['dldxx_nkdd'], lqr_sys['dfdx_nkdd'])
+            fdfwd_nTf1 = np.empty((n, self.T, f, 1), dtype=dtype)
+            fdbck_gain_nTfd = np.empty((n, self.T, f, d), dtype=dtype)
+            if _riccati_recursion_jit(error_nTd, lqr_sys['dfdx_nkdd'], lqr_sys['dfdu_nkdf'],
+                                      lqr_sys['dldx_nkd'], lqr_sys['dldu_nkf'],
+                                      lqr_sys['dldxx_nkdd'], lqr_sys['dldux_nkfd'],
+                                      lqr_sys['dlduu_nkff'], fdfwd_nTf1, fdbck_gain_nTfd):
+                return fdfwd_nTf1, fdbck_gain_nTfd
+            # some Quu is not positive definite, solve the batch
+            # below (with the np.linalg.solve fallback) instead
+
+        # Time major (contiguous) copies of the lqr system so that every
+        # step of the recursion works on contiguous (n, ., .) blocks
+        def time_major(x_nk___):
+            return np.ascontiguousarray(np.moveaxis(x_nk___[:, :self.T], 1, 0))
+        error_Tnd1 = time_major(error_nTd)[:, :, :, None]
+        dfdx_Tndd, dfdu_Tndf = time_major(lqr_sys['dfdx_nkdd']), time_major(lqr_sys['dfdu_nkdf'])
+        dfdx_T_Tndd = np.ascontiguousarray(np.swapaxes(dfdx_Tndd, 2, 3))
+        dfdu_T_Tnfd = np.ascontiguousarray(np.swapaxes(dfdu_Tndf, 2, 3))
+        dldx_Tnd1 = time_major(lqr_sys['dldx_nkd'])[:, :, :, None]
+        dldu_Tnf1 = time_major(lqr_sys['dldu_nkf'])[:, :, :, None]
+        dldxx_Tndd, dldux_Tnfd = time_major(lqr_sys['dldxx_nkdd']), time_major(lqr_sys['dldux_nkfd'])
+        dlduu_Tnff = time_major(lqr_sys['dlduu_nkff'])
+
+        # k (feedforward) and K (feedback) gains of every time step,
+        # solved for together as [k | K] of dimension (n, f, 1 + d)
+        gains_Tnf1d = [None] * self.T
 
         # initialize with the terminal cost parameters
         # to prepare the backpropagation
         Vxx_ndd = lqr_sys['dldxx_nkdd'][:, -1]
         Vx_nd1 = lqr_sys['dldx_nkd'][:, -1, :, None]
-
-        # TODO: Currently calling numpy() here as tfe.DEVICE_PLACEMENT_SILENT
-        # is not working to place non-gpu ops (i.e. mod) on the cpu
-        # turning tensors into numpy arrays is a hack around this.
-
         for t in reversed(range(self.T)):
-            error_t_nd = lqr_sys['f_nkd'][:, t] - x_nkd[:, t + 1]
-            error_t_nd = np.concatenate([error_t_nd[:, :angle_dims],
-                                         angle_normalize(error_t_nd[:,
-                                                                    angle_dims:angle_dims + 1]),
-                                         error_t_nd[:, angle_dims + 1:]],
-                                        axis=1)
-            error_t_nd1 = error_t_nd[:, :, None]
-
-            dfdx_ndd = lqr_sys['dfdx_nkdd'][:, t]
-            dfdu_ndf = lqr_sys['dfdu_nkdf'][:, t]
-            dfdx_T_ndd = np.transpose(dfdx_ndd, axes=[0, 2, 1])
-            dfdu_T_ndf = np.transpose(dfdu_ndf, axes=[0, 2, 1])
-
-            dfdx_T_dot_Vxx_ndd = np.matmul(dfdx_T_ndd, Vxx_ndd)
-            dfdu_T_dot_Vxx_nfd = np.matmul(dfdu_T_ndf, Vxx_ndd)
-
-            Qx_nd1 = (lqr_sys['dldx_nkd'][:, t][:, :, None] + np.matmul(dfdx_T_ndd, Vx_nd1)
-                      + np.matmul(dfdx_T_dot_Vxx_ndd, error_t_nd1))
-            Qu_nf1 = (lqr_sys['dldu_nkf'][:, t][:, :, None] + np.matmul(dfdu_T_ndf, Vx_nd1)
-                      + np.matmul(dfdu_T_dot_Vxx_nfd, error_t_nd1))
-            Qxx_ndd = lqr_sys['dldxx_nkdd'][:, t] + \
-                np.matmul(dfdx_T_dot_Vxx_ndd, dfdx_ndd)
-            Qux_nfd = lqr_sys['dldux_nkfd'][:, t] + \
-                np.matmul(dfdu_T_dot_Vxx_nfd, dfdx_ndd)
-            Quu_nff = lqr_sys['dlduu_nkff'][:, t] + \
-                np.matmul(dfdu_T_dot_Vxx_nfd, dfdu_ndf)
-
-            # use regularized inverse for numerical stability
-            inv_Quu_nff = self.regularized_pseudo_inverse_(
-                Quu_nff, reg=self.reg)
-
-            # get k and K
-            fdfwd_Tnf1[t] = np.matmul(-inv_Quu_nff, Qu_nf1)
-            fdbck_gain_Tnfd[t] = np.matmul(-inv_Quu_nff, Qux_nfd)
-            fdbck_gain_nfd = np.transpose(
-                fdbck_gain_Tnfd[t], axes=[0, 2, 1])
+            # the gradient of the value function at the next state,
+            # Vx + Vxx * error, is shared by Qx and Qu
+            grad_V_nd1 = Vx_nd1 + np.matmul(Vxx_ndd, error_Tnd1[t])
+            dfdx_T_dot_Vxx_ndd = np.matmul(dfdx_T_Tndd[t], Vxx_ndd)
+            dfdu_T_dot_Vxx_nfd = np.matmul(dfdu_T_Tnfd[t], Vxx_ndd)
+
+            Qx_nd1 = dldx_Tnd1[t] + np.matmul(dfdx_T_Tndd[t], grad_V_nd1)
+            Qu_nf1 = dldu_Tnf1[t] + np.matmul(dfdu_T_Tnfd[t], grad_V_nd1)
+            Qxx_ndd = dldxx_Tndd[t] + np.matmul(dfdx_T_dot_Vxx_ndd, dfdx_Tndd[t])
+            Qux_nfd = dldux_Tnfd[t] + np.matmul(dfdu_T_dot_Vxx_nfd, dfdx_Tndd[t])
+            Quu_nff = dlduu_Tnff[t] + np.matmul(dfdu_T_dot_Vxx_nfd, dfdu_Tndf[t])
+
+            # get k and K in one (batched) solve instead of inverting Quu
+            gains_nf1d = _batched_cholesky_solve(Quu_nff, -np.concatenate([Qu_nf1, Qux_nfd], axis=2))
+            gains_Tnf1d[t] = gains_nf1d
 
             # update value function for the previous time step
-            Vxx_ndd = Qxx_ndd - np.matmul(np.matmul(fdbck_gain_nfd, Quu_nff),
-                                          fdbck_gain_Tnfd[t])
-            Vx_nd1 = Qx_nd1 - \
-                np.matmul(np.matmul(fdbck_gain_nfd,
-                                    Quu_nff), fdfwd_Tnf1[t])
-
-        # Stack the outer time dimension as dimension 1
-        # in the tensors (tf.stack is equivalent to np.asarray)
-        fdfwd_nTf1 = np.stack(fdfwd_Tnf1, axis=1)
-        fdbck_gain_nTfd = np.stack(fdbck_gain_Tnfd, axis=1)
+            # (K^T Quu [k | K] gives the updates of Vx and Vxx at once)
+            fdbck_gain_T_dot_Quu_ndf = np.matmul(np.swapaxes(gains_nf1d[:, :, 1:], 1, 2), Quu_nff)
+            V_update_nd1d = np.matmul(fdbck_gain_T_dot_Quu_ndf, gains_nf1d)
+            Vx_nd1 = Qx_nd1 - V_update_nd1d[:, :, :1]
+            Vxx_ndd = Qxx_ndd - V_update_nd1d[:, :, 1:]
+
+        gains_nTf1d = np.stack(gains_Tnf1d, axis=1)
+        fdfwd_nTf1 = np.ascontiguousarray(gains_nTf1d[:, :, :, :1])
+        fdbck_gain_nTfd = np.ascontiguousarray(gains_nTf1d[:, :, :, 1:])
         return fdfwd_nTf1, fdbck_gain_nTfd
 
     def build_lqr_system(self, trajectory):
@@ -252,3 +263,161 @@ class LQRSolver:
             return np.linalg.inv(mat)
         else:
             raise NotImplementedError
+
+
+"""BEGIN LQR kernel utils"""
+
+
+def _batched_cholesky_solve(A_nff, B_nfm):
+    """
+    Solves A_nff X_nfm = B_nfm for a batch of small symmetric positive definite matrices A_nff. The Cholesky
+    factorization is written out over the (small) f dimension and vectorized over the batch, which is much faster
+    than np.linalg.solve on a large batch of tiny matrices. Falls back to np.linalg.solve if any of the A_nff is not
+    positive definite.
+    """
+    f = A_nff.shape[1]
+    L_nff = np.zeros_like(A_nff)
+    for r in range(f):
+        for c in range(r + 1):
+            acc_n = A_nff[:, r, c] - np.sum(L_nff[:, r, :c] * L_nff[:, c, :c], axis=1)
+            if r == c:
+                if not np.all(acc_n > 0.):
+                    return np.linalg.solve(A_nff, B_nfm)
+                L_nff[:, r, r] = np.sqrt(acc_n)
+            else:
+                L_nff[:, r, c] = acc_n / L_nff[:, c, c]
+    # forward and backward substitution
+    X_nfm = np.empty_like(B_nfm)
+    for r in range(f):
+        X_nfm[:, r] = (B_nfm[:, r] - np.einsum('nj,njm->nm', L_nff[:, r, :r], X_nfm[:, :r])) / L_nff[:, r, r, None]
+    for r in reversed(range(f)):
+        X_nfm[:, r] = (X_nfm[:, r] - np.einsum('nj,njm->nm', L_nff[:, r + 1:, r], X_nfm[:, r + 1:])) / \
+            L_nff[:, r, r, None]
+    return X_nfm
+
+
+def _riccati_recursion(error_nTd, dfdx_nkdd, dfdu_nkdf, dldx_nkd, dldu_nkf, dldxx_nkdd, dldux_nkfd,
+                       dlduu_nkff, fdfwd_nTf1, fdbck_gain_nTfd):
+    """
+    The backward Riccati recursion of LQRSolver.back_propagation written out with scalar loops over the small (d, d)
+    matrices of one problem at a time, so it can be jit compiled (see _riccati_recursion_jit). Quu is solved for
+    with a Cholesky factorization (it is positive definite for the quadratic costs used here). The gains are
+    written to fdfwd_nTf1 and fdbck_gain_nTfd. Returns False (leaving the gains incomplete) as soon as some Quu is
+    not positive definite, True otherwise.
+    """
+    n, T, d = error_nTd.shape
+    f = dfdu_nkdf.shape[3]
+    Vxx = np.empty((d, d))
+    Vx = np.empty(d)
+    grad_V = np.empty(d)
+    AtV = np.empty((d, d))
+    BtV = np.empty((f, d))
+    Qx = np.empty(d)
+    Qxx = np.empty((d, d))
+    Qu_ux = np.empty((f, d + 1))
+    Quu = np.empty((f, f))
+    L = np.empty((f, f))
+    gains = np.empty((f, d + 1))
+    KtQuu = np.empty((d, f))
+    for i in range(n):
+        for r in range(d):
+            Vx[r] = dldx_nkd[i, -1, r]
+            for c in range(d):
+                Vxx[r, c] = dldxx_nkdd[i, -1, r, c]
+        for t in range(T - 1, -1, -1):
+            # gradient of the value function at the next state
+            for r in range(d):
+                acc = Vx[r]
+                for c in range(d):
+                    acc += Vxx[r, c] * error_nTd[i, t, c]
+                grad_V[r] = acc
+            # A^T Vxx and B^T Vxx
+            for r in range(d):
+                for c in range(d):
+                    acc = 0.
+                    for j in range(d):
+                        acc += dfdx_nkdd[i, t, j, r] * Vxx[j, c]
+                    AtV[r, c] = acc
+            for r in range(f):
+                for c in range(d):
+                    acc = 0.
+                    for j in range(d):
+                        acc += dfdu_nkdf[i, t, j, r] * Vxx[j, c]
+                    BtV[r, c] = acc
+            # Qx, Qxx
+            for r in range(d):
+                acc = dldx_nkd[i, t, r]
+                for j in range(d):
+                    acc += dfdx_nkdd[i, t, j, r] * grad_V[j]
+                Qx[r] = acc
+                for c in range(d):
+                    acc = dldxx_nkdd[i, t, r, c]
+                    for j in range(d):
+                        acc += AtV[r, j] * dfdx_nkdd[i, t, j, c]
+                    Qxx[r, c] = acc
+            # [Qu | Qux] and Quu
+            for r in range(f):
+                acc = dldu_nkf[i, t, r]
+                for j in range(d):
+                    acc += dfdu_nkdf[i, t, j, r] * grad_V[j]
+                Qu_ux[r, 0] = acc
+                for c in range(d):
+                    acc = dldux_nkfd[i, t, r, c]
+                    for j in range(d):
+                        acc += BtV[r, j] * dfdx_nkdd[i, t, j, c]
+                    Qu_ux[r, c + 1] = acc
+                for c in range(f):
+                    acc = dlduu_nkff[i, t, r, c]
+                    for j in range(d):
+                        acc += BtV[r, j] * dfdu_nkdf[i, t, j, c]
+                    Quu[r, c] = acc
+            # Cholesky factorization Quu = L L^T
+            for r in range(f):
+                for c in range(r + 1):
+                    acc = Quu[r, c]
+                    for j in range(c):
+                        acc -= L[r, j] * L[c, j]
+                    if r == c:
+                        if acc <= 0.:
+                            return False
+                        L[r, r] = math.sqrt(acc)
+                    else:
+                        L[r, c] = acc / L[c, c]
+            # [k | K] = -Quu^-1 [Qu | Qux] by forward and backward substitution
+            for c in range(d + 1):
+                for r in range(f):
+                    acc = -Qu_ux[r, c]
+                    for j in range(r):
+                        acc -= L[r, j] * gains[j, c]
+                    gains[r, c] = acc / L[r, r]
+                for r in range(f - 1, -1, -1):
+                    acc = gains[r, c]
+                    for j in range(r + 1, f):
+                        acc -= L[j, r] * gains[j, c]
+                    gains[r, c] = acc / L[r, r]
+            for r in range(f):
+                fdfwd_nTf1[i, t, r, 0] = gains[r, 0]
+                for c in range(d):
+                    fdbck_gain_nTfd[i, t, r, c] = gains[r, c + 1]
+            # update value function for the previous time step
+            for r in range(d):
+                for c in range(f):
+                    acc = 0.
+                    for j in range(f):
+                        acc += gains[j, r + 1] * Quu[j, c]
+                    KtQuu[r, c] = acc
+            for r in range(d):
+                acc = Qx[r]
+                for j in range(f):
+                    acc -= KtQuu[r, j] * gains[j, 0]
+                Vx[r] = acc
+                for c in range(d):
+                    acc = Qxx[r, c]
+                    for j in range(f):
+                        acc -= KtQuu[r, j] * gains[j, c + 1]
+                    Vxx[r, c] = acc
+    return True
+
+
+# The jit compiled Riccati recursion, if numba is installed
+_riccati_recursion_jit = None if numba is None else numba.njit(cache=True)(_riccati_recursion)
@@ -2,6 +2,7 @@ import configparser
 from dotmap import DotMap
 import numpy as np
 import os
+from utils.precision import set_float_dtype
 
 # first thing to do is create a config parser
 cwd = os.getcwd()
@@ -11,6 +12,9 @@ user_config = configparser.ConfigParser()
 user_config.read(os.path.join(cwd, 'params/user_params.ini'))
 # get global randomness seed
 seed = user_config['socnav_params'].getint('seed')
+# set the (global) floating point precision policy of the planning stack
+precision = user_config['socnav_params'].get('precision', 'float32')
+set_float_dtype(precision)
 
 # read params file for default configurations of SocNavBench
 default_config = configparser.ConfigParser()
@@ -29,6 +33,7 @@ def create_socnav_params():
     p = DotMap()
     socnav_p = user_config['socnav_params']
     p.seed = seed
+    p.precision = precision
     p.render_3D = (socnav_p.get('render_mode') == 'full-render')
     p.dataset_dir = socnav_p.get('dataset_dir')
     p.socnav_dir = get_path_to_socnav()
@@ -61,7 +66,16 @@ def create_robot_params():
     rob_p = user_config['robot_params']
     p.send_ID = rob_p.get('send_ID')
     p.recv_ID = rob_p.get('recv_ID')
+    # server mode (see simulators/simulator_server.py)
+    p.server_ID = rob_p.get('server_ID')
+    p.num_session_workers = max(1, rob_p.getint('num_session_workers'))
+    # unique to every session hosted by a simulator server, None otherwise
+    p.session_id = None
     p.max_repeats = max(0, rob_p.getint('max_repeats'))
+    # recording & replaying the joystick messages
+    p.record_joystick = rob_p.getboolean('record_joystick')
+    p.replay_joystick = rob_p.getboolean('replay_joystick')
+    p.joystick_record_dir = rob_p.get('joystick_record_dir')
     p.physical_params = \
         DotMap(radius=rob_p.getfloat('radius_cm') / 100.0,
                base=rob_p.getfloat('distance_from_ground_cm'),
@@ -86,10 +100,15 @@ def create_joystick_params():
     p.episode_horizon_s = joystick_p.getint('episode_horizon')
     p.control_horizon_s = joystick_p.getfloat('control_horizon_s')
     p.track_vel_accel = joystick_p.getboolean('track_vel_accel')
+    p.vel_accel_window = joystick_p.getint('vel_accel_window')
     p.print_data = joystick_p.getboolean('print_data')
     p.track_sim_states = joystick_p.getboolean('track_sim_states')
+    p.sim_states_window = joystick_p.getint('sim_states_window', 100)
     p.write_pandas_log = joystick_p.getboolean('write_pandas_log')
+    p.log_flush_interval_s = joystick_p.getfloat('log_flush_interval_s')
     p.generate_movie = joystick_p.getboolean('generate_movie')
+    p.use_server = joystick_p.getboolean('use_server')
+    p.session_timeout_s = joystick_p.getfloat('session_timeout_s')
     return p
 
 
@@ -158,6 +177,24 @@ def create_planner_params():
     from planners.sampling_planner import SamplingPlanner
     # Default of a planner
     p.planner = SamplingPlanner
+
+    # Coarse-to-fine waypoint search
+    planner_p = default_config['planner_params']
+    p.hierarchical_search = \
+        DotMap(enabled=planner_p.getboolean('hierarchical_search'),
+               waypoint_stride=planner_p.getint('coarse_waypoint_stride'),
+               time_stride=planner_p.getint('coarse_time_stride'),
+               num_candidates=planner_p.getint('num_refine_candidates'),
+               cost_margin=planner_p.getfloat('refine_cost_margin'),
+               radius=planner_p.getfloat('refine_radius'),
+               audit_every=planner_p.getint('audit_every'))
+
+    # Reusing (or warm starting from) the last plan when replanning
+    p.plan_reuse = \
+        DotMap(enabled=planner_p.getboolean('plan_reuse'),
+               cost_margin=planner_p.getfloat('reuse_cost_margin'),
+               min_horizon_s=planner_p.getfloat('reuse_min_horizon_s'),
+               warm_start_radius=planner_p.getfloat('warm_start_radius'))
     return p
 
 
@@ -269,7 +306,8 @@ def create_control_pipeline_params():
     p.lqr_params = \
         DotMap(cost_fn=QuadraticRegulatorRef,
                quad_coeffs=np.array(q_coeffs, dtype=np.float32),
-               linear_coeffs=np.array(l_coeffs, dtype=np.float32)
+               linear_coeffs=np.array(l_coeffs, dtype=np.float32),
+               backend=cp_p2.get('lqr_backend', 'numpy')
                )
 
     # Velocity binning parameters
@@ -287,6 +325,9 @@ def create_control_pipeline_params():
     p.track_trajectory_acceleration = \
         cp_p2.getboolean('track_trajectory_acceleration')
     p.verbose = cp_p2.getboolean('verbose')
+    # Either 'mmap' (memory-mapped .npy arrays) or 'pkl' (pickled data bins)
+    p.store_format = cp_p2.get('store_format')
+    p.num_generation_workers = cp_p2.getint('num_generation_workers')
     return p
 
 
@@ -296,6 +337,7 @@ def create_simulator_params(verbose=True):
     p.dt = sim_p.getfloat('dt')
     p.keep_episode_running = sim_p.getboolean('keep_episode_running')
     p.use_multithreading = sim_p.getboolean('use_multithreading')
+    p.batch_agent_planning = sim_p.getboolean('batch_agent_planning')
     p.block_joystick = (sim_p.get('synchronous_mode') == "synchronous")
     p.delta_t_scale = sim_p.getfloat('delta_t_scale')
     p.socnav_params = create_socnav_params()
@@ -339,6 +381,9 @@ def create_agent_params(with_planner=False, with_obstacle_map=False):
     p.collision_cooldown_amnt = int(
         agent_p.getfloat('collision_cooldown_amnt') / dt)
     p.pause_on_collide = agent_p.getboolean('pause_on_collide')
+    # FMM maps shared between the agents (and episodes) with the same goal cell
+    p.fmm_map_cache = DotMap(max_bytes=int(agent_p.getfloat('fmm_cache_max_mb') * 2**20),
+                             cache_dir=agent_p.get('fmm_cache_dir') or None)
     assert(p.collision_cooldown_amnt > 0)
     # Load system dynamics params
     p.system_dynamics_params = create_system_dynamics_params()
@@ -384,10 +429,19 @@ def create_agent_params(with_planner=False, with_obstacle_map=False):
     # Personal Space cost parameters
     p.personal_space_objective = \
         DotMap(power=1,
-               psc_scale=10
+               psc_scale=10,
+               # Agents further than this (in m) from a trajectory point are not
+               # evaluated at that point (None evaluates every agent everywhere)
+               cutoff_radius=None,
+               # Precision of the gaussian kernels (None follows the precision policy)
+               # and the number of intervals of the lookup table approximating exp
+               # (None computes exp exactly)
+               kernel_dtype=None,
+               kernel_lut_size=None
                )
 
-    p.objective_fn_params = DotMap(obj_type=agent_p2.get('obj_type'))
+    p.objective_fn_params = DotMap(obj_type=agent_p2.get('obj_type'),
+                                   packed_evaluation=agent_p2.getboolean('packed_evaluation'))
     p.goal_margin = p.goal_distance_objective.goal_margin
     p.goal_dist_norm = p.goal_distance_objective.power  # Default is l2 norm
     p.episode_termination_reasons = ['Timeout',
@@ -19,6 +19,10 @@ class Planner(object):
                                    k=params.planning_horizon,
                                    variable=True)
         self.control_pipeline = self._init_control_pipeline()
+        # the (world coordinate) buffers this planner plans into on the shared control pipeline
+        self.pipeline_workspace = self.control_pipeline.new_workspace()
+        # the last plan (see SamplingPlanner.plan_reuse)
+        self.last_plan = None
 
     @staticmethod
     def parse_params(p):
@@ -41,19 +45,29 @@ class Planner(object):
         if self.control_pipeline.params.only_one_system:
             with lock:
                 # NOTE: these functions are not reentrant
-                waypts, horizons, trajectories_lqr, trajectories_spline, controllers = \
-                    self.control_pipeline.plan(start_config, goal_config)
-                obj_val = self.obj_fn.evaluate_function(
-                    trajectories_lqr, sim_state_hist)
-        else:
-            waypts, horizons, trajectories_lqr, trajectories_spline, controllers = \
-                self.control_pipeline.plan(start_config, goal_config)
-            obj_val = self.obj_fn.evaluate_function(trajectories_lqr)
+                return self._plan_and_evaluate(start_config, goal_config, sim_state_hist)
+        # every planner has its own workspace so planning on the shared pipeline is safe
+        return self._plan_and_evaluate(start_config, goal_config, sim_state_hist)
+
+    def _plan_and_evaluate(self, start_config, goal_config=None, sim_state_hist=None):
+        waypts, horizons, trajectories_lqr, trajectories_spline, controllers = \
+            self.control_pipeline.plan(start_config, goal_config,
+                                       workspace=self.pipeline_workspace)
+        obj_val = self.evaluate_trajectories(waypts, trajectories_lqr,
+                                             sim_state_hist)
         return obj_val, [
             waypts, horizons, trajectories_lqr, trajectories_spline,
             controllers
         ]
 
+    def evaluate_trajectories(self, waypts, trajectories, sim_state_hist=None):
+        """ Evaluate the objective function on every (planned) trajectory to waypts."""
+        return self.obj_fn.evaluate_function(trajectories, sim_state_hist)
+
+    def forget_last_plan(self):
+        """Stop reusing the last plan, i.e. when the objective (goal or map) has changed."""
+        self.last_plan = None
+
     def _init_control_pipeline(self):
         """If the control pipeline has exists already (i.e. precomputed),
         load it. Otherwise generate create it from scratch and save it."""
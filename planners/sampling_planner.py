@@ -1,6 +1,9 @@
 import numpy as np
-from planners.planner import Planner
+from planners.planner import Planner, lock
+from objectives.objective_function import ObjectiveFunction
 from trajectory.trajectory import Trajectory, SystemConfig
+from utils.angle_utils import angle_normalize
+from utils.precision import get_float_dtype
 
 
 class SamplingPlanner(Planner):
@@ -11,6 +14,22 @@ class SamplingPlanner(Planner):
             to a fixed set of waypoint configurations
         2. Evaluates the objective function on the resulting trajectories
         3. Returns the minimum cost waypoint and associated trajectory"""
+    # how far (in [x, y, theta] l2 distance) a start config may be from the last plan to reuse it
+    reuse_match_tol = 1e-3
+
+    def __init__(self, obj_fn, params):
+        super(SamplingPlanner, self).__init__(obj_fn, params)
+        # how often the coarse-to-fine search picked a different waypoint than the exhaustive search
+        self.hierarchical_stats = {'num_searches': 0,
+                                   'num_audited': 0,
+                                   'num_disagreements': 0,
+                                   'max_cost_regret': 0.}
+        # how often the last plan was reused (or warm started from), see plan_reuse in the planner params
+        self.plan_reuse_stats = {'num_plans': 0,
+                                 'num_reused': 0,
+                                 'num_warm_started': 0}
+        # the waypoint of the last plan to warm start from (egocentric to the current start config)
+        self.warm_start_waypt = None
 
     @staticmethod
     def parse_params(p):
@@ -36,15 +55,29 @@ class SamplingPlanner(Planner):
         # TODO:
         #   changing the code so that sim_state is all history
 
+        if self.params.plan_reuse.enabled:
+            self.plan_reuse_stats['num_plans'] += 1
+            planner_data = self._reuse_last_plan(start_config, sim_state_hist)
+            if planner_data is not None:
+                return planner_data
+            if self.last_plan is not None and self.params.plan_reuse.warm_start_radius > 0.:
+                # (the waypoints are egocentric to start_config, not to the start of the last plan)
+                self.warm_start_waypt = self.control_pipeline.system_dynamics.to_egocentric_coordinates(
+                    start_config, self.last_plan['waypoint_config'], mode='new')
         obj_vals, data = self.eval_objective(start_config, goal_config,
                                              sim_state_hist=sim_state_hist)
-        min_idx = np.argmin(obj_vals)
-        min_cost = obj_vals[min_idx]
-        waypts, horizons_s, trajectories_lqr, trajectories_spline, controllers = data
+        self.warm_start_waypt = None
+        return self._collect_optimal_plan(start_config, obj_vals, *data,
+                                          sim_state_hist=sim_state_hist)
 
-        self.opt_waypt.assign_from_config_batch_idx(waypts, min_idx)
+    def _collect_optimal_plan(self, start_config, obj_vals, waypts, horizons_s, trajectories_lqr,
+                              trajectories_spline, controllers, batch_offset=0, sim_state_hist=None):
+        """ Returns the planner data of the minimum cost waypoint. The trajectory of obj_vals[i] is at index
+        batch_offset + i of trajectories_lqr (see optimize_batch), waypts and controllers are egocentric
+        and only the minimum cost waypoint (and its controller) is converted to world coordinates."""
+        min_idx = np.argmin(obj_vals)
         self.opt_traj.assign_from_trajectory_batch_idx(
-            trajectories_lqr, min_idx)
+            trajectories_lqr, batch_offset + min_idx)
 
         # Convert horizon in seconds to horizon in # of steps
         try:
@@ -52,14 +85,15 @@ class SamplingPlanner(Planner):
         except:
             min_horizon = int(np.ceil(horizons_s[min_idx, 0] / self.params.dt))
 
+        waypt = self.control_pipeline.waypt_to_world_coordinates(start_config, waypts, min_idx)
+        self.opt_waypt.assign_from_config_batch_idx(waypt, 0)
+
         # If the real LQR data has been discarded just take the first element
         # since it will be all zeros
-        if self.params.control_pipeline_params.discard_LQR_controller_data:
-            K_nkfd = controllers['K_nkfd'][0: 1]
-            k_nkf1 = controllers['k_nkf1'][0: 1]
-        else:
-            K_nkfd = controllers['K_nkfd'][min_idx:min_idx + 1]
-            k_nkf1 = controllers['k_nkf1'][min_idx:min_idx + 1]
+        K_idx = 0 if self.params.control_pipeline_params.discard_LQR_controller_data else min_idx
+        controllers = self.control_pipeline.controllers_to_world_coordinates(start_config, controllers, K_idx)
+        K_nkfd = controllers['K_nkfd']
+        k_nkf1 = controllers['k_nkf1']
 
         data = {'system_config': SystemConfig.copy(start_config),
                 'waypoint_config': SystemConfig.copy(self.opt_waypt),
@@ -70,4 +104,244 @@ class SamplingPlanner(Planner):
                 'k_nkf1': k_nkf1,
                 'img_nmkd': []}  # Dont think we need for our purposes
 
+        if self.params.plan_reuse.enabled:
+            self._remember_plan(data, float(obj_vals[min_idx]), sim_state_hist)
+        return data
+
+    def _remember_plan(self, data, cost, sim_state_hist=None):
+        """Keep the planner data of the last plan (and its cost at every time step) to reuse it."""
+        trajectory = data['trajectory']
+        trajectory.update_valid_mask_nk()
+        self.last_plan = {'cost': cost,
+                          'cost_k': self._cost_per_step(trajectory, sim_state_hist),
+                          'waypoint_config': data['waypoint_config'],
+                          'trajectory': data['trajectory'],
+                          'spline_trajectory': data['spline_trajectory'],
+                          'planning_horizon': data['planning_horizon'],
+                          'K_nkfd': data['K_nkfd'],
+                          'k_nkf1': data['k_nkf1']}
+
+    @staticmethod
+    def optimize_batch(planners, start_configs, sim_state_hists=None):
+        """ Optimize the objectives of many planners (i.e. agents, sharing one control pipeline)
+        at once, where planners[i] plans from start_configs[i]:
+            1. Groups the start configs by velocity bin and converts the trajectories of
+                every group to world coordinates in one batched operation
+            2. Evaluates the objective functions (with the fmm map of every agent) of every
+                group in one vectorized pass
+            3. Returns the planner data (see optimize) of every planner
+        NOTE: the planners that can reuse their last plan (see plan_reuse) do so, all the
+        others plan to all the waypoints (i.e. hierarchical_search & warm starts are not used)
+        """
+        control_pipeline = planners[0].control_pipeline
+        assert(all(planner.control_pipeline is control_pipeline for planner in planners))
+        if sim_state_hists is None:
+            sim_state_hists = [None] * len(planners)
+
+        planner_data = [None] * len(planners)
+        for i, planner in enumerate(planners):
+            if planner.params.plan_reuse.enabled:
+                planner.plan_reuse_stats['num_plans'] += 1
+                planner_data[i] = planner._reuse_last_plan(start_configs[i], sim_state_hists[i])
+        replan_idxs = [i for i, data in enumerate(planner_data) if data is None]
+        if len(replan_idxs) == 0:
+            return planner_data
+        replan_start_configs = [start_configs[i] for i in replan_idxs]
+        if control_pipeline.params.only_one_system:
+            with lock:
+                groups = control_pipeline.plan_batch(replan_start_configs)
+        else:
+            groups = control_pipeline.plan_batch(replan_start_configs)
+
+        for group in groups:
+            idxs = [replan_idxs[j] for j in group['idxs']]
+            trajectories_lqr = group['trajectories_lqr']
+            obj_vals_mn = ObjectiveFunction.evaluate_function_batch(
+                [planners[i].obj_fn for i in idxs], trajectories_lqr,
+                [sim_state_hists[i] for i in idxs]).reshape((len(idxs), -1))
+            n = obj_vals_mn.shape[1]
+            for j, i in enumerate(idxs):
+                planner_data[i] = planners[i]._collect_optimal_plan(start_configs[i], obj_vals_mn[j],
+                                                                    group['waypt_configs'],
+                                                                    group['horizons'],
+                                                                    trajectories_lqr,
+                                                                    group['trajectories_spline'],
+                                                                    group['controllers'],
+                                                                    batch_offset=j * n,
+                                                                    sim_state_hist=sim_state_hists[i])
+        return planner_data
+
+    def evaluate_trajectories(self, waypts, trajectories, sim_state_hist=None):
+        """ Evaluate the objective function on the trajectories to waypts, either on every
+        trajectory or coarse-to-fine (see hierarchical_search in the planner params) in which case
+        the trajectories that were skipped are given an infinite cost. When warm starting (see
+        plan_reuse) the waypoints near the last waypoint are searched first."""
+        if self.warm_start_waypt is not None:
+            obj_vals = self._evaluate_near_last_waypt(waypts, trajectories, sim_state_hist)
+            if obj_vals is not None:
+                return obj_vals
+        hp = self.params.hierarchical_search
+        if not hp.enabled:
+            return self.obj_fn.evaluate_function(trajectories, sim_state_hist)
+        obj_vals = self._evaluate_hierarchically(waypts, trajectories, sim_state_hist)
+        self.hierarchical_stats['num_searches'] += 1
+        if hp.audit_every > 0 and \
+                self.hierarchical_stats['num_searches'] % hp.audit_every == 0:
+            self._audit_hierarchical_search(trajectories, sim_state_hist, obj_vals)
+        return obj_vals
+
+    def _evaluate_hierarchically(self, waypts, trajectories, sim_state_hist=None):
+        hp = self.params.hierarchical_search
+        n = trajectories.n
+        coarse_idxs = np.arange(0, n, hp.waypoint_stride)
+        if coarse_idxs.size <= hp.num_candidates:
+            return self.obj_fn.evaluate_function(trajectories, sim_state_hist)
+        # 1. evaluate the objective on a decimated subset of the waypoints & time steps
+        coarse_trajectories = \
+            self._decimate_trajectories(trajectories, coarse_idxs, hp.time_stride)
+        coarse_vals = self.obj_fn.evaluate_function(coarse_trajectories,
+                                                    sim_state_hist)
+        # 2. the candidates are the best coarse waypoints (and all the ones within the cost margin)
+        order = np.argsort(coarse_vals)
+        num_candidates = max(hp.num_candidates,
+                             np.sum(coarse_vals <= coarse_vals[order[0]] + hp.cost_margin))
+        candidate_idxs = coarse_idxs[order[:num_candidates]]
+        # 3. evaluate the objective at full resolution around the candidates
+        refine_idxs = self.control_pipeline.waypt_index(waypts).query_radius(candidate_idxs, hp.radius)
+        refine_trajectories = \
+            Trajectory.gather_across_batch_dim_and_create(trajectories, refine_idxs)
+        refine_trajectories.update_valid_mask_nk()
+        refine_vals = self.obj_fn.evaluate_function(refine_trajectories, sim_state_hist)
+        obj_vals = np.full(n, np.inf, dtype=refine_vals.dtype)
+        obj_vals[refine_idxs] = refine_vals
+        return obj_vals
+
+    def _audit_hierarchical_search(self, trajectories, sim_state_hist, obj_vals):
+        """Compare the waypoint chosen by the coarse-to-fine search against the exhaustive search."""
+        exhaustive_vals = self.obj_fn.evaluate_function(trajectories, sim_state_hist)
+        stats = self.hierarchical_stats
+        stats['num_audited'] += 1
+        if np.argmin(obj_vals) != np.argmin(exhaustive_vals):
+            stats['num_disagreements'] += 1
+            regret = float(np.min(obj_vals) - np.min(exhaustive_vals))
+            stats['max_cost_regret'] = max(stats['max_cost_regret'], regret)
+
+    def hierarchical_search_report(self):
+        """Returns the statistics of the coarse-to-fine search, including the rate at which its
+        waypoint differed from the exhaustive search (over the audited plans)."""
+        report = dict(self.hierarchical_stats)
+        report['disagreement_rate'] = 0. if report['num_audited'] == 0 else \
+            report['num_disagreements'] / report['num_audited']
+        return report
+
+    def _reuse_last_plan(self, start_config, sim_state_hist=None):
+        """Returns the planner data of the rest of the last plan if start_config is along it and the
+        rest is long enough, collision free and (within the cost margin) as cheap under the current
+        objective as it was when it was planned, i.e. the scene has barely changed. Else None."""
+        if self.last_plan is None:
+            return None
+        rp = self.params.plan_reuse
+        last_trajectory = self.last_plan['trajectory']
+        horizon = self.last_plan['planning_horizon']
+        # the time step of the last plan that start_config is at
+        diff_pos_k2 = last_trajectory.position_nk2()[0, :horizon] - start_config.position_nk2()[0, 0]
+        diff_heading_k = angle_normalize(last_trajectory.heading_nk1()[0, :horizon, 0] -
+                                         start_config.heading_nk1()[0, 0, 0])
+        dist_k = np.sqrt(np.sum(diff_pos_k2 ** 2, axis=1) + diff_heading_k ** 2)
+        t = int(np.argmin(dist_k))
+        min_horizon = int(np.ceil(rp.min_horizon_s / self.params.dt))
+        if dist_k[t] > self.reuse_match_tol or horizon - t < min_horizon:
+            return None
+        trajectory = Trajectory.new_traj_clip_from_time_index(last_trajectory, t)
+        trajectory.update_valid_mask_nk()
+        if not self._is_collision_free(trajectory):
+            return None
+        cost_k = self._cost_per_step(trajectory, sim_state_hist)
+        if np.mean(cost_k[:horizon - t]) > \
+                np.mean(self.last_plan['cost_k'][t:horizon]) + rp.cost_margin:
+            return None
+
+        self.plan_reuse_stats['num_reused'] += 1
+        # the reference (spline) trajectory and the LQR controllers start at time step t as well
+        spline_trajectory = Trajectory.new_traj_clip_from_time_index(self.last_plan['spline_trajectory'], t)
+        K_nkfd, k_nkf1 = self.last_plan['K_nkfd'], self.last_plan['k_nkf1']
+        # (if the real LQR data has been discarded there is only a single (zero) time step)
+        if not self.params.control_pipeline_params.discard_LQR_controller_data:
+            K_nkfd, k_nkf1 = K_nkfd[:, t:], k_nkf1[:, t:]
+        self.last_plan = dict(self.last_plan, cost_k=cost_k, trajectory=trajectory,
+                              spline_trajectory=spline_trajectory,
+                              planning_horizon=horizon - t,
+                              K_nkfd=K_nkfd,
+                              k_nkf1=k_nkf1)
+        data = {'system_config': SystemConfig.copy(start_config),
+                'waypoint_config': SystemConfig.copy(self.last_plan['waypoint_config']),
+                'trajectory': Trajectory.copy(trajectory),
+                'spline_trajectory': Trajectory.copy(spline_trajectory),
+                'planning_horizon': self.last_plan['planning_horizon'],
+                'K_nkfd': self.last_plan['K_nkfd'],
+                'k_nkf1': self.last_plan['k_nkf1'],
+                'img_nmkd': []}
         return data
+
+    def _cost_per_step(self, trajectory, sim_state_hist=None):
+        """The objective of the (single) trajectory at every time step, i.e. before it is reduced over time."""
+        cost_1k = np.zeros((1, trajectory.k), dtype=get_float_dtype())
+        for _, objective_values in self.obj_fn.evaluate_function_by_objective(trajectory, sim_state_hist):
+            cost_1k = cost_1k + objective_values
+        return cost_1k[0]
+
+    def _is_collision_free(self, trajectory):
+        """Whether the valid part of the (single) trajectory stays at least obstacle_margin0 away from
+        the obstacles of every obstacle avoidance objective."""
+        valid_pos_nk2 = trajectory.position_nk2()[:, :int(trajectory.valid_horizons_n1[0, 0])]
+        for objective in self.obj_fn.objectives:
+            if objective.tag != 'obstacle_avoidance':
+                continue
+            dist_to_obstacles_nk = objective.obstacle_map.dist_to_nearest_obs(valid_pos_nk2)
+            if np.any(dist_to_obstacles_nk < objective.p.obstacle_margin0):
+                return False
+        return True
+
+    def _evaluate_near_last_waypt(self, waypts, trajectories, sim_state_hist=None):
+        """Evaluate the objective only on the trajectories to the waypoints near the waypoint of the last
+        plan (all egocentric to the current start config), i.e. keep heading to the same place, giving the
+        others an infinite cost. Returns None if none of them is within the cost margin of the last plan."""
+        rp = self.params.plan_reuse
+        waypt_index = self.control_pipeline.waypt_index(waypts)
+        closest_idx = waypt_index.query(self.warm_start_waypt)[0][0]
+        near_idxs = waypt_index.query_radius([closest_idx], rp.warm_start_radius)
+        near_trajectories = Trajectory.gather_across_batch_dim_and_create(trajectories, near_idxs)
+        near_trajectories.update_valid_mask_nk()
+        near_vals = self.obj_fn.evaluate_function(near_trajectories, sim_state_hist)
+        if np.min(near_vals) > self.last_plan['cost'] + rp.cost_margin:
+            return None
+        self.plan_reuse_stats['num_warm_started'] += 1
+        obj_vals = np.full(trajectories.n, np.inf, dtype=near_vals.dtype)
+        obj_vals[near_idxs] = near_vals
+        return obj_vals
+
+    def plan_reuse_report(self):
+        """Returns the statistics of the plan reuse, including the rate at which the last plan was
+        reused (hit_rate) or warm started from."""
+        report = dict(self.plan_reuse_stats)
+        num_plans = max(report['num_plans'], 1)
+        report['hit_rate'] = report['num_reused'] / num_plans
+        report['warm_start_rate'] = report['num_warm_started'] / num_plans
+        return report
+
+    @staticmethod
+    def _decimate_trajectories(trajectories, idxs, time_stride):
+        """Returns a new trajectory of every time_stride'th time step of the trajectories at idxs."""
+        valid_horizons_n1 = \
+            np.ceil(trajectories.valid_horizons_n1[idxs] / time_stride)
+        decimated = Trajectory(dt=trajectories.dt * time_stride, n=idxs.size,
+                               k=len(range(0, trajectories.k, time_stride)),
+                               position_nk2=trajectories.position_nk2()[idxs, ::time_stride],
+                               speed_nk1=trajectories.speed_nk1()[idxs, ::time_stride],
+                               heading_nk1=trajectories.heading_nk1()[idxs, ::time_stride],
+                               angular_speed_nk1=trajectories.angular_speed_nk1()[idxs, ::time_stride],
+                               valid_horizons_n1=valid_horizons_n1,
+                               direct_init=True,
+                               track_trajectory_acceleration=False)
+        decimated.update_valid_mask_nk()
+        return decimated
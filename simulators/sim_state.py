@@ -1,5 +1,6 @@
 import numpy as np
 import json
+from collections import OrderedDict
 from utils.utils import generate_config_from_pos_3, euclidean_dist2
 from utils.utils import color_red, color_reset
 
@@ -369,3 +370,178 @@ def compute_all_accelerations(sim_states: list):
         all_accels[agent_name] = compute_agent_state_acceleration(
             sim_states, agent_name)
     return all_accels
+
+
+class AgentKinematicsTracker(object):
+    """Incrementally tracks the speed and acceleration of every agent from only
+    the newest SimState (O(agents) per update) rather than recomputing over the
+    entire list of SimStates as in compute_all_velocities/accelerations.
+    The history of every agent is bounded by a window of the latest updates."""
+
+    def __init__(self, window: int = 100, include_robot: bool = False):
+        assert(window > 0)
+        self.window = window
+        self.include_robot = include_robot
+        self.agent_idx = {}  # row of every agent in the arrays below
+        self.num_updates = 0
+        self.sim_t = None
+        capacity = 16
+        self.last_pos_n2 = np.zeros((capacity, 2), dtype=np.float32)
+        # (sim_t in float64 so that delta_t is not rounded in long episodes)
+        self.last_t_n = np.zeros(capacity, dtype=np.float64)
+        # ring buffers of the latest (window) speeds & accelerations of every agent
+        self.speeds_nw = np.zeros((capacity, window), dtype=np.float32)
+        self.accels_nw = np.zeros((capacity, window), dtype=np.float32)
+        # number of updates every agent has been part of
+        self.counts_n = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, capacity: int):
+        def pad(arr):
+            padding = [(0, capacity - arr.shape[0])] + [(0, 0)] * (arr.ndim - 1)
+            return np.pad(arr, padding)
+        self.last_pos_n2 = pad(self.last_pos_n2)
+        self.last_t_n = pad(self.last_t_n)
+        self.speeds_nw = pad(self.speeds_nw)
+        self.accels_nw = pad(self.accels_nw)
+        self.counts_n = pad(self.counts_n)
+
+    def _rows_for(self, agent_names: list):
+        for name in agent_names:
+            if name not in self.agent_idx:
+                self.agent_idx[name] = len(self.agent_idx)
+        if len(self.agent_idx) > self.counts_n.shape[0]:
+            self._grow(2 * len(self.agent_idx))
+        return np.array([self.agent_idx[name] for name in agent_names],
+                        dtype=np.int64)
+
+    def update(self, sim_state: SimState):
+        """Update the speeds & accelerations of all the agents in sim_state"""
+        agents = get_all_agents(sim_state, include_robot=self.include_robot)
+        sim_t = sim_state.get_sim_t()
+        if len(agents) == 0:
+            self.sim_t = sim_t
+            return
+        names = list(agents.keys())
+        rows_n = self._rows_for(names)
+        pos_n2 = np.array([agents[name].get_current_config().to_3D_numpy()[:2]
+                           for name in names], dtype=np.float32)
+        seen_n = self.counts_n[rows_n] > 0
+        # agents that were not seen before start with no velocity (as in compute_agent_state_velocity)
+        delta_t_n = np.where(seen_n, sim_t - self.last_t_n[rows_n], 1.)
+        delta_t_n[delta_t_n == 0] = 1.
+        dist_n = np.linalg.norm(pos_n2 - self.last_pos_n2[rows_n], axis=1)
+        speed_n = np.where(seen_n, dist_n / delta_t_n, 0.)
+        prev_slot_n = (self.counts_n[rows_n] - 1) % self.window
+        prev_speed_n = self.speeds_nw[rows_n, prev_slot_n]
+        accel_n = np.where(seen_n, (speed_n - prev_speed_n) / delta_t_n, 0.)
+        # write into the ring buffers
+        slot_n = self.counts_n[rows_n] % self.window
+        self.speeds_nw[rows_n, slot_n] = speed_n
+        self.accels_nw[rows_n, slot_n] = accel_n
+        self.last_pos_n2[rows_n] = pos_n2
+        self.last_t_n[rows_n] = sim_t
+        self.counts_n[rows_n] += 1
+        self.num_updates += 1
+        self.sim_t = sim_t
+
+    def _latest(self, values_nw):
+        latest = {}
+        for name, row in self.agent_idx.items():
+            if self.counts_n[row] > 0:
+                slot = (self.counts_n[row] - 1) % self.window
+                latest[name] = float(values_nw[row, slot])
+        return latest
+
+    def _history(self, values_nw, agent_name: str):
+        row = self.agent_idx[agent_name]
+        count = self.counts_n[row]
+        if count <= self.window:
+            return values_nw[row, :count].copy()
+        # oldest to newest
+        return np.roll(values_nw[row], -(count % self.window))
+
+    def get_velocities(self):
+        """The latest speed of every tracked agent, keyed by name"""
+        return self._latest(self.speeds_nw)
+
+    def get_accelerations(self):
+        """The latest acceleration of every tracked agent, keyed by name"""
+        return self._latest(self.accels_nw)
+
+    def get_velocity_history(self, agent_name: str):
+        return self._history(self.speeds_nw, agent_name)
+
+    def get_acceleration_history(self, agent_name: str):
+        return self._history(self.accels_nw, agent_name)
+
+
+class SimStateHistory(object):
+    """A bounded (ring buffer) history of the latest (window) SimStates indexed
+    by their sim time, to be used in place of an ever-growing dict of SimStates.
+    The latest SimState is found in O(1) and the [x, y, theta] of its non ego
+    agents are extracted once on insertion so they can be shared by all the
+    objectives rather than re-extracted for every evaluation."""
+
+    def __init__(self, window: int = 100):
+        assert(window > 0)
+        self.window = window
+        self.sim_states = OrderedDict()  # oldest to newest insertion
+        self.agent_names = {}  # names of the non ego agents of every SimState
+        self.agent_pos_m3 = {}  # [x, y, theta] of the non ego agents of every SimState
+        self.latest_sim_t = None
+
+    def __setitem__(self, sim_t: float, sim_state: SimState):
+        if sim_t in self.sim_states:
+            del self.sim_states[sim_t]
+        self.sim_states[sim_t] = sim_state
+        agents = get_all_agents(sim_state)
+        self.agent_names[sim_t] = list(agents.keys())
+        self.agent_pos_m3[sim_t] = \
+            np.array([agent.get_pos3() for agent in agents.values()],
+                     dtype=np.float64).reshape((-1, 3))
+        if self.latest_sim_t is None or sim_t >= self.latest_sim_t:
+            self.latest_sim_t = sim_t
+        # drop the oldest SimStates outside of the window
+        while len(self.sim_states) > self.window:
+            old_sim_t, _ = self.sim_states.popitem(last=False)
+            del self.agent_names[old_sim_t]
+            del self.agent_pos_m3[old_sim_t]
+            if old_sim_t == self.latest_sim_t:
+                self.latest_sim_t = max(self.sim_states.keys())
+
+    def __getitem__(self, sim_t: float):
+        return self.sim_states[sim_t]
+
+    def __contains__(self, sim_t: float):
+        return sim_t in self.sim_states
+
+    def __len__(self):
+        return len(self.sim_states)
+
+    def __iter__(self):
+        return iter(self.sim_states)
+
+    def keys(self):
+        return self.sim_states.keys()
+
+    def values(self):
+        return self.sim_states.values()
+
+    def items(self):
+        return self.sim_states.items()
+
+    def latest(self):
+        """The SimState with the latest sim time (None if empty)"""
+        if self.latest_sim_t is None:
+            return None
+        return self.sim_states[self.latest_sim_t]
+
+    def get_agent_names(self, sim_t: float = None):
+        """Names of the non ego agents (in the order of get_agent_pos_m3) of the
+        SimState at sim_t, defaults to the latest SimState"""
+        return self.agent_names[self.latest_sim_t if sim_t is None else sim_t]
+
+    def get_agent_pos_m3(self, sim_t: float = None):
+        """[x, y, theta] of the non ego agents of the SimState at sim_t, defaults
+        to the latest SimState. NOTE: shared by all callers, do not modify"""
+        return self.agent_pos_m3[self.latest_sim_t if sim_t is None else sim_t]
@@ -137,6 +137,7 @@ class SimulatorHelper(object):
         return agent_collisions
 
     def loop_through_pedestrians(self, current_state: SimState):
+        running_agents = []
         for a in list(self.agents.values()):
             if a.get_end_acting():
                 if a.get_collided():
@@ -146,8 +147,13 @@ class SimulatorHelper(object):
                 self.num_timeout_agents -= 1  # decrement the timeout_agents counter
                 del(self.agents[a.get_name()])
                 del(a)
+            elif self.params.batch_agent_planning:
+                running_agents.append(a)
             else:
                 a.update(current_state)
+        if len(running_agents) > 0:
+            # plan for all the agents in one batched pass
+            Agent.update_batch(running_agents, current_state)
 
         for a in list(self.backstage_prerecs.values()):
             if (not a.get_end_acting()) and (a.get_start_time() <= Agent.sim_t < a.get_end_time()):
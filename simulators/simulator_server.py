@@ -0,0 +1,180 @@
+import os
+import json
+import copy
+import time
+import socket
+import threading
+import multiprocessing
+from queue import Queue, Empty
+from utils.utils import conn_recv, session_name
+from utils.utils import color_green, color_red, color_reset
+
+
+def run_episodes(p):
+    """Runs all the episodes in p.episode_params.tests for a single joystick,
+    communicating over the robot channel of p.robot_params.session_id
+    Args:
+        p (DotMap): the socnav params including the robot & episode params
+    """
+    # imported here so the server process itself stays lightweight
+    from agents.humans.human import Human
+    from agents.humans.recorded_human import PrerecordedHuman
+    from agents.robot_agent import RobotAgent
+    from simulators.simulator import Simulator
+    from utils.utils import construct_environment
+
+    RobotAgent.establish_joystick_handshake(p)
+
+    for test in list(p.episode_params.tests.keys()):
+        episode = p.episode_params.tests[test]
+        environment, r = construct_environment(p, test, episode)
+        simulator = Simulator(environment, renderer=r, episode_params=episode)
+        Human.generate(simulator, p, episode.agents_start, episode.agents_end,
+                       environment, r)
+        if not p.episode_params.without_robot:
+            RobotAgent.generate(simulator, p, episode.robot_start_goal)
+        for i, dataset in enumerate(episode.pedestrian_datasets):
+            PrerecordedHuman.generate(simulator, p, environment, r,
+                                      max_time=episode.max_time,
+                                      start_t=episode.datasets_start_t[i],
+                                      ped_range=episode.ped_ranges[i],
+                                      dataset=dataset
+                                      )
+        simulator.simulate()
+        simulator.render(r, None, filename=episode.name + "_obs")
+
+    if not p.episode_params.without_robot:
+        RobotAgent.close_robot_sockets()
+
+
+def _run_session(p, session_id, session_fn):
+    # every session process gets its own copy of the params and robot channel
+    p.robot_params.session_id = session_id
+    session_fn(p)
+
+
+class SimulatorServer(object):
+    """A single simulator host that accepts many joystick clients. Every client
+    is given its own episode session (and robot<->joystick channel) and the
+    sessions are scheduled across a pool of worker processes."""
+
+    def __init__(self, p, session_fn=run_episodes, verbose=True):
+        """
+        Args:
+            p (DotMap): the socnav params, must include robot_params and episode_params
+            session_fn (optional): the function run (in a worker process) for every session.
+                                   Defaults to run_episodes
+            verbose (bool, optional): Defaults to True.
+        """
+        self.p = p
+        self.session_fn = session_fn
+        self.verbose = verbose
+        self.server_ID = p.robot_params.server_ID
+        self.num_workers = p.robot_params.num_session_workers
+        self.server_socket = None
+        self.server_on = False
+        self.num_sessions = 0
+        # sessions waiting for a free worker
+        self.pending_sessions = Queue()
+        # the worker processes of the sessions that are currently running
+        self.active_sessions = {}
+        self.dispatcher_thread = None
+
+    def new_session_id(self):
+        # the pid keeps the socket paths unique across servers on the same machine
+        session_id = "%d-%d" % (os.getpid(), self.num_sessions)
+        self.num_sessions += 1
+        return session_id
+
+    def start(self):
+        if os.path.exists(self.server_ID):
+            os.remove(self.server_ID)
+        self.server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server_socket.bind(self.server_ID)
+        self.server_socket.listen(self.num_workers)
+        self.server_on = True
+        self.dispatcher_thread = threading.Thread(target=self.dispatch)
+        self.dispatcher_thread.start()
+        if self.verbose:
+            print("%sSimulator server listening at \"%s\" with %d workers%s" %
+                  (color_green, self.server_ID, self.num_workers, color_reset))
+
+    def serve_forever(self):
+        """Accepts session requests until the server is shut down"""
+        if not self.server_on:
+            self.start()
+        try:
+            while self.server_on:
+                self.accept_once()
+        except KeyboardInterrupt:
+            print("%sShutting down simulator server%s" %
+                  (color_red, color_reset))
+        finally:
+            self.shutdown()
+
+    def accept_once(self):
+        try:
+            connection, _ = self.server_socket.accept()
+        except OSError:
+            # server socket was closed
+            self.server_on = False
+            return None
+        data_b, response_len = conn_recv(connection)
+        session_id = None
+        if response_len > 0:
+            request = data_b.decode("utf-8")
+            if request.startswith("session"):
+                session_id = self.new_session_id()
+                # reply with the session's own socket identifiers
+                reply = json.dumps({
+                    'session_id': session_id,
+                    'recv_ID': session_name(self.p.robot_params.recv_ID, session_id),
+                    'send_ID': session_name(self.p.robot_params.send_ID, session_id)
+                })
+                connection.sendall(bytes(reply, "utf-8"))
+                self.pending_sessions.put(session_id)
+                if self.verbose:
+                    print("Scheduled session %s (%s)" % (session_id, request))
+        connection.close()
+        return session_id
+
+    def reap_sessions(self):
+        for session_id in list(self.active_sessions.keys()):
+            worker = self.active_sessions[session_id]
+            if not worker.is_alive():
+                worker.join()
+                del self.active_sessions[session_id]
+                if self.verbose:
+                    print("Session %s finished (exit code %s)" %
+                          (session_id, worker.exitcode))
+
+    def dispatch(self):
+        """Starts pending sessions whenever there is a free worker"""
+        while self.server_on:
+            self.reap_sessions()
+            if len(self.active_sessions) >= self.num_workers:
+                time.sleep(0.01)
+                continue
+            try:
+                session_id = self.pending_sessions.get(timeout=0.01)
+            except Empty:
+                continue
+            # NOTE: sessions are not daemonic so they may render in parallel themselves
+            worker = multiprocessing.Process(target=_run_session,
+                                             args=(copy.deepcopy(self.p),
+                                                   session_id,
+                                                   self.session_fn))
+            worker.start()
+            self.active_sessions[session_id] = worker
+
+    def shutdown(self):
+        self.server_on = False
+        if self.server_socket is not None:
+            self.server_socket.close()
+        if self.dispatcher_thread is not None:
+            self.dispatcher_thread.join()
+        for worker in self.active_sessions.values():
+            worker.join()
+        self.active_sessions = {}
+        if os.path.exists(self.server_ID):
+            os.remove(self.server_ID)
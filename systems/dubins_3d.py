@@ -35,6 +35,31 @@ class Dubins3D(DubinsCar):
         else:
             return x_nk3 + self._dt * delta_x_nk3
 
+    def simulate_into(self, x_n3, u_n2, out_n3, mode='ideal'):
+        if mode != 'ideal' or self.simulation_params.noise_params.is_noisy:
+            return super().simulate_into(x_n3, u_n2, out_n3, mode=mode)
+        # Same arithmetic as _simulate_ideal, one state dimension at a time
+        v_n = self._saturate_linear_velocity(u_n2[:, 0])
+        out_n3[:, 0] = x_n3[:, 0] + self._dt * (v_n * np.cos(x_n3[:, 2]))
+        out_n3[:, 1] = x_n3[:, 1] + self._dt * (v_n * np.sin(x_n3[:, 2]))
+        out_n3[:, 2] = x_n3[:, 2] + self._dt * self._saturate_angular_velocity(u_n2[:, 1])
+
+    def simulate_ideal_T(self, x_n13, u_nk2, T):
+        if self.simulation_params.noise_params.is_noisy:
+            return super().simulate_ideal_T(x_n13, u_nk2, T)
+        # The controls do not depend on the state, so the heading and then
+        # the position are cumulative sums of the (saturated) increments of
+        # every step. The initial state is the first term of each sum, so
+        # the additions happen in the same order as stepping the dynamics.
+        v_nk = self._saturate_linear_velocity(u_nk2[:, :T, 0])
+        w_nk = self._saturate_angular_velocity(u_nk2[:, :T, 1])
+        theta_nk = np.cumsum(np.concatenate([x_n13[:, :, 2], self._dt * w_nk], axis=1), axis=1)
+        x_nk = np.cumsum(np.concatenate([x_n13[:, :, 0], self._dt * (v_nk * np.cos(theta_nk[:, :T]))],
+                                        axis=1), axis=1)
+        y_nk = np.cumsum(np.concatenate([x_n13[:, :, 1], self._dt * (v_nk * np.sin(theta_nk[:, :T]))],
+                                        axis=1), axis=1)
+        return np.stack([x_nk, y_nk, theta_nk], axis=2)
+
     def jac_x(self, trajectory):
         x_nk3, u_nk2 = self.parse_trajectory(trajectory)
         # with tf.name_scope('jac_x'):
@@ -42,12 +67,12 @@ class Dubins3D(DubinsCar):
         update_nk3 = np.stack([-self._saturate_linear_velocity(u_nk2[:, :, 0]) * np.sin(x_nk3[:, :, 2]),
                                self._saturate_linear_velocity(
             u_nk2[:, :, 0]) * np.cos(x_nk3[:, :, 2]),
-            np.zeros(shape=x_nk3.shape[:2])], axis=2)
+            np.zeros(shape=x_nk3.shape[:2], dtype=x_nk3.dtype)], axis=2)
         update_nk33 = np.stack([np.zeros_like(x_nk3),
                                 np.zeros_like(x_nk3),
                                 update_nk3], axis=3)
         batch_shape = x_nk3.shape[:2]  # ????? tf.eye(2, batch_shape)
-        return np.eye(3) + self._dt * update_nk33
+        return np.eye(3, dtype=x_nk3.dtype) + self._dt * update_nk33
 
     def jac_u(self, trajectory):
         x_nk3, u_nk2 = self.parse_trajectory(trajectory)
@@ -56,7 +81,7 @@ class Dubins3D(DubinsCar):
             u_nk2[:, :, 0])
         wtilde_prime_nk = self._saturate_angular_velocity_prime(
             u_nk2[:, :, 1])
-        zeros_nk = np.zeros(shape=x_nk3.shape[:2], dtype=np.float32)
+        zeros_nk = np.zeros(shape=x_nk3.shape[:2], dtype=x_nk3.dtype)
 
         # Columns
         b1_nk3 = np.stack([vtilde_prime_nk * np.cos(x_nk3[:, :, 2]),
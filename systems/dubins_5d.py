@@ -34,6 +34,42 @@ class Dubins5D(DubinsCar):
                                       np.zeros_like(u_nkf)], axis=2)
         return x_new_nkd + self._dt * delta_x_nkd
 
+    def simulate_into(self, x_n5, u_n2, out_n5, mode='ideal'):
+        if mode != 'ideal':
+            return super().simulate_into(x_n5, u_n2, out_n5, mode=mode)
+        # Same arithmetic as _simulate_ideal, one state dimension at a time
+        # (the pose is updated last as it depends on the current velocities)
+        v_new_n = self._saturate_linear_velocity(x_n5[:, 3] + self._dt * u_n2[:, 0])
+        w_new_n = self._saturate_angular_velocity(x_n5[:, 4] + self._dt * u_n2[:, 1])
+        out_n5[:, 0] = x_n5[:, 0] + self._dt * (x_n5[:, 3] * np.cos(x_n5[:, 2]))
+        out_n5[:, 1] = x_n5[:, 1] + self._dt * (x_n5[:, 3] * np.sin(x_n5[:, 2]))
+        out_n5[:, 2] = x_n5[:, 2] + self._dt * x_n5[:, 4]
+        out_n5[:, 3] = v_new_n
+        out_n5[:, 4] = w_new_n
+
+    def simulate_ideal_T(self, x_n15, u_nk2, T):
+        # The velocities are saturated at every step, so they are still
+        # stepped through time (vectorized over the batch), while the heading
+        # and position are cumulative sums of the increments of every step
+        # (with the initial state as the first term, so the additions happen
+        # in the same order as stepping the dynamics)
+        dtype = np.result_type(x_n15, u_nk2)
+        # (time major buffers so that every step is contiguous)
+        v_kn = np.empty((T + 1, x_n15.shape[0]), dtype=dtype)
+        w_kn = np.empty((T + 1, x_n15.shape[0]), dtype=dtype)
+        v_kn[0], w_kn[0] = x_n15[:, 0, 3], x_n15[:, 0, 4]
+        a_kn, alpha_kn = u_nk2[:, :T, 0].T, u_nk2[:, :T, 1].T
+        for t in range(T):
+            v_kn[t + 1] = self._saturate_linear_velocity(v_kn[t] + self._dt * a_kn[t])
+            w_kn[t + 1] = self._saturate_angular_velocity(w_kn[t] + self._dt * alpha_kn[t])
+        v_nk, w_nk = v_kn.T, w_kn.T
+        theta_nk = np.cumsum(np.concatenate([x_n15[:, :, 2], self._dt * w_nk[:, :T]], axis=1), axis=1)
+        x_nk = np.cumsum(np.concatenate([x_n15[:, :, 0], self._dt * (v_nk[:, :T] * np.cos(theta_nk[:, :T]))],
+                                        axis=1), axis=1)
+        y_nk = np.cumsum(np.concatenate([x_n15[:, :, 1], self._dt * (v_nk[:, :T] * np.sin(theta_nk[:, :T]))],
+                                        axis=1), axis=1)
+        return np.stack([x_nk, y_nk, theta_nk, v_nk, w_nk], axis=2)
+
     def jac_x(self, trajectory):
         x_nk5, u_nk2 = self.parse_trajectory(trajectory)
         # with tf.name_scope('jac_x'):
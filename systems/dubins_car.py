@@ -1,6 +1,7 @@
 from systems.dynamics import Dynamics
 from trajectory.trajectory import Trajectory, SystemConfig
-from utils.angle_utils import angle_normalize, rotate_pos_nk2, padded_rotation_matrix
+from utils.angle_utils import angle_normalize, padded_rotation_matrix
+from utils.precision import get_float_dtype
 import numpy as np
 
 
@@ -26,17 +27,18 @@ class DubinsCar(Dynamics):
         raise NotImplementedError
 
     @staticmethod
-    def init_egocentric_robot_config(dt, n, v=0.0, w=0.0, dtype=np.float32):
+    def init_egocentric_robot_config(dt, n, v=0.0, w=0.0, dtype=None):
         """ A utility function initializing the robot at
         x=0, y=0, theta=0, v=v, w=w, a=0, alpha=0."""
         k = 1
+        dtype = get_float_dtype() if dtype is None else dtype
         position_nk2 = np.zeros((n, k, 2), dtype=dtype)
         heading_nk1 = np.zeros((n, k, 1), dtype=dtype)
         speed_nk1 = v * np.ones((n, k, 1), dtype=dtype)
         angular_speed_nk1 = w * np.ones((n, k, 1), dtype=dtype)
         return SystemConfig(dt=dt, n=n, k=k, position_nk2=position_nk2,
                             heading_nk1=heading_nk1, speed_nk1=speed_nk1,
-                            angular_speed_nk1=angular_speed_nk1, variable=False)
+                            angular_speed_nk1=angular_speed_nk1, variable=False, dtype=dtype)
 
     # TODO: Currently calling numpy() here as tfe.DEVICE_PLACEMENT_SILENT
     # is not working to place non-gpu ops (i.e. mod) on the cpu
@@ -47,11 +49,12 @@ class DubinsCar(Dynamics):
         ref_config is the origin. If mode is assign the result is assigned to traj_egocentric. If
         mode is new a new trajectory object is returned."""
 
-        ego_position_and_heading_nk3 = DubinsCar.convert_position_and_heading_to_ego_coordinates(
-            ref_config.position_and_heading_nk3(),
-            traj_world.position_and_heading_nk3())
-        position_nk2 = ego_position_and_heading_nk3[:, :, :2]
-        heading_nk1 = ego_position_and_heading_nk3[:, :, 2:3]
+        # in assign mode the results are written straight into the buffers of traj_egocentric (when possible)
+        position_out_nk2, heading_out_nk1 = DubinsCar._assign_buffers(traj_world, traj_egocentric, mode)
+        position_nk2, heading_nk1 = DubinsCar.ego_position_and_heading_into(
+            ref_config.position_nk2(), ref_config.heading_nk1(),
+            traj_world.position_nk2(), traj_world.heading_nk1(),
+            position_out_nk2=position_out_nk2, heading_out_nk1=heading_out_nk1)
 
         # Either assign the results to tfe.Variables or
         # create a new trajectory object (use this mode to
@@ -88,11 +91,12 @@ class DubinsCar(Dynamics):
         ref_config is the origin of the egocentric coordinate frame
         in the world coordinate frame. If mode is assign the result is assigned to
         traj_world, else a new trajectory object is created"""
-        world_position_and_heading_nk3 = DubinsCar.convert_position_and_heading_to_world_coordinates(
-            ref_config.position_and_heading_nk3(),
-            traj_egocentric.position_and_heading_nk3())
-        position_nk2 = world_position_and_heading_nk3[:, :, :2]
-        heading_nk1 = world_position_and_heading_nk3[:, :, 2:3]
+        # in assign mode the results are written straight into the buffers of traj_world (when possible)
+        position_out_nk2, heading_out_nk1 = DubinsCar._assign_buffers(traj_egocentric, traj_world, mode)
+        position_nk2, heading_nk1 = DubinsCar.world_position_and_heading_into(
+            ref_config.position_nk2(), ref_config.heading_nk1(),
+            traj_egocentric.position_nk2(), traj_egocentric.heading_nk1(),
+            position_out_nk2=position_out_nk2, heading_out_nk1=heading_out_nk1)
 
         # Either assign the results to tfe.Variables or
         # create a new trajectory object (use this mode to
@@ -134,8 +138,7 @@ class DubinsCar(Dynamics):
         rot_matrix_nkdd = padded_rotation_matrix(
             theta_n11, shape=(n, k, d), lower_identity=True)
         if mode == 'assign':
-            np.concatenate(K_world_nkfd, np.matmul(
-                K_egocentric_nkfd, rot_matrix_nkdd))
+            np.matmul(K_egocentric_nkfd, rot_matrix_nkdd, out=K_world_nkfd)
         else:
             K_world_nkfd = np.matmul(K_egocentric_nkfd, rot_matrix_nkdd)
         return K_world_nkfd
@@ -145,28 +148,24 @@ class DubinsCar(Dynamics):
         """ Converts LQR Feedback matrix K_world_nkfd (n=batch size, k=time, f=action size, d=state size) 
         to the egocentric coordinate frame assuming ref_config is the origin of the egocentric coordinate frame
         in the world coordinate frame. If mode is assign the result is assigned to
-        K_world_nkfd, else a new tensor is created."""
+        K_egocentric_nkfd, else a new tensor is created."""
         theta_n11 = ref_config.heading_nk1()
-        n, k, f, d = [x.value for x in K_world_nkfd.shape]
+        n, k, f, d = [x for x in K_world_nkfd.shape]
         rot_matrix_nkdd = padded_rotation_matrix(
             theta_n11, shape=(n, k, d), lower_identity=True)
         if mode == 'assign':
-            np.concatenate(K_world_nkfd, np.matmul(
-                K_world_nkfd, rot_matrix_nkdd))
+            np.matmul(K_world_nkfd, rot_matrix_nkdd, out=K_egocentric_nkfd)
         else:
-            K_world_nkfd = np.matmul(K_world_nkfd, rot_matrix_nkdd)
-        return K_world_nkfd
+            K_egocentric_nkfd = np.matmul(K_world_nkfd, rot_matrix_nkdd)
+        return K_egocentric_nkfd
 
     @staticmethod
     def convert_position_and_heading_to_ego_coordinates(ref_position_and_heading_n13,
                                                         world_position_and_heading_nk3):
         """ Converts a sequence of position and headings to the ego frame."""
-        position_nk2 = world_position_and_heading_nk3[:,
-                                                      :, :2] - ref_position_and_heading_n13[:, :, :2]
-        position_nk2 = rotate_pos_nk2(
-            position_nk2, -ref_position_and_heading_n13[:, :, 2:3])
-        heading_nk1 = angle_normalize(world_position_and_heading_nk3[:, :, 2:3] -
-                                      ref_position_and_heading_n13[:, :, 2:3])
+        position_nk2, heading_nk1 = DubinsCar.ego_position_and_heading_into(
+            ref_position_and_heading_n13[:, :, :2], ref_position_and_heading_n13[:, :, 2:3],
+            world_position_and_heading_nk3[:, :, :2], world_position_and_heading_nk3[:, :, 2:3])
         return np.concatenate([position_nk2, heading_nk1], axis=2)
 
     @staticmethod
@@ -175,18 +174,65 @@ class DubinsCar(Dynamics):
         """ Converts a sequence of position and headings to the world frame.
         the ref_position_and_heading_n13 is the base parameters for the world frame [0,0,0]
         """
-        position_nk2 = rotate_pos_nk2(
-            ego_position_and_heading_nk3[:, :, :2], ref_position_and_heading_n13[:, :, 2:3])
-        # x and y coordinates
-        ref_position_n12 = ref_position_and_heading_n13[:, :, :2]
-        ref_position_0 = ref_position_n12[0]
-        ref_position_nk2 = np.broadcast_to(
-            ref_position_0, ego_position_and_heading_nk3[:, :, :2].shape)
-        ref_heading_n11 = ref_position_and_heading_n13[:, :, 2:3]
-        ref_heading_0 = ref_heading_n11[0]
-        ref_heading_nk1 = np.broadcast_to(
-            ref_heading_0, ego_position_and_heading_nk3[:, :, 2:3].shape)
-        position_nk2 = position_nk2 + ref_position_nk2
-        heading_nk1 = angle_normalize(
-            ego_position_and_heading_nk3[:, :, 2:3] + ref_heading_nk1)
+        position_nk2, heading_nk1 = DubinsCar.world_position_and_heading_into(
+            ref_position_and_heading_n13[:, :, :2], ref_position_and_heading_n13[:, :, 2:3],
+            ego_position_and_heading_nk3[:, :, :2], ego_position_and_heading_nk3[:, :, 2:3])
         return np.concatenate([position_nk2, heading_nk1], axis=2)
+
+    @staticmethod
+    def _rotation_matrix_22(theta, dtype):
+        """ The (transposed) 2d rotation matrix by theta, i.e. pos_nk2 @ rot_22 rotates every position."""
+        cos, sin = np.cos(theta), np.sin(theta)
+        return np.array([[cos, sin], [-sin, cos]], dtype=dtype)
+
+    @staticmethod
+    def _assign_buffers(traj_in, traj_out, mode):
+        """ The position and heading arrays of traj_out if the results of converting traj_in can be written
+        into them (else None). Only arrays owned by traj_out (not views of other arrays) are written to."""
+        if mode != 'assign':
+            return None, None
+
+        def buffer(arr, shape):
+            if isinstance(arr, np.ndarray) and arr.shape == shape and arr.base is None and arr.flags.writeable:
+                return arr
+            return None
+        return buffer(traj_out.position_nk2(), traj_in.position_nk2().shape), \
+            buffer(traj_out.heading_nk1(), traj_in.heading_nk1().shape)
+
+    @staticmethod
+    def world_position_and_heading_into(ref_position_n12, ref_heading_n11, position_nk2, heading_nk1,
+                                        position_out_nk2=None, heading_out_nk1=None):
+        """ Converts the egocentric positions and headings to the world frame of (the first of) the reference
+        configurations, writing into position_out_nk2 and heading_out_nk1 (which may be the inputs) without any
+        intermediate arrays. The outputs are allocated if not given. When all the inputs are float32 the whole
+        conversion is done in float32."""
+        dtype = np.result_type(position_nk2, ref_position_n12)
+        if position_out_nk2 is None:
+            position_out_nk2 = np.empty(position_nk2.shape, dtype=dtype)
+        if heading_out_nk1 is None:
+            heading_out_nk1 = np.empty(heading_nk1.shape, dtype=np.result_type(heading_nk1, ref_heading_n11))
+        rot_22 = DubinsCar._rotation_matrix_22(ref_heading_n11[0, 0, 0], dtype)
+        np.matmul(position_nk2, rot_22, out=position_out_nk2)
+        position_out_nk2 += ref_position_n12[0]
+        np.add(heading_nk1, ref_heading_n11[0], out=heading_out_nk1)
+        angle_normalize(heading_out_nk1, out=heading_out_nk1)
+        return position_out_nk2, heading_out_nk1
+
+    @staticmethod
+    def ego_position_and_heading_into(ref_position_n12, ref_heading_n11, position_nk2, heading_nk1,
+                                      position_out_nk2=None, heading_out_nk1=None):
+        """ Converts the world positions and headings to the egocentric frame of the reference configurations,
+        writing into position_out_nk2 and heading_out_nk1 (see world_position_and_heading_into)."""
+        dtype = np.result_type(position_nk2, ref_position_n12)
+        if position_out_nk2 is None:
+            position_out_nk2 = np.empty(np.broadcast_shapes(position_nk2.shape, ref_position_n12.shape),
+                                        dtype=dtype)
+        if heading_out_nk1 is None:
+            heading_out_nk1 = np.empty(np.broadcast_shapes(heading_nk1.shape, ref_heading_n11.shape),
+                                       dtype=np.result_type(heading_nk1, ref_heading_n11))
+        rot_22 = DubinsCar._rotation_matrix_22(-ref_heading_n11[0, 0, 0], dtype)
+        np.subtract(position_nk2, ref_position_n12, out=position_out_nk2)
+        np.matmul(position_out_nk2, rot_22, out=position_out_nk2)
+        np.subtract(heading_nk1, ref_heading_n11, out=heading_out_nk1)
+        angle_normalize(heading_out_nk1, out=heading_out_nk1)
+        return position_out_nk2, heading_out_nk1
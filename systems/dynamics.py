@@ -45,6 +45,15 @@ class Dynamics(object):
         """
         raise NotImplementedError
 
+    def simulate_into(self, x_nd, u_nf, out_nd, mode='ideal'):
+        """
+        Apply one action u_nf from state x_nd (without the time dimension),
+        writing the next state into out_nd (e.g. a time slice of a
+        preallocated state buffer). Subclasses can override this to step
+        without allocating intermediate arrays.
+        """
+        out_nd[...] = self.simulate(x_nd[:, None], u_nf[:, None], mode=mode)[:, 0]
+
     def _simulate_realistic(self, x_nkd, u_nkf, t=None):
         """
         Apply one action u from state x using realistic system dynamics.
@@ -58,14 +67,32 @@ class Dynamics(object):
         Apply T actions from state x_n1d
         return the resulting trajectory object.
         """
-        states = [x_n1d * 1.]
-        for t in range(T):
-            x_n1d = self.simulate(x_n1d, u_nkf[:, t:t + 1], mode=mode)
-            states.append(x_n1d)
-        trajectory = self.assemble_trajectory(np.concatenate(states, axis=1), u_nkf,
+        if mode == 'ideal':
+            # (there are no more states than actions to apply)
+            x_nkd = self.simulate_ideal_T(x_n1d, u_nkf, min(T, u_nkf.shape[1]))
+        else:
+            states = [x_n1d * 1.]
+            for t in range(T):
+                x_n1d = self.simulate(x_n1d, u_nkf[:, t:t + 1], mode=mode)
+                states.append(x_n1d)
+            x_nkd = np.concatenate(states, axis=1)
+        trajectory = self.assemble_trajectory(x_nkd, u_nkf,
                                               pad_mode=pad_mode)
         return trajectory
 
+    def simulate_ideal_T(self, x_n1d, u_nkf, T):
+        """
+        Apply the first T actions of u_nkf from state x_n1d using ideal
+        system dynamics, returning the T + 1 states x_nkd. Steps one
+        action at a time, subclasses with a closed form rollout override this.
+        """
+        x_nkd = np.empty((x_n1d.shape[0], T + 1, x_n1d.shape[2]),
+                         dtype=np.result_type(x_n1d, u_nkf))
+        x_nkd[:, 0] = x_n1d[:, 0]
+        for t in range(T):
+            self.simulate_into(x_nkd[:, t], u_nkf[:, t], x_nkd[:, t + 1], mode='ideal')
+        return x_nkd
+
     def affine_factors(self, trajectory_hat):
         A = self.jac_x(trajectory_hat)
         B = self.jac_u(trajectory_hat)
@@ -100,14 +127,14 @@ class Dynamics(object):
         n = u_nkf.shape[0]
         if pad_mode == 'zero':  # the last action is 0
             if u_nkf.shape[1] + 1 == k:
-                u_nkf = np.concatenate([u_nkf, np.zeros((n, 1, self._u_dim))],
+                u_nkf = np.concatenate([u_nkf, np.zeros((n, 1, self._u_dim), dtype=u_nkf.dtype)],
                                        axis=1)
             else:
                 assert(u_nkf.shape[1] == k)
         # the last action is the same as the second to last action
         elif pad_mode == 'repeat':
             if u_nkf.shape[1] + 1 == k:
-                u_end_n12 = np.zeros((n, 1, self._u_dim)) + u_nkf[:, -1:]
+                u_end_n12 = np.zeros((n, 1, self._u_dim), dtype=u_nkf.dtype) + u_nkf[:, -1:]
                 u_nkf = np.concatenate([u_nkf, u_end_n12], axis=1)
             else:
                 assert(u_nkf.shape[1] == k)
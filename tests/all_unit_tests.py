@@ -1,3 +1,5 @@
+from unit_tests.test_agent_log_writer import main_test as test_agent_log_writer
+from unit_tests.test_asym_gauss_kernel import main_test as test_asym_gauss_kernel
 from unit_tests.test_coordinate_transform import main_test as test_coordinate_transform
 from unit_tests.test_cost_function import main_test as test_cost_function
 from unit_tests.test_costs import main_test as test_cost
@@ -6,15 +8,25 @@ from unit_tests.test_fmm_map import main_test as test_fmm_map
 from unit_tests.test_goal_angle_objective import main_test as test_goal_angle
 from unit_tests.test_goal_distance_objective import main_test as test_goal_distance
 from unit_tests.test_image_space_grid import main_test as test_image_space_grid
+from unit_tests.test_joystick_record import main_test as test_joystick_record
+from unit_tests.test_kinematics_tracker import main_test as test_kinematics_tracker
 from unit_tests.test_lqr import main_test as test_lqr
 from unit_tests.test_obstacle_map import main_test as test_obstacle_map
 from unit_tests.test_obstacle_objective import main_test as test_obstacle_objective
+from unit_tests.test_objective_function import main_test as test_objective_function
+from unit_tests.test_pipeline_store import main_test as test_pipeline_store
+from unit_tests.test_precision import main_test as test_precision
+from unit_tests.test_sampling_planner import main_test as test_sampling_planner
+from unit_tests.test_simulator_server import main_test as test_simulator_server
 from unit_tests.test_spline import main_test as test_spline
 from unit_tests.test_voxel_interpolation import main_test as test_voxel_interpolation
+from unit_tests.test_waypoint_index import main_test as test_waypoint_index
 from unit_tests.test_personal_cost import main_test as test_goal_psc
 from utils.utils import color_reset, color_green
 
 if __name__ == '__main__':
+    test_agent_log_writer()
+    test_asym_gauss_kernel()
     test_coordinate_transform()
     test_cost_function()
     test_cost()
@@ -24,9 +36,17 @@ if __name__ == '__main__':
     test_goal_distance()
     test_goal_psc()
     test_image_space_grid()
+    test_joystick_record()
+    test_kinematics_tracker()
     test_lqr()
     test_obstacle_map()
     test_obstacle_objective()
+    test_objective_function()
+    test_pipeline_store()
+    test_precision()
+    test_sampling_planner()
+    test_simulator_server()
     test_spline()
     test_voxel_interpolation()
+    test_waypoint_index()
     print("%s\nAll tests passed!%s" % (color_green, color_reset))
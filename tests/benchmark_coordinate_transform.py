@@ -0,0 +1,38 @@
+import timeit
+import tracemalloc
+import numpy as np
+from systems.dubins_car import DubinsCar
+from trajectory.trajectory import Trajectory, SystemConfig
+
+
+def peak_allocation(fn):
+    """Peak memory (in bytes) allocated by one call of fn"""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark_coordinate_transform(n=600, k=80, number=50):
+    """Converting n trajectories of k steps to the world frame by writing into the buffers of an existing trajectory
+    (mode='assign') vs creating a new trajectory (mode='new')"""
+    for dtype in [np.float32, np.float64]:
+        traj_egocentric = Trajectory(dt=.05, n=n, k=k, dtype=dtype,
+                                     position_nk2=np.random.uniform(-3., 3., size=(n, k, 2)),
+                                     heading_nk1=np.random.uniform(-np.pi, np.pi, size=(n, k, 1)))
+        ref_config = SystemConfig(dt=.05, n=1, k=1, dtype=dtype, position_nk2=np.array([[[2., 3.]]]),
+                                  heading_nk1=np.array([[[.7]]]))
+        traj_world = Trajectory(dt=.05, n=n, k=k, dtype=dtype, variable=True)
+        for mode in ['assign', 'new']:
+            def transform():
+                DubinsCar.to_world_coordinates(ref_config, traj_egocentric, traj_world, mode=mode)
+            transform()
+            print("%s %s: %.3f ms, %.1f KB allocated" %
+                  (np.dtype(dtype).name, mode, 1e3 * timeit.timeit(transform, number=number) / number,
+                   peak_allocation(transform) / 1e3))
+
+
+if __name__ == '__main__':
+    np.random.seed(seed=1)
+    benchmark_coordinate_transform()
@@ -0,0 +1,21 @@
+import random
+from simulators.simulator_server import SimulatorServer
+from params.central_params import get_seed
+from test_episodes import create_params
+
+# seed the random number generator
+random.seed(get_seed())
+
+
+def test_server():
+    """
+    Hosts the episodes for many joystick clients at once, each joystick
+    (with use_server=True) runs all the episodes in its own session.
+    """
+    p = create_params()  # same params as the single joystick test_episodes
+    server = SimulatorServer(p)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    test_server()
@@ -0,0 +1,50 @@
+import os
+import csv
+import time
+import shutil
+import tempfile
+from utils.utils import color_green, color_reset
+
+
+def read_csv(abs_path):
+    with open(abs_path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_agent_log_writer():
+    from joystick.joystick_py.joystick_logger import AgentLogWriter
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        # rows logged over several flush intervals are all written, in order
+        abs_path = os.path.join(tmp_dir, 'agent_data.csv')
+        writer = AgentLogWriter(abs_path, flush_interval_s=0.02, flush_rows=7)
+        expected_rows = []
+        for i in range(10):
+            rows = [(0.05 * i, 'prerec_%d' % j, float(i), float(j), 0.1 * j) for j in range(3)]
+            writer.log(rows)
+            writer.log([])
+            expected_rows += [[str(value) for value in row] for row in rows]
+            time.sleep(0.01)
+        writer.close()
+        assert(not writer.writer_thread.is_alive())
+        lines = read_csv(abs_path)
+        assert(lines[0] == AgentLogWriter.columns)
+        assert(writer.num_rows == len(expected_rows) == len(lines) - 1)
+        assert(lines[1:] == expected_rows)
+
+        # a new log of the same file starts over, closing with nothing queued leaves just the header
+        writer = AgentLogWriter(abs_path, flush_interval_s=0.02)
+        writer.close()
+        assert(writer.num_rows == 0)
+        assert(read_csv(abs_path) == [AgentLogWriter.columns])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main_test():
+    test_agent_log_writer()
+    print("%sAgent log writer tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
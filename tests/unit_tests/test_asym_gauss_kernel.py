@@ -0,0 +1,50 @@
+import numpy as np
+from metrics.asym_gauss_kernel import AsymGaussKernel
+from metrics.cost_functions import asym_gauss
+from utils.utils import color_green, color_reset
+
+
+def test_asym_gauss_kernel():
+    # The kernel of every agent matches asym_gauss at every point
+    np.random.seed(seed=1)
+    m, p = 7, 2000
+    pos_m3 = np.random.uniform(-3., 3., size=(m, 3))
+    sig_theta_m = np.random.uniform(0.5, 2., size=m)
+    x_p, y_p = np.random.uniform(-5., 5., size=p), np.random.uniform(-5., 5., size=p)
+    expected_pm = asym_gauss(x_p[:, None], y_p[:, None], theta=pos_m3[:, 2], sig_theta=sig_theta_m,
+                             xc=pos_m3[:, 0], yc=pos_m3[:, 1])
+
+    kernel = AsymGaussKernel(pos_m3, sig_theta_m=sig_theta_m)
+    values_pm = kernel.evaluate(x_p, y_p)
+    assert(values_pm.shape == (p, m) and values_pm.dtype == np.float64)
+    assert(np.allclose(values_pm, expected_pm, rtol=0., atol=1e-12))
+    assert(np.allclose(kernel.evaluate_sum(x_p, y_p), np.sum(expected_pm, axis=1)))
+
+    # per point variances
+    sig_theta_p = np.random.uniform(0.5, 2., size=p)
+    expected_pm = asym_gauss(x_p[:, None], y_p[:, None], theta=pos_m3[:, 2], sig_theta=sig_theta_p[:, None],
+                             xc=pos_m3[:, 0], yc=pos_m3[:, 1])
+    values_pm = AsymGaussKernel(pos_m3).evaluate(x_p, y_p, sig_theta=sig_theta_p[:, None])
+    assert(np.allclose(values_pm, expected_pm, rtol=0., atol=1e-12))
+
+    # only some (agent, point) pairs
+    agent_idxs_p = np.random.randint(0, m, size=p)
+    values_p = kernel.evaluate_pairs(x_p, y_p, agent_idxs_p)
+    assert(np.allclose(values_p, kernel.evaluate(x_p, y_p)[np.arange(p), agent_idxs_p]))
+
+    # float32 and the lookup table of exp
+    values32_pm = AsymGaussKernel(pos_m3, sig_theta_m=sig_theta_m, dtype=np.float32).evaluate(x_p, y_p)
+    assert(values32_pm.dtype == np.float32)
+    assert(np.allclose(values32_pm, kernel.evaluate(x_p, y_p), rtol=0., atol=1e-5))
+    lut_kernel = AsymGaussKernel(pos_m3, sig_theta_m=sig_theta_m, lut_size=1024)
+    assert(np.max(np.abs(lut_kernel.evaluate(x_p, y_p) - kernel.evaluate(x_p, y_p))) <= lut_kernel.lut_max_error)
+    assert(AsymGaussKernel(np.zeros((0, 3)), sig_theta_m=1.).evaluate_sum(x_p, y_p).shape == (p,))
+
+
+def main_test():
+    test_asym_gauss_kernel()
+    print("%sAsymmetric gaussian kernel tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
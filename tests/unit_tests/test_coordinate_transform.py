@@ -2,6 +2,7 @@ import numpy as np
 from utils.angle_utils import rotate_pos_nk2, angle_normalize
 from utils import utils
 from systems.dubins_v1 import DubinsV1
+from systems.dubins_car import DubinsCar
 from trajectory.trajectory import Trajectory, SystemConfig
 import matplotlib.pyplot as plt
 from dotmap import DotMap
@@ -95,6 +96,44 @@ def test_coordinate_transform():
                        traj_global_new.position_nk2()))
 
 
+def test_coordinate_transform_into():
+    # Assigning writes into the buffers of the target trajectory (in float32) with the same results as new objects
+    n, k, dt = 20, 15, .1
+    traj_egocentric = Trajectory(dt=dt, n=n, k=k,
+                                 position_nk2=np.random.uniform(-3., 3., size=(n, k, 2)),
+                                 heading_nk1=np.random.uniform(-np.pi, np.pi, size=(n, k, 1)))
+    ref_config = SystemConfig(dt=dt, n=1, k=1, position_nk2=np.array([[[2., -1.]]], dtype=np.float32),
+                              heading_nk1=np.array([[[2.5]]], dtype=np.float32))
+    traj_world = Trajectory(dt=dt, n=n, k=k, variable=True)
+    position_nk2, heading_nk1 = traj_world.position_nk2(), traj_world.heading_nk1()
+    DubinsCar.to_world_coordinates(ref_config, traj_egocentric, traj_world, mode='assign')
+    assert(traj_world.position_nk2() is position_nk2 and traj_world.heading_nk1() is heading_nk1)
+    assert(position_nk2.dtype == np.float32 and heading_nk1.dtype == np.float32)
+    expected_world = DubinsCar.to_world_coordinates(ref_config, traj_egocentric, mode='new')
+    assert(np.array_equal(traj_world.position_and_heading_nk3(), expected_world.position_and_heading_nk3()))
+    assert(np.allclose(traj_world.speed_nk1(), traj_egocentric.speed_nk1()))
+
+    # and back (in place)
+    DubinsCar.to_egocentric_coordinates(ref_config, traj_world, traj_world, mode='assign')
+    assert(traj_world.position_nk2() is position_nk2)
+    assert(np.allclose(traj_world.position_nk2(), traj_egocentric.position_nk2(), atol=1e-5))
+    assert(np.allclose(np.cos(traj_world.heading_nk1() - traj_egocentric.heading_nk1()), 1.))
+
+    # views of other arrays are never written to
+    view_config = traj_world[0]
+    DubinsCar.to_world_coordinates(ref_config, traj_egocentric[1], view_config, mode='assign')
+    assert(np.allclose(traj_world.position_nk2(), traj_egocentric.position_nk2(), atol=1e-5))
+
+    # feedback matrices
+    K_egocentric_nkfd = np.random.uniform(-1., 1., size=(1, k, 2, 3)).astype(np.float32)
+    K_world_nkfd = np.zeros_like(K_egocentric_nkfd)
+    DubinsCar.convert_K_to_world_coordinates(ref_config, K_egocentric_nkfd, K_world_nkfd, mode='assign')
+    assert(np.array_equal(K_world_nkfd, DubinsCar.convert_K_to_world_coordinates(ref_config, K_egocentric_nkfd,
+                                                                                  mode='new')))
+    K_back_nkfd = DubinsCar.convert_K_to_egocentric_coordinates(ref_config, K_world_nkfd, mode='new')
+    assert(np.allclose(K_back_nkfd, K_egocentric_nkfd, atol=1e-6))
+
+
 def visualize_coordinate_transform():
     """Visual sanity check that coordinate transforms
     are working. """
@@ -198,6 +237,7 @@ def main_test():
     plt.style.use('ggplot')
     test_rotate()
     test_coordinate_transform()
+    test_coordinate_transform_into()
     test_lqr_feedback_coordinate_transform()
     print("%sCoordinate transform tests passed!%s" %
           (color_green, color_reset))
@@ -270,11 +270,44 @@ def test_dubins_v3():
     assert(np.allclose(B2, B2_c))
 
 
+def test_simulate_into():
+    # Stepping into a preallocated buffer matches simulate
+    np.random.seed(seed=1)
+    dt, n = .1, 30
+    for db in [DubinsV1(dt, create_system_dynamics_params()),
+               DubinsV2(dt, create_system_dynamics_params()),
+               DubinsV3(dt, create_system_dynamics_params())]:
+        x_nd = np.random.uniform(-1., 1., size=(n, db._x_dim)).astype(np.float32)
+        u_nf = np.random.uniform(-1.5, 1.5, size=(n, db._u_dim)).astype(np.float32)
+        x_next_nd = np.empty_like(x_nd)
+        db.simulate_into(x_nd, u_nf, x_next_nd)
+        expected_x_next_nd = db.simulate(x_nd[:, None], u_nf[:, None])[:, 0]
+        assert(np.array_equal(x_next_nd, expected_x_next_nd))
+
+
+def test_simulate_ideal_T():
+    # The closed form rollouts match stepping the dynamics one action at a time
+    np.random.seed(seed=1)
+    dt, n, k = .1, 30, 25
+    for db in [DubinsV1(dt, create_system_dynamics_params()),
+               DubinsV2(dt, create_system_dynamics_params()),
+               DubinsV3(dt, create_system_dynamics_params())]:
+        x_n1d = np.random.uniform(-1., 1., size=(n, 1, db._x_dim)).astype(np.float32)
+        u_nkf = np.random.uniform(-1.5, 1.5, size=(n, k, db._u_dim)).astype(np.float32)
+        states = [x_n1d]
+        for t in range(k - 1):
+            states.append(db.simulate(states[-1], u_nkf[:, t:t + 1]))
+        x_nkd = db.simulate_ideal_T(x_n1d, u_nkf, T=k - 1)
+        assert(np.array_equal(x_nkd, np.concatenate(states, axis=1)))
+
+
 def main_test():
     test_dubins_v1(visualize=False)
     test_custom_dubins_v1()
     test_dubins_v2(visualize=False)
     test_dubins_v3()
+    test_simulate_into()
+    test_simulate_ideal_T()
     print("%sDynamics tests passed!%s" % (color_green, color_reset))
 
 
@@ -37,9 +37,54 @@ def test_fmm_map():
     assert np.sum(abs(expected_angles - angles) <= 0.01) == 6
 
 
+def test_fmm_map_cache():
+    from utils.fmm_map import FmmMap
+    from utils.fmm_map_cache import FmmMapCache
+    map_size_2, dx = np.array([40, 30]), 0.1
+    mask_grid_mn = np.zeros((30, 40))
+    mask_grid_mn[10:20, 15] = 1.
+
+    def create(goal, cache):
+        return FmmMap.create_fmm_map_based_on_goal_position(goal_positions_n2=np.array([goal]),
+                                                            map_size_2=map_size_2, dx=dx,
+                                                            mask_grid_mn=mask_grid_mn, cache=cache)
+    uncached = create([3., 2.], None)
+    # maps of the same goal cell share the same (read only) arrays
+    cache = FmmMapCache()
+    fmm_map, same_cell_map = create([3., 2.], cache), create([3.02, 2.03], cache)
+    assert(cache.misses == 1 and cache.hits == 1 and len(cache) == 1)
+    assert(same_cell_map.fmm_distance_map.voxel_function_mn is fmm_map.fmm_distance_map.voxel_function_mn)
+    assert(not fmm_map.fmm_angle_map.voxel_function_mn.flags.writeable)
+    assert(np.array_equal(fmm_map.fmm_distance_map.voxel_function_mn, uncached.fmm_distance_map.voxel_function_mn))
+    assert(np.array_equal(fmm_map.fmm_angle_map.voxel_function_mn, uncached.fmm_angle_map.voxel_function_mn))
+    # changing the goal uses (or fills) the cache
+    same_cell_map.change_goal(np.array([[1., 1.]]))
+    assert(cache.misses == 2 and len(cache) == 2)
+    assert(cache.nbytes == 2 * 2 * fmm_map.fmm_distance_map.voxel_function_mn.nbytes)
+
+    # the least recently used maps are evicted (by bytes)
+    cache = FmmMapCache(max_bytes=2 * 2 * uncached.fmm_distance_map.voxel_function_mn.nbytes)
+    for goal in [[3., 2.], [1., 1.], [3., 2.], [2., 1.]]:
+        create(goal, cache)
+    assert(len(cache) == 2 and cache.hits == 1 and cache.nbytes <= cache.max_bytes)
+    create([3., 2.], cache)
+    create([1., 1.], cache)
+    assert(cache.hits == 2 and cache.misses == 4)
+
+    # and reloaded from disk if saved there
+    import tempfile
+    with tempfile.TemporaryDirectory() as cache_dir:
+        create([3., 2.], FmmMapCache(cache_dir=cache_dir))
+        cache = FmmMapCache(cache_dir=cache_dir)
+        fmm_map = create([3., 2.], cache)
+        assert(cache.hits == 1 and cache.misses == 0)
+        assert(np.array_equal(fmm_map.fmm_distance_map.voxel_function_mn, uncached.fmm_distance_map.voxel_function_mn))
+
+
 def main_test():
     np.random.seed(seed=1)
     test_fmm_map()
+    test_fmm_map_cache()
     print("%sFmm_map tests passed!%s" % (color_green, color_reset))
 
 
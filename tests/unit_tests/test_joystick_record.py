@@ -0,0 +1,84 @@
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+from dotmap import DotMap
+from utils.utils import color_green, color_reset
+
+
+class StubRobot(object):
+    """Just the fields of a RobotAgent that recording and replaying the joystick messages use"""
+
+    def __init__(self, joystick_record=None):
+        self.joystick_record = joystick_record
+        self.joystick_inputs = []
+        self.num_cmds_per_batch = 1
+        self.end_acting = False
+
+    @property
+    def sim_t(self):
+        from agents.agent import Agent
+        return Agent.sim_t
+
+    def get_end_acting(self):
+        return self.end_acting
+
+
+def test_joystick_record():
+    from agents.agent import Agent
+    from agents.robot_utils import open_joystick_record, record_joystick_data, \
+        load_joystick_record, replay_joystick_data
+    sim_t, sim_dt = Agent.sim_t, Agent.sim_dt
+    tmp_dir = tempfile.mkdtemp()
+    robot_params = DotMap(joystick_record_dir=tmp_dir)
+    try:
+        # record the messages received at every sim_t
+        Agent.set_sim_dt(0.05)
+        robot = StubRobot(open_joystick_record(robot_params, 'episode'))
+        messages = {}
+        for i in range(5):
+            Agent.set_sim_t(i * 0.05)
+            messages[i * 0.05] = json.dumps({'j_input': [[0.1 * i, 0.], [0.1 * i, 0.01]]})
+            record_joystick_data(robot, messages[i * 0.05])
+        robot.joystick_record.close()
+        records = load_joystick_record(robot_params, 'episode')
+        assert([record['sim_t'] for record in records] == list(messages.keys()))
+
+        # replaying feeds every message to the robot only once the simulator reaches its sim_t
+        Agent.set_sim_t(0.)
+        robot = StubRobot()
+        replay_thread = threading.Thread(target=replay_joystick_data,
+                                         args=(robot, records))
+        replay_thread.start()
+        for i in range(5):
+            Agent.set_sim_t(i * 0.05)
+            # (messages are not replayed ahead of the simulator)
+            assert(len(robot.joystick_inputs) <= 2 * (i + 1))
+        replay_thread.join(timeout=5.)
+        assert(not replay_thread.is_alive())
+        expected_inputs = [cmd for msg in messages.values() for cmd in json.loads(msg)['j_input']]
+        assert(np.allclose(robot.joystick_inputs, expected_inputs))
+
+        # and stops when the robot powers off
+        Agent.set_sim_t(0.)
+        robot = StubRobot()
+        replay_thread = threading.Thread(target=replay_joystick_data,
+                                         args=(robot, records))
+        replay_thread.start()
+        robot.end_acting = True
+        replay_thread.join(timeout=5.)
+        assert(not replay_thread.is_alive())
+        assert(len(robot.joystick_inputs) <= 2)
+    finally:
+        Agent.sim_t, Agent.sim_dt = sim_t, sim_dt
+        shutil.rmtree(tmp_dir)
+
+
+def main_test():
+    test_joystick_record()
+    print("%sJoystick record tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
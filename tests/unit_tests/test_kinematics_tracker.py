@@ -0,0 +1,61 @@
+import numpy as np
+from utils.utils import color_green, color_reset, generate_config_from_pos_3
+
+
+def create_sim_states(num_states=30, num_agents=4, dt=0.05, start_t=0.):
+    from simulators.sim_state import SimState, AgentState
+    rng = np.random.RandomState(seed=1)
+    pos_n3 = rng.uniform(0, 10, size=(num_agents, 3))
+    sim_states = []
+    for i in range(num_states):
+        pos_n3[:, :2] += rng.uniform(-0.05, 0.05, size=(num_agents, 2))
+        pedestrians = {}
+        for j in range(num_agents):
+            name = "prerec_%d" % j
+            pedestrians[name] = \
+                AgentState(name=name,
+                           current_config=generate_config_from_pos_3(pos_n3[j]))
+        sim_states.append(SimState(pedestrians=pedestrians, robots={},
+                                   sim_t=start_t + i * dt, delta_t=dt))
+    return sim_states
+
+
+def test_kinematics_tracker(start_t=0.):
+    from simulators.sim_state import AgentKinematicsTracker
+    from simulators.sim_state import compute_all_velocities, compute_all_accelerations
+    sim_states = create_sim_states(start_t=start_t)
+    window = 8
+    tracker = AgentKinematicsTracker(window=window)
+    for i, sim_state in enumerate(sim_states):
+        tracker.update(sim_state)
+        if i == 0:
+            continue
+        # the incremental tracker must match recomputing over all the sim_states
+        expected_vels = compute_all_velocities(sim_states[:i + 1])
+        expected_accels = compute_all_accelerations(sim_states[:i + 1])
+        vels = tracker.get_velocities()
+        accels = tracker.get_accelerations()
+        for name in expected_vels.keys():
+            assert np.isclose(vels[name], expected_vels[name][-1], atol=1e-4)
+            assert np.isclose(accels[name], expected_accels[name][-1],
+                              atol=1e-2)
+            # the history is bounded by the window
+            hist = tracker.get_velocity_history(name)
+            assert len(hist) == min(i + 1, window)
+            assert np.allclose(hist, expected_vels[name][-window:], atol=1e-4)
+
+
+def test_kinematics_tracker_long_episode():
+    # late in a long episode (where sim_t in float32 would round delta_t)
+    test_kinematics_tracker(start_t=1e5)
+
+
+def main_test():
+    np.random.seed(seed=1)
+    test_kinematics_tracker()
+    test_kinematics_tracker_long_episode()
+    print("%sKinematics tracker tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
@@ -1,7 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
+import optCtrl.lqr
 from costs.quad_cost_with_wrapping import QuadraticRegulatorRef
-from optCtrl.lqr import LQRSolver
+from optCtrl.lqr import LQRSolver, _riccati_recursion
+from utils.angle_utils import angle_normalize
 from systems.dubins_v1 import DubinsV1
 from dotmap import DotMap
 from utils.utils import color_green, color_reset
@@ -212,11 +214,126 @@ def test_lqr2(visualize=False):
                     bbox_inches='tight', pad_inches=0)
 
 
+def reference_back_propagation(lqr_solver, trajectory):
+    # The per time step Riccati recursion (with an explicit inverse of Quu)
+    # that LQRSolver.back_propagation used before it was batched
+    angle_dims = lqr_solver.plant_dyn._angle_dims
+    lqr_sys = lqr_solver.build_lqr_system(trajectory)
+    x_nkd, _ = lqr_solver.plant_dyn.parse_trajectory(trajectory)
+    fdfwd_Tnf1 = [None] * lqr_solver.T
+    fdbck_gain_Tnfd = [None] * lqr_solver.T
+    Vxx_ndd = lqr_sys['dldxx_nkdd'][:, -1]
+    Vx_nd1 = lqr_sys['dldx_nkd'][:, -1, :, None]
+    for t in reversed(range(lqr_solver.T)):
+        error_t_nd = lqr_sys['f_nkd'][:, t] - x_nkd[:, t + 1]
+        error_t_nd = np.concatenate([error_t_nd[:, :angle_dims],
+                                     angle_normalize(error_t_nd[:, angle_dims:angle_dims + 1]),
+                                     error_t_nd[:, angle_dims + 1:]], axis=1)
+        error_t_nd1 = error_t_nd[:, :, None]
+        dfdx_ndd = lqr_sys['dfdx_nkdd'][:, t]
+        dfdu_ndf = lqr_sys['dfdu_nkdf'][:, t]
+        dfdx_T_ndd = np.transpose(dfdx_ndd, axes=[0, 2, 1])
+        dfdu_T_ndf = np.transpose(dfdu_ndf, axes=[0, 2, 1])
+        dfdx_T_dot_Vxx_ndd = np.matmul(dfdx_T_ndd, Vxx_ndd)
+        dfdu_T_dot_Vxx_nfd = np.matmul(dfdu_T_ndf, Vxx_ndd)
+        Qx_nd1 = (lqr_sys['dldx_nkd'][:, t][:, :, None] + np.matmul(dfdx_T_ndd, Vx_nd1)
+                  + np.matmul(dfdx_T_dot_Vxx_ndd, error_t_nd1))
+        Qu_nf1 = (lqr_sys['dldu_nkf'][:, t][:, :, None] + np.matmul(dfdu_T_ndf, Vx_nd1)
+                  + np.matmul(dfdu_T_dot_Vxx_nfd, error_t_nd1))
+        Qxx_ndd = lqr_sys['dldxx_nkdd'][:, t] + np.matmul(dfdx_T_dot_Vxx_ndd, dfdx_ndd)
+        Qux_nfd = lqr_sys['dldux_nkfd'][:, t] + np.matmul(dfdu_T_dot_Vxx_nfd, dfdx_ndd)
+        Quu_nff = lqr_sys['dlduu_nkff'][:, t] + np.matmul(dfdu_T_dot_Vxx_nfd, dfdu_ndf)
+        inv_Quu_nff = np.linalg.inv(Quu_nff)
+        fdfwd_Tnf1[t] = np.matmul(-inv_Quu_nff, Qu_nf1)
+        fdbck_gain_Tnfd[t] = np.matmul(-inv_Quu_nff, Qux_nfd)
+        fdbck_gain_nfd = np.transpose(fdbck_gain_Tnfd[t], axes=[0, 2, 1])
+        Vxx_ndd = Qxx_ndd - np.matmul(np.matmul(fdbck_gain_nfd, Quu_nff), fdbck_gain_Tnfd[t])
+        Vx_nd1 = Qx_nd1 - np.matmul(np.matmul(fdbck_gain_nfd, Quu_nff), fdfwd_Tnf1[t])
+    return np.stack(fdfwd_Tnf1, axis=1), np.stack(fdbck_gain_Tnfd, axis=1)
+
+
+def test_lqr_backends():
+    # The batched Riccati recursion (and the kernel behind the numba backend)
+    # match the per time step recursion on random trajectories
+    p = create_params()
+    np.random.seed(seed=p.seed)
+    n, k = 6, 30
+    db = DubinsV1(p.dt, params=p.system_dynamics_params)
+    x_nk3 = np.random.uniform(-1., 1., size=(n, k, 3))
+    x_nk3[:, :, 2] = np.random.uniform(-np.pi, np.pi, size=(n, k))
+    u_nk2 = np.random.uniform(0., .6, size=(n, k, 2))
+    trajectory_ref = db.assemble_trajectory(x_nk3, u_nk2)
+    trajectory = db.assemble_trajectory(x_nk3 + np.random.normal(scale=.1, size=(n, k, 3)),
+                                        u_nk2 + np.random.normal(scale=.1, size=(n, k, 2)))
+    cost_fn = QuadraticRegulatorRef(trajectory_ref, db, p)
+    lqr_solver = LQRSolver(T=k - 1, dynamics=db, cost=cost_fn)
+
+    expected_k_nTf1, expected_K_nTfd = reference_back_propagation(lqr_solver, trajectory)
+    k_nTf1, K_nTfd = lqr_solver.back_propagation(trajectory)
+    assert(np.allclose(k_nTf1, expected_k_nTf1, rtol=1e-4, atol=1e-6))
+    assert(np.allclose(K_nTfd, expected_K_nTfd, rtol=1e-4, atol=1e-6))
+
+    lqr_sys = lqr_solver.build_lqr_system(trajectory)
+    x_nkd, _ = db.parse_trajectory(trajectory)
+    error_nTd = lqr_sys['f_nkd'][:, :-1] - x_nkd[:, 1:]
+    error_nTd[:, :, 2] = angle_normalize(error_nTd[:, :, 2])
+    k_nTf1, K_nTfd = np.empty_like(expected_k_nTf1), np.empty_like(expected_K_nTfd)
+    _riccati_recursion(error_nTd, lqr_sys['dfdx_nkdd'], lqr_sys['dfdu_nkdf'], lqr_sys['dldx_nkd'],
+                       lqr_sys['dldu_nkf'], lqr_sys['dldxx_nkdd'], lqr_sys['dldux_nkfd'],
+                       lqr_sys['dlduu_nkff'], k_nTf1, K_nTfd)
+    assert(np.allclose(k_nTf1, expected_k_nTf1, rtol=1e-4, atol=1e-6))
+    assert(np.allclose(K_nTfd, expected_K_nTfd, rtol=1e-4, atol=1e-6))
+
+
+def test_lqr_backends_not_pd():
+    # With a concave control cost Quu is not positive definite, the kernel behind the
+    # numba backend reports it (instead of raising) and the numba backend falls back
+    # to the numpy solve
+    p = create_params()
+    p.quad_coeffs = [1.0, 1.0, 1.0, -10., -10.]
+    np.random.seed(seed=p.seed)
+    n, k = 4, 20
+    db = DubinsV1(p.dt, params=p.system_dynamics_params)
+    x_nk3 = np.random.uniform(-1., 1., size=(n, k, 3))
+    u_nk2 = np.random.uniform(0., .6, size=(n, k, 2))
+    trajectory_ref = db.assemble_trajectory(x_nk3, u_nk2)
+    trajectory = db.assemble_trajectory(x_nk3 + np.random.normal(scale=.1, size=(n, k, 3)),
+                                        u_nk2 + np.random.normal(scale=.1, size=(n, k, 2)))
+    cost_fn = QuadraticRegulatorRef(trajectory_ref, db, p)
+    lqr_solver = LQRSolver(T=k - 1, dynamics=db, cost=cost_fn)
+    expected_k_nTf1, expected_K_nTfd = reference_back_propagation(lqr_solver, trajectory)
+
+    lqr_sys = lqr_solver.build_lqr_system(trajectory)
+    x_nkd, _ = db.parse_trajectory(trajectory)
+    error_nTd = lqr_sys['f_nkd'][:, :-1] - x_nkd[:, 1:]
+    error_nTd[:, :, 2] = angle_normalize(error_nTd[:, :, 2])
+    k_nTf1, K_nTfd = np.empty_like(expected_k_nTf1), np.empty_like(expected_K_nTfd)
+    assert(not _riccati_recursion(error_nTd, lqr_sys['dfdx_nkdd'], lqr_sys['dfdu_nkdf'],
+                                  lqr_sys['dldx_nkd'], lqr_sys['dldu_nkf'], lqr_sys['dldxx_nkdd'],
+                                  lqr_sys['dldux_nkfd'], lqr_sys['dlduu_nkff'], k_nTf1, K_nTfd))
+
+    # (the pure python kernel stands in for the jit compiled one if numba is not installed)
+    riccati_recursion_jit = optCtrl.lqr._riccati_recursion_jit
+    if riccati_recursion_jit is None:
+        optCtrl.lqr._riccati_recursion_jit = _riccati_recursion
+    try:
+        numba_solver = LQRSolver(T=k - 1, dynamics=db, cost=cost_fn, backend='numba')
+        numba_k_nTf1, numba_K_nTfd = numba_solver.back_propagation(trajectory)
+    finally:
+        optCtrl.lqr._riccati_recursion_jit = riccati_recursion_jit
+    numpy_k_nTf1, numpy_K_nTfd = lqr_solver.back_propagation(trajectory)
+    assert(np.allclose(numba_k_nTf1, numpy_k_nTf1) and np.allclose(numba_K_nTfd, numpy_K_nTfd))
+    assert(np.allclose(numpy_k_nTf1, expected_k_nTf1, rtol=1e-4, atol=1e-6))
+    assert(np.allclose(numpy_K_nTfd, expected_K_nTfd, rtol=1e-4, atol=1e-6))
+
+
 def main_test():
     # robot should move to goal in 1 step and stay there
     test_lqr0(visualize=False)
     test_lqr1(visualize=False)  # robot should track a trajectory
     test_lqr2(visualize=False)  # LQR should track 2 trajectories in a batch
+    test_lqr_backends()
+    test_lqr_backends_not_pd()
     print("%sLqr tests passed!%s" % (color_green, color_reset))
 
 
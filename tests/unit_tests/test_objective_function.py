@@ -0,0 +1,104 @@
+import numpy as np
+from dotmap import DotMap
+from objectives.objective_function import ObjectiveFunction
+from objectives.goal_distance import GoalDistance
+from objectives.angle_distance import AngleDistance
+from objectives.personal_space_cost import PersonalSpaceCost
+from metrics.cost_functions import asym_gauss_from_vel
+from simulators.sim_state import SimState, AgentState, SimStateHistory
+from trajectory.trajectory import Trajectory
+from utils.fmm_map import FmmMap
+from utils.utils import color_green, color_reset, generate_config_from_pos_3
+
+
+def create_objective_function(packed_evaluation):
+    fmm_map = FmmMap.create_fmm_map_based_on_goal_position(goal_positions_n2=np.array([[4., 3.]]),
+                                                           map_size_2=np.array([120, 100]),
+                                                           dx=0.05,
+                                                           map_origin_2=np.array([0, 0]))
+    obj_fn = ObjectiveFunction(DotMap(obj_type='valid_mean',
+                                      packed_evaluation=packed_evaluation))
+    obj_fn.add_objective(GoalDistance(DotMap(power=2, goal_cost=0.08, goal_margin=0.3),
+                                      fmm_map))
+    obj_fn.add_objective(AngleDistance(DotMap(power=1, angle_cost=0.008), fmm_map))
+    return obj_fn
+
+
+def test_packed_evaluation():
+    # Trajectories of different valid horizons are only evaluated on their valid
+    # time steps, which must not change the objective values
+    n, k = 20, 15
+    trajectory = Trajectory(dt=0.05, n=n, k=k,
+                            position_nk2=np.random.uniform(0., 6.5, size=(n, k, 2)),
+                            heading_nk1=np.random.uniform(-np.pi, np.pi, size=(n, k, 1)),
+                            valid_horizons_n1=np.random.randint(1, k + 1, size=(n, 1)))
+    trajectory.update_valid_mask_nk()
+    padded_values = create_objective_function(False).evaluate_function(trajectory)
+    packed_values = create_objective_function(True).evaluate_function(trajectory)
+    assert(np.array_equal(padded_values, packed_values))
+
+
+def test_personal_space_cost():
+    # The personal space cost of every point of every trajectory matches
+    # evaluating the gaussian of every agent one point at a time
+    n, k, m = 6, 10, 5
+    agents_pos_m3 = np.random.uniform(0., 5., size=(m, 3))
+    pedestrians = {'ped%d' % i: AgentState(name='ped%d' % i,
+                                           current_config=generate_config_from_pos_3(agents_pos_m3[i]))
+                   for i in range(m)}
+    sim_state_hist = {0: SimState(pedestrians=pedestrians, robots={}, sim_t=0.)}
+    trajectory = Trajectory(dt=0.05, n=n, k=k,
+                            position_nk2=np.random.uniform(0., 5., size=(n, k, 2)),
+                            heading_nk1=np.random.uniform(-np.pi, np.pi, size=(n, k, 1)))
+
+    # (and only the agents within 1m of each point)
+    expected_nk, expected_cutoff_nk = np.zeros((n, k)), np.zeros((n, k))
+    for i in range(n):
+        for j in range(k):
+            x, y = trajectory.position_nk2()[i, j]
+            for agent_vals in pedestrians.values():
+                xc, yc, theta = agent_vals.get_pos3()
+                value = 10 * asym_gauss_from_vel(x=x, y=y, velx=np.cos(theta), vely=np.sin(theta), xc=xc, yc=yc)
+                expected_nk[i, j] += value
+                if np.hypot(x - xc, y - yc) <= 1.:
+                    expected_cutoff_nk[i, j] += value
+    values_nk = PersonalSpaceCost(DotMap(psc_scale=10)).evaluate_objective(trajectory, sim_state_hist)
+    assert(values_nk.shape == (n, k))
+    assert(np.allclose(values_nk, expected_nk))
+
+    # with a cutoff radius larger than the map every agent is evaluated
+    values_nk = PersonalSpaceCost(DotMap(psc_scale=10, cutoff_radius=10.)).evaluate_objective(trajectory,
+                                                                                             sim_state_hist)
+    assert(np.allclose(values_nk, expected_nk))
+    values_nk = PersonalSpaceCost(DotMap(psc_scale=10, cutoff_radius=1.)).evaluate_objective(trajectory,
+                                                                                            sim_state_hist)
+    assert(np.allclose(values_nk, expected_cutoff_nk))
+    assert(not np.allclose(values_nk, expected_nk))
+    assert(np.allclose(PersonalSpaceCost(DotMap(psc_scale=10)).evaluate_objective(trajectory, {}), 0.))
+    assert(np.allclose(PersonalSpaceCost(DotMap(psc_scale=10)).evaluate_objective(trajectory,
+                                                                                  SimStateHistory()), 0.))
+
+    # a bounded history only keeps the latest sim_states and evaluates on the latest one
+    sim_states = SimStateHistory(window=3)
+    for t in range(5):
+        moved = {name: AgentState(name=name, current_config=generate_config_from_pos_3(agents_pos_m3[i] + 4 - t))
+                 for i, name in enumerate(pedestrians.keys())}
+        sim_states[t * 0.5] = SimState(pedestrians=moved, robots={}, sim_t=t * 0.5)
+    sim_states[2.] = sim_state_hist[0]
+    assert(len(sim_states) == 3 and list(sim_states.keys()) == [1., 1.5, 2.])
+    assert(sim_states.latest() is sim_state_hist[0])
+    assert(np.allclose(sim_states.get_agent_pos_m3(), agents_pos_m3))
+    assert(sim_states.get_agent_names() == list(pedestrians.keys()))
+    values_nk = PersonalSpaceCost(DotMap(psc_scale=10)).evaluate_objective(trajectory, sim_states)
+    assert(np.allclose(values_nk, expected_nk))
+
+
+def main_test():
+    np.random.seed(seed=1)
+    test_packed_evaluation()
+    test_personal_space_cost()
+    print("%sObjective function tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from utils.utils import color_green, color_reset
+
+
+def create_data_bin(n=5, k=7, dt=0.05):
+    from trajectory.trajectory import Trajectory, SystemConfig
+    rng = np.random.RandomState(seed=1)
+
+    def random_traj(t, k):
+        return t(dt=dt, n=n, k=k,
+                 position_nk2=rng.uniform(size=(n, k, 2)).astype(np.float32),
+                 speed_nk1=rng.uniform(size=(n, k, 1)).astype(np.float32),
+                 acceleration_nk1=rng.uniform(size=(n, k, 1)).astype(np.float32),
+                 heading_nk1=rng.uniform(size=(n, k, 1)).astype(np.float32),
+                 angular_speed_nk1=rng.uniform(size=(n, k, 1)).astype(np.float32),
+                 angular_acceleration_nk1=rng.uniform(size=(n, k, 1)).astype(np.float32))
+    return {'start_speeds': rng.uniform(size=(n, 1, 1)).astype(np.float32),
+            'start_configs': random_traj(SystemConfig, 1),
+            'waypt_configs': random_traj(SystemConfig, 1),
+            'spline_trajectories': random_traj(Trajectory, k),
+            'horizons': rng.uniform(size=(n, 1, 1)).astype(np.float32),
+            'lqr_trajectories': random_traj(Trajectory, k),
+            'K_nkfd': rng.uniform(size=(n, k, 2, 5)).astype(np.float32),
+            'k_nkf1': rng.uniform(size=(n, k, 2, 1)).astype(np.float32)}
+
+
+def test_pipeline_store():
+    from control_pipelines import pipeline_store
+    from control_pipelines.control_pipeline_v0_helper import ControlPipelineV0Helper
+    data_bin = create_data_bin()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, 'velocity_0.000.json')
+        pipeline_store.save_data_bin(data_bin, filename)
+        assert(pipeline_store.bin_size(filename) == 5)
+        loaded = ControlPipelineV0Helper().load_and_process_data(filename)
+        for key, elem in data_bin.items():
+            if isinstance(elem, np.ndarray):
+                # raw arrays are memory-mapped, not copied
+                assert(isinstance(loaded[key], np.memmap))
+                assert(np.array_equal(loaded[key], elem))
+                continue
+            assert(loaded[key].n == elem.n and loaded[key].k == elem.k)
+            assert(np.array_equal(loaded[key].position_nk2(),
+                                  elem.position_nk2()))
+            assert(np.array_equal(loaded[key].heading_nk1(),
+                                  elem.heading_nk1()))
+            assert(np.array_equal(loaded[key].angular_speed_nk1(),
+                                  elem.angular_speed_nk1()))
+        # the objects are built directly on top of the read-only store
+        assert(not loaded['lqr_trajectories'].position_nk2().flags.writeable)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def create_pipeline_params(pipeline_dir, num_generation_workers):
+    """The params of a small control pipeline (saved as pickles) generated in pipeline_dir"""
+    from params.central_params import create_planner_params
+    cp = create_planner_params().control_pipeline_params
+    cp.dir = pipeline_dir
+    cp.store_format = 'pkl'
+    cp.waypoint_params.num_waypoints = 200
+    cp.binning_parameters.num_bins = 3
+    cp.binning_parameters.max_speed = 0.6
+    cp.num_generation_workers = num_generation_workers
+    return cp
+
+
+def assert_data_bins_equal(data_bin, expected_data_bin):
+    for key, elem in expected_data_bin.items():
+        if isinstance(elem, np.ndarray):
+            assert(np.allclose(data_bin[key], elem))
+            continue
+        assert(data_bin[key].n == elem.n and data_bin[key].k == elem.k)
+        assert(np.allclose(data_bin[key].position_nk2(), elem.position_nk2()))
+        assert(np.allclose(data_bin[key].heading_nk1(), elem.heading_nk1()))
+        assert(np.allclose(data_bin[key].speed_nk1(), elem.speed_nk1()))
+
+
+def test_generate_control_pipeline():
+    # generating the bins in parallel, and resuming an interrupted generation, gives the same pipeline as a
+    # serial generation
+    from control_pipelines.control_pipeline_v0 import ControlPipelineV0
+    from control_pipelines.control_pipeline_v0_helper import ControlPipelineV0Helper
+    helper = ControlPipelineV0Helper()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        serial_pipeline = ControlPipelineV0(create_pipeline_params(os.path.join(tmp_dir, 'serial'), 1))
+        serial_pipeline.generate_control_pipeline()
+        assert(serial_pipeline.does_pipeline_exist())
+
+        pipeline = ControlPipelineV0(create_pipeline_params(os.path.join(tmp_dir, 'parallel'), 2))
+        pipeline._generate_initial_bins()
+        initial_bin_files = [pipeline._data_file_name(v0=v0, initial_bin=True) for v0 in pipeline.start_velocities]
+        assert(all(os.path.isfile(filename) for filename in initial_bin_files))
+        # interrupt the generation of the second bin (leaving its partially written temporary file)
+        os.remove(initial_bin_files[1])
+        with open(initial_bin_files[1] + '.tmp', 'wb') as f:
+            f.write(b'truncated')
+        generated_v0s = []
+        generate_initial_bin = pipeline._generate_initial_bin
+
+        def record_initial_bin(v0):
+            generated_v0s.append(v0)
+            return generate_initial_bin(v0)
+        pipeline._generate_initial_bin = record_initial_bin
+        pipeline.generate_control_pipeline()
+        assert(pipeline.does_pipeline_exist())
+        # only the missing bin was generated again
+        assert(generated_v0s == [pipeline.start_velocities[1]])
+        assert(not any(os.path.exists(filename) for filename in initial_bin_files))
+
+        for filename, expected_filename in zip(pipeline.pipeline_files, serial_pipeline.pipeline_files):
+            assert_data_bins_equal(helper.load_and_process_data(filename),
+                                   helper.load_and_process_data(expected_filename))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main_test():
+    test_pipeline_store()
+    test_generate_control_pipeline()
+    print("%sPipeline store tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
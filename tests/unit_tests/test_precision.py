@@ -0,0 +1,74 @@
+import numpy as np
+from dotmap import DotMap
+from costs.quad_cost_with_wrapping import QuadraticRegulatorRef
+from optCtrl.lqr import LQRSolver
+from systems.dubins_v1 import DubinsV1
+from trajectory.spline.spline_3rd_order import Spline3rdOrder
+from trajectory.trajectory import SystemConfig
+from utils.fmm_map import FmmMap
+from utils.precision import get_float_dtype, set_float_dtype
+from utils.utils import color_green, color_reset
+
+
+def plan(dtype):
+    """Fits splines to random waypoints, tracks them with LQR and evaluates the fmm distance along the LQR
+    trajectories, all in the precision dtype. Returns the spline and LQR trajectories, the LQR feedback matrices
+    and the fmm distances."""
+    set_float_dtype(dtype)
+    rng = np.random.RandomState(seed=1)
+    n, k, dt, horizon_s = 40, 60, .05, 3.
+    start_config = SystemConfig(dt, n, 1, speed_nk1=rng.uniform(0., .6, size=(n, 1, 1)))
+    goal_config = SystemConfig(dt, n, 1, position_nk2=rng.uniform(.2, 2., size=(n, 1, 2)),
+                               heading_nk1=rng.uniform(-np.pi / 2, np.pi / 2, size=(n, 1, 1)))
+    spline = Spline3rdOrder(dt=dt, n=n, k=k, params=DotMap(epsilon=1e-5))
+    spline.fit(start_config, goal_config, final_times_n1=np.full((n, 1), horizon_s))
+    spline.eval_spline_on_time_grid(horizon_s, k)
+    spline.rescale_spline_horizon_to_dynamically_feasible_horizon(.6, 1.1, minimum_horizon=1.)
+
+    p = DotMap(quad_coeffs=[1.0, 1.0, 1.0, 1e-10, 1e-10], linear_coeffs=[0.0, 0.0, 0.0, 0.0, 0.0],
+               system_dynamics_params=DotMap(v_bounds=[0.0, .6], w_bounds=[-1.1, 1.1],
+                                             simulation_params=DotMap(simulation_mode='ideal',
+                                                                      noise_params=DotMap(is_noisy=False))))
+    dubins = DubinsV1(dt, params=p.system_dynamics_params)
+    lqr_solver = LQRSolver(T=k - 1, dynamics=dubins, cost=QuadraticRegulatorRef(spline, dubins, p))
+    lqr_res = lqr_solver.lqr(start_config, spline, verbose=False)
+
+    fmm_map = FmmMap.create_fmm_map_based_on_goal_position(goal_positions_n2=np.array([[1.5, 1.]]),
+                                                           map_size_2=np.array([120, 120]), dx=0.05,
+                                                           map_origin_2=np.array([-30, -30]))
+    distances_nk = fmm_map.fmm_distance_map.compute_voxel_function(lqr_res['trajectory_opt'].position_nk2())
+    return spline, lqr_res['trajectory_opt'], lqr_res['K_opt_nkfd'], distances_nk
+
+
+def test_precision():
+    # Every array of the planning stack is in the precision of the policy (nothing is upcast), the float32 results
+    # match the float64 ones and take half the memory
+    float_dtype = get_float_dtype()
+    try:
+        results = {dtype: plan(dtype) for dtype in [np.float32, np.float64]}
+    finally:
+        set_float_dtype(float_dtype)
+    for dtype, (spline, lqr_trajectory, K_nkfd, distances_nk) in results.items():
+        for trajectory in [spline, lqr_trajectory]:
+            assert(all(arr.dtype == dtype for arr in [trajectory.position_nk2(), trajectory.heading_nk1(),
+                                                      trajectory.speed_nk1(), trajectory.angular_speed_nk1(),
+                                                      trajectory.valid_horizons_n1]))
+        assert(spline.final_times_n1.dtype == dtype and K_nkfd.dtype == dtype and distances_nk.dtype == dtype)
+
+    spline32, lqr32, K32_nkfd, distances32_nk = results[np.float32]
+    spline64, lqr64, K64_nkfd, distances64_nk = results[np.float64]
+    assert(np.allclose(spline32.final_times_n1, spline64.final_times_n1, rtol=1e-4, atol=1e-4))
+    assert(np.allclose(spline32.position_nk2(), spline64.position_nk2(), atol=1e-4))
+    assert(np.allclose(lqr32.position_nk2(), lqr64.position_nk2(), atol=1e-3))
+    assert(np.allclose(K32_nkfd, K64_nkfd, atol=1e-2, rtol=1e-3))
+    assert(np.allclose(distances32_nk, distances64_nk, atol=1e-3))
+    assert(2 * lqr32.memory_usage_bytes() == lqr64.memory_usage_bytes())
+
+
+def main_test():
+    test_precision()
+    print("%sPrecision tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
@@ -0,0 +1,294 @@
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+from dotmap import DotMap
+from trajectory.trajectory import SystemConfig
+from utils.angle_utils import angle_normalize
+from utils.utils import color_green, color_reset, generate_config_from_pos_3
+
+
+@contextlib.contextmanager
+def temporary_pipeline_dir():
+    """A directory to generate a (small) control pipeline in, which is not shared with the planners of other tests"""
+    from control_pipelines.control_pipeline_v0 import ControlPipelineV0
+    pipeline_dir = tempfile.mkdtemp()
+    try:
+        ControlPipelineV0.pipeline = None
+        yield pipeline_dir
+    finally:
+        ControlPipelineV0.pipeline = None
+        shutil.rmtree(pipeline_dir)
+
+
+def create_planner(obj_fn, pipeline_dir, hierarchical_search=None, plan_reuse=None):
+    """A SamplingPlanner on a small control pipeline (generated in pipeline_dir)"""
+    from params.central_params import create_planner_params
+    p = create_planner_params()
+    cp = p.control_pipeline_params
+    cp.dir = pipeline_dir
+    cp.waypoint_params.num_waypoints = 300
+    cp.binning_parameters.num_bins = 4
+    cp.binning_parameters.max_speed = 0.6
+    cp.num_generation_workers = 1
+    p.hierarchical_search.enabled = False
+    p.plan_reuse.enabled = False
+    if hierarchical_search is not None:
+        p.hierarchical_search = hierarchical_search
+    if plan_reuse is not None:
+        p.plan_reuse = plan_reuse
+    return p.planner(obj_fn, p)
+
+
+class LandscapeObjectiveFunction(object):
+    """A synthetic cost landscape: the (wrapped [x, y, theta]) distance from the last valid
+    state of every trajectory to a target configuration"""
+
+    def __init__(self, target_3):
+        self.target_3 = target_3
+
+    def evaluate_function(self, trajectory, sim_state_hist=None):
+        n = trajectory.n
+        last_n = trajectory.valid_horizons_n1[:, 0].astype(np.int64) - 1
+        pos_n2 = trajectory.position_nk2()[np.arange(n), last_n]
+        heading_n = trajectory.heading_nk1()[np.arange(n), last_n, 0]
+        return np.sqrt(np.sum((pos_n2 - self.target_3[:2]) ** 2, axis=1) +
+                       angle_normalize(heading_n - self.target_3[2]) ** 2)
+
+
+def create_obstacle_map():
+    """A synthetic (6m x 5m) map with a single obstacle"""
+    from obstacles.sbpd_map import SBPDMap
+    traversible = np.ones((100, 120), dtype=bool)
+    traversible[40:60, 70:75] = False
+    return SBPDMap(DotMap(map_origin_2=np.zeros(2)), renderer=0, res=5., map_trav=traversible)
+
+
+def create_obj_fn(obstacle_map, goal_2):
+    """The objective function of an agent heading to goal_2 on obstacle_map"""
+    from params.central_params import create_agent_params
+    from objectives.objective_function import ObjectiveFunction
+    from objectives.obstacle_avoidance import ObstacleAvoidance
+    from objectives.goal_distance import GoalDistance
+    from objectives.angle_distance import AngleDistance
+    from utils.fmm_map import FmmMap
+    p = create_agent_params()
+    fmm_map = FmmMap.create_fmm_map_based_on_goal_position(goal_positions_n2=np.array([goal_2]),
+                                                           map_size_2=obstacle_map.get_map_size_2(),
+                                                           dx=obstacle_map.get_dx(),
+                                                           map_origin_2=obstacle_map.get_map_origin_2(),
+                                                           mask_grid_mn=obstacle_map.create_occupancy_grid_for_map())
+    obj_fn = ObjectiveFunction(p.objective_fn_params)
+    obj_fn.add_objective(ObstacleAvoidance(params=p.avoid_obstacle_objective, obstacle_map=obstacle_map))
+    obj_fn.add_objective(GoalDistance(params=p.goal_distance_objective, fmm_map=fmm_map))
+    obj_fn.add_objective(AngleDistance(params=p.goal_angle_objective, fmm_map=fmm_map))
+    return obj_fn
+
+
+def last_valid_pos3(trajectory, idx):
+    t = int(trajectory.valid_horizons_n1[idx, 0]) - 1
+    return np.append(trajectory.position_nk2()[idx, t], trajectory.heading_nk1()[idx, t])
+
+
+def test_hierarchical_search():
+    with temporary_pipeline_dir() as pipeline_dir:
+        _test_hierarchical_search(pipeline_dir)
+
+
+def _test_hierarchical_search(pipeline_dir):
+    planner = create_planner(None, pipeline_dir)
+    waypts, _, trajectories, _, _ = planner.control_pipeline.plan(generate_config_from_pos_3([1., 1., .3], v=.4),
+                                                                  workspace=planner.pipeline_workspace)
+    trajectories.update_valid_mask_nk()
+    # the optimum is a waypoint that is not part of the coarse search
+    stride = 2
+    opt_idx = 2 * (waypts.n // 4) + 1
+    # (a float64 objective, more precise than the trajectories)
+    planner.obj_fn = LandscapeObjectiveFunction(last_valid_pos3(trajectories, opt_idx).astype(np.float64))
+    exhaustive_vals = planner.obj_fn.evaluate_function(trajectories)
+    assert(np.argmin(exhaustive_vals) == opt_idx)
+
+    # every coarse waypoint is a candidate and the radius reaches the optimum from the nearest one
+    coarse_idxs = np.arange(0, waypts.n, stride)
+    pos3_n3 = np.concatenate([waypts.position_nk2()[:, 0], waypts.heading_nk1()[:, 0]], axis=1)
+    diff_n3 = pos3_n3[coarse_idxs] - pos3_n3[opt_idx]
+    diff_n3[:, 2] = angle_normalize(diff_n3[:, 2])
+    radius = np.min(np.linalg.norm(diff_n3, axis=1)) + 1e-6
+    planner.params.hierarchical_search = DotMap(enabled=True, waypoint_stride=stride, time_stride=2,
+                                                num_candidates=1, cost_margin=np.inf, radius=radius,
+                                                audit_every=1)
+    obj_vals = planner.evaluate_trajectories(waypts, trajectories)
+    assert(np.argmin(obj_vals) == opt_idx)
+    assert(np.isinf(obj_vals).any())
+    # (only the refined waypoints are evaluated, at full resolution)
+    # (in the precision of the objective, so near ties are broken as in the exhaustive search)
+    finite_n = np.isfinite(obj_vals)
+    assert(obj_vals.dtype == exhaustive_vals.dtype)
+    assert(np.array_equal(obj_vals[finite_n], exhaustive_vals[finite_n]))
+    report = planner.hierarchical_search_report()
+    assert(report['num_audited'] == 1 and report['num_disagreements'] == 0)
+
+    # only refining the best coarse waypoint misses the optimum, which the audit counts (with the regret)
+    planner.params.hierarchical_search.cost_margin = 0.
+    planner.params.hierarchical_search.radius = 0.
+    obj_vals = planner.evaluate_trajectories(waypts, trajectories)
+    assert(np.argmin(obj_vals) != opt_idx and np.argmin(obj_vals) % stride == 0)
+    report = planner.hierarchical_search_report()
+    assert(report['num_searches'] == 2 and report['num_audited'] == 2)
+    assert(report['num_disagreements'] == 1 and report['disagreement_rate'] == .5)
+    assert(np.isclose(report['max_cost_regret'], np.min(obj_vals) - exhaustive_vals[opt_idx]))
+    assert(report['max_cost_regret'] > 0.)
+
+
+def test_optimize_batch():
+    with temporary_pipeline_dir() as pipeline_dir:
+        _test_optimize_batch(pipeline_dir)
+
+
+def _test_optimize_batch(pipeline_dir):
+    from objectives.objective_function import ObjectiveFunction
+    from planners.sampling_planner import SamplingPlanner
+    from trajectory.trajectory import Trajectory
+    obstacle_map = create_obstacle_map()
+    goals = [[5., 4.], [1., 4.], [3., .5]]
+    # (the first two agents start in the same velocity bin)
+    start_configs = [generate_config_from_pos_3([1., 1., .3], v=.4),
+                     generate_config_from_pos_3([2., 3., -1.], v=.4),
+                     generate_config_from_pos_3([4., 1.5, 2.], v=.1)]
+    planners = [create_planner(create_obj_fn(obstacle_map, goal), pipeline_dir) for goal in goals]
+    pipeline = planners[0].control_pipeline
+
+    # converting to the frame of every agent at once matches converting agent by agent
+    idx = pipeline._compute_bin_idx_for_start_velocities(np.array([[.4]]))[0]
+    pipeline._ensure_bin_loaded(idx)
+    trajectory_egocentric = pipeline.lqr_trajectories[idx]
+    ref_pos3_m3 = np.array([config.position_and_heading_nk3()[0, 0] for config in start_configs[:2]])
+    trajectories = pipeline._batch_to_world_coordinates(ref_pos3_m3, trajectory_egocentric, Trajectory)
+    trajectories.update_valid_mask_nk()
+    n = trajectory_egocentric.n
+    assert(trajectories.n == 2 * n)
+    for i, start_config in enumerate(start_configs[:2]):
+        # (as planning from start_config converts them)
+        expected = pipeline.system_dynamics.to_world_coordinates(
+            start_config, trajectory_egocentric, Trajectory(dt=trajectory_egocentric.dt, n=n, k=trajectory_egocentric.k,
+                                                            variable=True), mode='assign')
+        expected.update_valid_mask_nk()
+        agent_trajectory = ObjectiveFunction._agent_trajectory(trajectories, i * n, (i + 1) * n)
+        assert(np.allclose(agent_trajectory.position_nk2(), expected.position_nk2(), atol=1e-5))
+        assert(np.allclose(agent_trajectory.heading_nk1(), expected.heading_nk1(), atol=1e-5))
+        assert(np.allclose(agent_trajectory.speed_nk1(), expected.speed_nk1()))
+        assert(np.array_equal(agent_trajectory.valid_horizons_n1, expected.valid_horizons_n1))
+
+        # and so does evaluating the objective of every agent at once
+        obj_vals_n = ObjectiveFunction.evaluate_function_batch([planner.obj_fn for planner in planners[:2]],
+                                                               trajectories)[i * n:(i + 1) * n]
+        assert(np.allclose(obj_vals_n, planners[i].obj_fn.evaluate_function(expected), rtol=1e-4, atol=1e-4))
+
+    # the batched plans are the plans of every agent
+    batch_data = SamplingPlanner.optimize_batch(planners, start_configs)
+    for planner, start_config, data in zip(planners, start_configs, batch_data):
+        expected = planner.optimize(start_config)
+        assert(np.allclose(data['waypoint_config'].position_and_heading_nk3(),
+                           expected['waypoint_config'].position_and_heading_nk3(), atol=1e-5))
+        assert(np.allclose(data['trajectory'].position_nk2(), expected['trajectory'].position_nk2(), atol=1e-5))
+        assert(data['planning_horizon'] == expected['planning_horizon'])
+        assert(np.allclose(data['K_nkfd'], expected['K_nkfd'], atol=1e-5))
+
+
+def test_greedy_plan():
+    with temporary_pipeline_dir() as pipeline_dir:
+        _test_greedy_plan(pipeline_dir)
+
+
+def _test_greedy_plan(pipeline_dir):
+    planner = create_planner(None, pipeline_dir)
+    pipeline = planner.control_pipeline
+    start_config = generate_config_from_pos_3([1., 1., .3], v=.4)
+    goal_config = generate_config_from_pos_3([2.5, 1.8, .6])
+    idx = pipeline._compute_bin_idx_for_start_velocities(start_config.speed_nk1()[:, :, 0])[0]
+    # the k-d tree over the waypoints of a bin is built when the bin is loaded
+    assert(all((waypt_index is None) == (not loaded)
+               for waypt_index, loaded in zip(pipeline.waypt_indices, pipeline.bins_loaded)))
+    waypt_idx = pipeline.closest_waypt_idxs(idx, start_config, goal_config)[0]
+    assert(pipeline.waypt_indices[idx] is not None)
+    assert(pipeline.waypt_index(pipeline.waypt_configs[idx]) is pipeline.waypt_indices[idx])
+
+    # planning to the closest waypoint returns the same (egocentric) waypoint and controller as planning to all
+    # the waypoints, so the plans built from either are the same
+    greedy_data = pipeline.plan(start_config, goal_config, greedy=True, workspace=planner.pipeline_workspace)
+    assert(greedy_data[0].n == 1 and greedy_data[2].n == 1)
+    assert(np.allclose(greedy_data[0].position_and_heading_nk3(),
+                       pipeline.waypt_configs[idx][waypt_idx].position_and_heading_nk3()))
+    greedy_plan = planner._collect_optimal_plan(start_config, np.zeros(1), *greedy_data)
+    obj_vals = np.ones(pipeline.bin_sizes[idx])
+    obj_vals[waypt_idx] = 0.
+    plan = planner._collect_optimal_plan(start_config, obj_vals,
+                                         *pipeline.plan(start_config, workspace=planner.pipeline_workspace))
+    assert(np.allclose(greedy_plan['waypoint_config'].position_and_heading_nk3(),
+                       plan['waypoint_config'].position_and_heading_nk3(), atol=1e-5))
+    assert(np.allclose(greedy_plan['trajectory'].position_nk2(), plan['trajectory'].position_nk2(), atol=1e-5))
+    assert(greedy_plan['planning_horizon'] == plan['planning_horizon'])
+    assert(np.allclose(greedy_plan['K_nkfd'], plan['K_nkfd']) and np.allclose(greedy_plan['k_nkf1'],
+                                                                               plan['k_nkf1']))
+
+
+def pos3_dist(pos3_n3, pos3_3):
+    diff_n3 = pos3_n3 - pos3_3
+    diff_n3[..., 2] = angle_normalize(diff_n3[..., 2])
+    return np.linalg.norm(diff_n3, axis=-1)
+
+
+def test_plan_reuse():
+    with temporary_pipeline_dir() as pipeline_dir:
+        _test_plan_reuse(pipeline_dir)
+
+
+def _test_plan_reuse(pipeline_dir):
+    plan_reuse = DotMap(enabled=True, cost_margin=0., min_horizon_s=1., warm_start_radius=.2)
+    planner = create_planner(create_obj_fn(create_obstacle_map(), [5., 4.]), pipeline_dir,
+                             plan_reuse=plan_reuse)
+    data = planner.optimize(generate_config_from_pos_3([1., 1., .3], v=.4))
+    assert(planner.last_plan is not None)
+
+    # starting along the last plan (in a scene that did not change) reuses the rest of it
+    start_config = SystemConfig.init_config_from_trajectory_time_index(data['trajectory'], t=5)
+    reused = planner.optimize(start_config)
+    assert(planner.plan_reuse_report()['num_reused'] == 1)
+    assert(np.allclose(reused['trajectory'].position_nk2(), data['trajectory'].position_nk2()[:, 5:]))
+    assert(reused['planning_horizon'] == data['planning_horizon'] - 5)
+    # (as are the reference trajectory and the LQR controllers, which stay in step with the trajectory)
+    assert(np.allclose(reused['spline_trajectory'].position_nk2(), data['spline_trajectory'].position_nk2()[:, 5:]))
+    if planner.params.control_pipeline_params.discard_LQR_controller_data:
+        assert(reused['K_nkfd'].shape == data['K_nkfd'].shape and reused['k_nkf1'].shape == data['k_nkf1'].shape)
+    else:
+        assert(np.array_equal(reused['K_nkfd'], data['K_nkfd'][:, 5:]))
+    assert(np.allclose(reused['waypoint_config'].position_and_heading_nk3(),
+                       data['waypoint_config'].position_and_heading_nk3()))
+
+    # further along (and off) the last plan only the waypoints near its waypoint (in the world) are searched
+    last_waypt_3 = planner.last_plan['waypoint_config'].position_and_heading_nk3()[0, 0]
+    config = SystemConfig.init_config_from_trajectory_time_index(planner.last_plan['trajectory'], t=20)
+    start_config = generate_config_from_pos_3(config.position_and_heading_nk3()[0, 0] + [0., 0., .05],
+                                              v=config.speed_nk1()[0, 0, 0])
+    warm_started = planner.optimize(start_config)
+    report = planner.plan_reuse_report()
+    assert(report['num_plans'] == 3 and report['num_reused'] == 1 and report['num_warm_started'] == 1)
+    assert(planner.warm_start_waypt is None)
+    waypts = planner.control_pipeline.plan(start_config, workspace=planner.pipeline_workspace)[0]
+    waypts_world = planner.control_pipeline.system_dynamics.to_world_coordinates(start_config, waypts, mode='new')
+    closest_dist = np.min(pos3_dist(waypts_world.position_and_heading_nk3()[:, 0], last_waypt_3))
+    waypt_3 = warm_started['waypoint_config'].position_and_heading_nk3()[0, 0]
+    assert(pos3_dist(waypt_3, last_waypt_3) <= closest_dist + plan_reuse.warm_start_radius + 1e-5)
+
+
+def main_test():
+    np.random.seed(seed=1)
+    test_hierarchical_search()
+    test_optimize_batch()
+    test_greedy_plan()
+    test_plan_reuse()
+    print("%sSampling planner tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
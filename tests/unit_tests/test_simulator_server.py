@@ -0,0 +1,82 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+from dotmap import DotMap
+from utils.utils import request_session, session_name
+from utils.utils import color_green, color_reset
+
+
+def record_session(p):
+    """A session (run in a worker process) that only logs when it started and finished"""
+    start_t = time.time()
+    time.sleep(0.2)
+    with open(os.path.join(p.session_log_dir, p.robot_params.session_id), 'w') as f:
+        f.write('%f %f' % (start_t, time.time()))
+
+
+def create_params(tmp_dir, num_session_workers):
+    p = DotMap()
+    p.session_log_dir = tmp_dir
+    p.robot_params = DotMap(server_ID=os.path.join(tmp_dir, 'server_socket'),
+                            recv_ID=os.path.join(tmp_dir, 'recv_socket'),
+                            send_ID=os.path.join(tmp_dir, 'send_socket'),
+                            num_session_workers=num_session_workers)
+    return p
+
+
+def test_simulator_server():
+    from simulators.simulator_server import SimulatorServer
+    tmp_dir = tempfile.mkdtemp()
+    p = create_params(tmp_dir, num_session_workers=1)
+    server = SimulatorServer(p, session_fn=record_session, verbose=False)
+    try:
+        server.start()
+        num_clients = 2
+        accept_thread = threading.Thread(target=lambda: [server.accept_once() for _ in range(num_clients)])
+        accept_thread.start()
+        sessions = [request_session(p.robot_params.server_ID, "session: client_%d" % i)
+                    for i in range(num_clients)]
+        accept_thread.join(timeout=5.)
+        assert(not accept_thread.is_alive())
+
+        # every client is given its own session and sockets
+        session_ids = [session['session_id'] for session in sessions]
+        assert(len(set(session_ids)) == num_clients)
+        for session in sessions:
+            assert(session['recv_ID'] == session_name(p.robot_params.recv_ID, session['session_id']))
+            assert(session['send_ID'] == session_name(p.robot_params.send_ID, session['session_id']))
+        socket_ids = [session['recv_ID'] for session in sessions] + [session['send_ID'] for session in sessions]
+        assert(len(set(socket_ids)) == 2 * num_clients)
+
+        # the sessions run one at a time (on the single worker) and the finished ones are reaped
+        # (a session that was just taken off the queue is neither pending nor active yet, so wait for its log)
+        log_files = [os.path.join(tmp_dir, session_id) for session_id in session_ids]
+        max_active = 0
+        timeout_t = time.time() + 10.
+        while (len(server.active_sessions) > 0 or not all(os.path.exists(f) for f in log_files)) and \
+                time.time() < timeout_t:
+            max_active = max(max_active, len(server.active_sessions))
+            time.sleep(0.005)
+        assert(len(server.active_sessions) == 0 and server.pending_sessions.empty())
+        assert(max_active <= server.num_workers)
+        session_ts = []
+        for log_file in log_files:
+            with open(log_file) as f:
+                session_ts.append([float(t) for t in f.read().split()])
+        session_ts.sort()
+        assert(session_ts[0][1] <= session_ts[1][0])
+    finally:
+        server.shutdown()
+        assert(not os.path.exists(p.robot_params.server_ID))
+        shutil.rmtree(tmp_dir)
+
+
+def main_test():
+    test_simulator_server()
+    print("%sSimulator server tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
@@ -4,6 +4,7 @@ from trajectory.spline.spline_3rd_order import Spline3rdOrder
 from trajectory.trajectory import SystemConfig
 from dotmap import DotMap
 from utils.utils import color_reset, color_green
+from utils.precision import get_float_dtype, set_float_dtype
 
 
 def test_spline_3rd_order(visualize=False):
@@ -218,9 +219,62 @@ def test_spline_rescaling():
     assert valid_idxs_n[0] == 0
 
 
+def test_spline_time_grid():
+    # Evaluating on a (cached) time grid matches evaluating on the tiled grid,
+    # before and after rescaling the horizons (in float64 to compare the paths
+    # rather than their float32 rounding)
+    float_dtype = get_float_dtype()
+    set_float_dtype(np.float64)
+    try:
+        _test_spline_time_grid()
+    finally:
+        set_float_dtype(float_dtype)
+
+
+def _test_spline_time_grid():
+    np.random.seed(seed=1)
+    n, dt, k, horizon_s = 50, .05, 60, 3.
+    start_config = SystemConfig(dt, n, 1,
+                                speed_nk1=np.random.uniform(0., .6, size=(n, 1, 1)),
+                                variable=False)
+    goal_config = SystemConfig(dt, n, k=1,
+                               position_nk2=np.random.uniform(.2, 2., size=(n, 1, 2)),
+                               heading_nk1=np.random.uniform(-np.pi / 2, np.pi / 2, size=(n, 1, 1)),
+                               variable=True)
+    p = DotMap(spline_params=DotMap(epsilon=1e-5))
+    splines = [Spline3rdOrder(dt=dt, k=k, n=n, params=p.spline_params) for _ in range(3)]
+    for spline in splines:
+        spline.fit(start_config, goal_config, final_times_n1=np.ones((n, 1)) * horizon_s)
+    splines[0].eval_spline(np.tile(np.linspace(0., horizon_s, k)[None], [n, 1]), calculate_speeds=True)
+    splines[1].eval_spline_on_time_grid(horizon_s, k, calculate_speeds=True)
+    for rescale in [False, True]:
+        if rescale:
+            for spline in splines[:2]:
+                spline.rescale_spline_horizon_to_dynamically_feasible_horizon(.6, 1.1, minimum_horizon=1.)
+            assert(np.allclose(splines[0].final_times_n1, splines[1].final_times_n1))
+        assert(np.allclose(splines[0].position_nk2(), splines[1].position_nk2(), atol=1e-6))
+        assert(np.allclose(splines[0].heading_nk1(), splines[1].heading_nk1(), atol=1e-6))
+        assert(np.allclose(splines[0].speed_nk1(), splines[1].speed_nk1(), atol=1e-6))
+        assert(np.allclose(splines[0].angular_speed_nk1(), splines[1].angular_speed_nk1(), atol=1e-5))
+
+    # The single pass rescales, filters and evaluates the same splines as the separate steps
+    valid_idxs_n = splines[1].find_trajectories_within_a_horizon(horizon_s)
+    assert(0 < valid_idxs_n.size < n)
+    splines[1].gather_across_batch_dim(valid_idxs_n)
+    assert(np.array_equal(splines[2].fit_dynamically_feasible_on_time_grid(horizon_s, k, .6, 1.1, minimum_horizon=1.),
+                          valid_idxs_n))
+    assert(splines[2].n == valid_idxs_n.size)
+    assert(np.allclose(splines[2].final_times_n1, splines[1].final_times_n1[valid_idxs_n]))
+    assert(np.array_equal(splines[2].valid_horizons_n1, splines[1].valid_horizons_n1))
+    assert(np.allclose(splines[2].position_nk2(), splines[1].position_nk2(), atol=1e-6))
+    assert(np.allclose(splines[2].heading_nk1(), splines[1].heading_nk1(), atol=1e-6))
+    assert(np.allclose(splines[2].speed_nk1(), splines[1].speed_nk1(), atol=1e-6))
+
+
 def main_test():
     test_spline_3rd_order(visualize=False)
     test_spline_rescaling()
+    test_spline_time_grid()
     test_piecewise_spline(visualize=False)
     print("%sSpline tests passed!%s" % (color_green, color_reset))
 
@@ -1,6 +1,6 @@
 import numpy as np
 from scipy import interpolate
-from utils.voxel_map_utils import VoxelMap
+from utils.voxel_map_utils import VoxelMap, StackedVoxelMap, compute_voxel_functions
 from utils.utils import color_reset, color_green
 
 
@@ -52,9 +52,59 @@ def test_voxel_interpolation():
                       interpolated_values) <= 0.01) == 6
 
 
+def test_stacked_voxel_interpolation():
+    # The voxel maps of many agents (of the same environment) are interpolated in one pass
+    scale = 0.1
+    grid_size = np.array([31, 31])
+    grid_origin = np.array([5., 6.])
+    voxel_maps = [VoxelMap(scale=scale,
+                           origin_2=np.array(grid_origin / scale, dtype=np.float32),
+                           map_size_2=np.array(grid_size, dtype=np.float32),
+                           function_array_mn=np.random.uniform(size=grid_size[::-1]).astype(np.float32))
+                  for _ in range(3)]
+    position_mnk2 = np.random.uniform(4.9, 8.3, size=(3, 4, 5, 2)).astype(np.float32)
+    values_mnk = compute_voxel_functions(voxel_maps, position_mnk2, invalid_value=-1.)
+    for i, voxel_map in enumerate(voxel_maps):
+        expected_nk = voxel_map.compute_voxel_function(position_mnk2[i], invalid_value=-1.)
+        assert np.allclose(values_mnk[i], expected_nk)
+
+
+def test_multi_channel_voxel_interpolation():
+    # Many voxel maps of the same grid are looked up at the same positions together
+    scale = 0.1
+    grid_size = np.array([31, 27])
+    grid_origin = np.array([5., 6.])
+    voxel_maps = [VoxelMap(scale=scale,
+                           origin_2=np.array(grid_origin / scale, dtype=np.float32),
+                           map_size_2=np.array(grid_size, dtype=np.float32),
+                           function_array_mn=np.random.uniform(size=grid_size[::-1]).astype(np.float32))
+                  for _ in range(3)]
+    stacked_voxel_map = StackedVoxelMap(voxel_maps)
+    position_nk2 = np.random.uniform(4.9, 8.3, size=(4, 5, 2)).astype(np.float32)
+    values_nkc = stacked_voxel_map.compute_voxel_functions(position_nk2, invalid_value=-1.)
+    for c, voxel_map in enumerate(voxel_maps):
+        assert np.array_equal(values_nkc[:, :, c],
+                              voxel_map.compute_voxel_function(position_nk2, invalid_value=-1.))
+
+    # The lookup follows the maps when they are assigned new functions
+    voxel_maps[1].voxel_function_mn = voxel_maps[1].voxel_function_mn * 2.
+    values_nkc = stacked_voxel_map.compute_voxel_functions(position_nk2, invalid_value=-1.)
+    assert np.array_equal(values_nkc[:, :, 1],
+                          voxel_maps[1].compute_voxel_function(position_nk2, invalid_value=-1.))
+
+    # and reads the (possibly shared, read only) function arrays of the maps without keeping a copy of them
+    for voxel_map in voxel_maps:
+        voxel_map.voxel_function_mn.setflags(write=False)
+    assert np.array_equal(stacked_voxel_map.compute_voxel_functions(position_nk2, invalid_value=-1.), values_nkc)
+    assert not any(isinstance(value, np.ndarray) and value.size >= np.prod(grid_size)
+                   for value in vars(stacked_voxel_map).values())
+
+
 def main_test():
     np.random.seed(seed=1)
     test_voxel_interpolation()
+    test_stacked_voxel_interpolation()
+    test_multi_channel_voxel_interpolation()
     print("%sVoxel interpolation tests passed!%s" % (color_green, color_reset))
 
 
@@ -0,0 +1,53 @@
+import numpy as np
+from trajectory.trajectory import SystemConfig
+from control_pipelines.waypoint_index import WaypointIndex
+from control_pipelines.control_pipeline_v0_helper import ControlPipelineV0Helper
+from utils.angle_utils import angle_normalize
+from utils.utils import color_green, color_reset
+
+
+def test_waypoint_index():
+    np.random.seed(seed=1)
+    n = 500
+    waypt_configs = SystemConfig(dt=0.05, n=n, k=1,
+                                 position_nk2=np.random.uniform(-2., 2., size=(n, 1, 2)),
+                                 heading_nk1=np.random.uniform(-np.pi, np.pi, size=(n, 1, 1)))
+    waypt_index = WaypointIndex(waypt_configs)
+    helper = ControlPipelineV0Helper()
+    # goals with headings near the wrap around (and outside of [-pi, pi))
+    headings = [np.pi - 1e-3, -np.pi + 1e-3, 3 * np.pi / 2, 0.1]
+    for heading in headings:
+        goal_config = SystemConfig(dt=0.05, n=1, k=1,
+                                   position_nk2=np.random.uniform(-2., 2., size=(1, 1, 2)),
+                                   heading_nk1=np.array([[[heading]]]))
+        idxs, dists = waypt_index.query(goal_config, k=5)
+        assert(idxs[0] == helper.compute_closest_waypt_idx(goal_config, waypt_configs))
+
+        # the k closest waypoints are distinct and match a brute force search
+        diff_pos_n2 = waypt_configs.position_nk2()[:, 0] - goal_config.position_nk2()[0]
+        diff_heading_n = angle_normalize(waypt_configs.heading_nk1()[:, 0, 0] - heading)
+        dist_n = np.sqrt(np.sum(diff_pos_n2 ** 2, axis=1) + diff_heading_n ** 2)
+        assert(np.array_equal(idxs, np.argsort(dist_n)[:5]))
+        assert(np.allclose(dists, np.sort(dist_n)[:5], atol=1e-5))
+
+    # the neighbourhoods of waypoints (near the wrap around as well) match a brute force search
+    pos3_n3 = np.concatenate([waypt_configs.position_nk2()[:, 0], waypt_configs.heading_nk1()[:, 0]], axis=1)
+    waypt_idxs = [int(np.argmax(pos3_n3[:, 2])), int(np.argmin(pos3_n3[:, 2])), 7]
+    for radius in [0., .3, .8]:
+        near_n = np.zeros(n, dtype=bool)
+        for idx in waypt_idxs:
+            diff_n3 = pos3_n3 - pos3_n3[idx]
+            diff_n3[:, 2] = angle_normalize(diff_n3[:, 2])
+            near_n |= np.linalg.norm(diff_n3, axis=1) <= radius
+        near_idxs = waypt_index.query_radius(waypt_idxs, radius)
+        assert(np.array_equal(near_idxs, np.where(near_n)[0]))
+        assert(set(waypt_idxs) <= set(near_idxs))
+
+
+def main_test():
+    test_waypoint_index()
+    print("%sWaypoint index tests passed!%s" % (color_green, color_reset))
+
+
+if __name__ == '__main__':
+    main_test()
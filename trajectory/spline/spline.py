@@ -19,7 +19,7 @@ class Spline(Trajectory):
 
         # Convert velocities and accelerations to real world time
         self.rescale_velocity_and_acceleration(
-            np.ones((self.n, 1)), self.final_times_n1)
+            np.ones((self.n, 1), dtype=self.final_times_n1.dtype), self.final_times_n1)
 
     def _eval_spline(self, ts_nk, calculate_speeds=True):
         """ Evaluates the spline on points in ts_nk
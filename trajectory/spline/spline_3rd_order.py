@@ -1,11 +1,17 @@
 from trajectory.spline.spline import Spline
+from utils.precision import as_float
 import numpy as np
 
 
 class Spline3rdOrder(Spline):
+    # The polynomial bases of the time grids the splines are evaluated on, keyed by (k, horizon)
+    _time_grid_bases = {}
+
     def __init__(self, dt, n, k, params):
         super(Spline3rdOrder, self).__init__(dt=dt, n=n, k=k)
         self.params = params
+        # The (k, horizon) of the time grid the spline was last evaluated on (if any)
+        self._time_grid = None
 
     """ A class representing a 3rd order spline for a mobile ground robot
     (in a 2d cartesian plane). The 3rd order spline allows for constraints
@@ -32,11 +38,12 @@ class Spline3rdOrder(Spline):
             factor2_n1 = factor1_n1
             factors_n2 = np.concatenate([factor1_n1, factor2_n1], axis=1)
         else:
-            factors_n2 = factors
+            factors_n2 = as_float(factors, self.dtype)
 
         # Compute the final times
         if final_times_n1 is None:
-            final_times_n1 = np.ones((self.n, 1))
+            final_times_n1 = np.ones((self.n, 1), dtype=self.dtype)
+        final_times_n1 = as_float(final_times_n1, self.dtype)
 
         # Fit spline
         # with tf.name_scope('fit_spline'):
@@ -85,45 +92,124 @@ class Spline3rdOrder(Spline):
         """ Evaluates the spline on points in ts_nk
         Assumes ts is normalized to be in [0, 1.]
         """
-        x_coeffs_n14 = self.x_coeffs_n14
-        y_coeffs_n14 = self.y_coeffs_n14
-        p_coeffs_n14 = self.p_coeffs_n14
-
+        self._time_grid = None
         # with tf.name_scope('eval_spline'):
         ts_n4k = np.stack([np.power(ts_nk, 3), np.power(ts_nk, 2),
                            ts_nk, np.ones_like(ts_nk)], axis=1)
-        ps_nk = np.squeeze(np.matmul(p_coeffs_n14, ts_n4k), axis=1)
-
+        # p and dp/dt in one product
+        ps_n2k = np.matmul(self._stack_with_derivatives(self.p_coeffs_n14, 1), ts_n4k)
+        self._eval_spline_from_ps(ps_n2k[:, 0], ps_n2k[:, 1] if calculate_speeds else None)
+
+    def eval_spline_on_time_grid(self, horizon_s, k, calculate_speeds=True):
+        """ Evaluates the spline on the uniform time grid of k points over [0, horizon_s]
+        (in unnormalized time), the same as eval_spline on that grid tiled over the batch.
+        The basis of the grid is cached (see _time_grid_basis) and the normalization by the final
+        times is folded into the coefficients, so p and dp/dt are a single matrix product.
+        """
+        ts_k, ps_n2k = self._ps_on_time_grid(horizon_s, k)
+        self.ts_nk = np.broadcast_to(ts_k, (self.n, k))
+        self._eval_spline_from_ps(ps_n2k[:, 0], ps_n2k[:, 1] if calculate_speeds else None)
+        self._time_grid = (k, horizon_s)
+
+        # Convert velocities and accelerations to real world time
+        self.rescale_velocity_and_acceleration(
+            np.ones((self.n, 1), dtype=ts_k.dtype), self.final_times_n1)
+
+    def _ps_on_time_grid(self, horizon_s, k):
+        """ Returns the time grid ts_k of eval_spline_on_time_grid and the time polynomial p and
+        dp/dt (w.r.t. normalized time) on it, stacked along axis 1 (n, 2, k)."""
+        ts_k, ts_4k = self._time_grid_basis(k, horizon_s, self.final_times_n1.dtype)
+
+        # p(t/tf) = sum_c p_c (t/tf)^c = sum_c (p_c / tf^c) t^c (and the same for dp/dt)
+        p_coeffs_n24 = self._stack_with_derivatives(self.p_coeffs_n14, 1)
+        scales_n14 = self.final_times_n1[:, :, None] ** np.array([-3., -2., -1., 0.], dtype=ts_k.dtype)
+        ps_n2k = np.matmul((p_coeffs_n24 * scales_n14).reshape(-1, 4), ts_4k).reshape(self.n, 2, k)
+
+        # past the final time the normalized time is clipped to 1
+        clipped_n1k = (ts_k[None] > self.final_times_n1)[:, None]
+        return ts_k, np.where(clipped_n1k, np.sum(p_coeffs_n24, axis=2, keepdims=True), ps_n2k)
+
+    def fit_dynamically_feasible_on_time_grid(self, horizon_s, k, speed_max_system, angular_speed_max_system,
+                                              minimum_horizon=0.0):
+        """ The single pass equivalent of eval_spline_on_time_grid,
+        rescale_spline_horizon_to_dynamically_feasible_horizon and find_trajectories_within_a_horizon(horizon_s)
+        followed by gathering the valid splines. The dynamically feasible horizon of every spline is computed
+        directly from its coefficients (from the derivatives of x, y and p on the time grid, without evaluating
+        the positions and headings), then only the splines feasible within horizon_s are kept (the batch size of
+        the spline changes) and evaluated once on the time grid with their new final times.
+        Returns the batch indices of the valid splines."""
+        # speed and angular speed on the time grid (in real world time) as in _eval_spline_from_ps
+        ts_k, ps_n2k = self._ps_on_time_grid(horizon_s, k)
+        ps_nk, ps_dot_nk = ps_n2k[:, 0], ps_n2k[:, 1]
+        xy_coeffs_n24 = np.concatenate([self.x_coeffs_n14, self.y_coeffs_n14], axis=1)
+        derivs_coeffs_n44 = self._stack_with_derivatives(xy_coeffs_n24, 2)[:, 2:]
         ps_n4k = np.stack([np.power(ps_nk, 3), np.power(ps_nk, 2),
                            ps_nk, np.ones_like(ps_nk)], axis=1)
-        ps_dot_n4k = np.stack([3.0 * np.power(ps_nk, 2), 2.0 * ps_nk,
-                               np.ones_like(ps_nk), np.zeros_like(ps_nk)],
-                              axis=1)
-
-        xs_nk = np.squeeze(np.matmul(x_coeffs_n14, ps_n4k), axis=1)
-        ys_nk = np.squeeze(np.matmul(y_coeffs_n14, ps_n4k), axis=1)
+        xs_dot_nk, ys_dot_nk, xs_ddot_nk, ys_ddot_nk = np.moveaxis(np.matmul(derivs_coeffs_n44, ps_n4k), 1, 0)
+        speed_ps_nk = np.sqrt(xs_dot_nk**2 + ys_dot_nk**2)
+        time_scaling_factor_n1 = self.final_times_n1 / np.ones((self.n, 1), dtype=ts_k.dtype)
+        max_speed_n1 = np.amax(speed_ps_nk * ps_dot_nk / time_scaling_factor_n1, axis=1, keepdims=True)
+        numerator_nk = xs_dot_nk * ys_ddot_nk - ys_dot_nk * xs_ddot_nk
+        max_angular_speed_n1 = np.amax(np.abs(numerator_nk / (speed_ps_nk**2) * ps_dot_nk / time_scaling_factor_n1),
+                                       axis=1, keepdims=True)
+
+        # the horizon (see compute_dynamically_feasible_horizon) and the splines feasible within horizon_s
+        required_horizon_n1 = np.maximum(self.final_times_n1 * max_speed_n1 / speed_max_system,
+                                         self.final_times_n1 * max_angular_speed_n1 / angular_speed_max_system)
+        required_horizon_n1 = np.maximum(required_horizon_n1, minimum_horizon)
+        valid_idxs_n = np.where(required_horizon_n1 <= horizon_s)[0].astype(np.int32)
+
+        # only evaluate the valid splines (with their feasible horizons)
+        self.n = valid_idxs_n.size
+        self.x_coeffs_n14 = self.x_coeffs_n14[valid_idxs_n]
+        self.y_coeffs_n14 = self.y_coeffs_n14[valid_idxs_n]
+        self.p_coeffs_n14 = self.p_coeffs_n14[valid_idxs_n]
+        self.final_times_n1 = required_horizon_n1[valid_idxs_n]
+        self.valid_horizons_n1 = np.ceil(self.final_times_n1 / self.dt)
+        self.eval_spline_on_time_grid(horizon_s, k, calculate_speeds=True)
+        return valid_idxs_n
+
+    @classmethod
+    def _time_grid_basis(cls, k, horizon_s, dtype=np.float64):
+        """ Returns the uniform time grid ts_k of k points over [0, horizon_s] and the
+        polynomial basis [t^3, t^2, t, 1] on it (of dimension (4, k)). These are cached
+        by (k, horizon_s, dtype) as the splines are evaluated on the same grids many times."""
+        key = (k, float(horizon_s), np.dtype(dtype))
+        if key not in cls._time_grid_bases:
+            ts_k = np.linspace(0., horizon_s, k)
+            ts_4k = np.stack([ts_k ** 3, ts_k ** 2, ts_k, np.ones_like(ts_k)], axis=0)
+            cls._time_grid_bases[key] = (ts_k.astype(dtype), ts_4k.astype(dtype))
+        return cls._time_grid_bases[key]
 
-        xs_dot_nk = np.squeeze(np.matmul(x_coeffs_n14, ps_dot_n4k), axis=1)
-        ys_dot_nk = np.squeeze(np.matmul(y_coeffs_n14, ps_dot_n4k), axis=1)
+    @staticmethod
+    def _stack_with_derivatives(coeffs_nm4, num_derivatives):
+        """ Stacks the coefficients of cubic polynomials in the basis [p^3, p^2, p, 1] with the
+        coefficients of their first num_derivatives derivatives in the same basis along axis 1
+        (i.e. [a, b, c, d] -> [0, 3a, 2b, c] for the first derivative)."""
+        coeffs = [coeffs_nm4]
+        for _ in range(num_derivatives):
+            coeffs.append(np.concatenate([np.zeros_like(coeffs[-1][:, :, :1]),
+                                          coeffs[-1][:, :, :3] * np.array([3., 2., 1.], dtype=coeffs_nm4.dtype)],
+                                         axis=2))
+        return np.concatenate(coeffs, axis=1)
+
+    def _eval_spline_from_ps(self, ps_nk, ps_dot_nk=None):
+        """ Evaluates the x and y polynomials of the spline at the points ps_nk of the time
+        polynomial. If ps_dot_nk (dp/dt) is given the speeds are computed as well.
+        x and y and their derivatives are one batched matrix product of their stacked
+        coefficients with the basis [p^3, p^2, p, 1]."""
+        xy_coeffs_n24 = np.concatenate([self.x_coeffs_n14, self.y_coeffs_n14], axis=1)
+        xy_coeffs_nm4 = self._stack_with_derivatives(xy_coeffs_n24, 2 if ps_dot_nk is not None else 1)
+        ps_n4k = np.stack([np.power(ps_nk, 3), np.power(ps_nk, 2),
+                           ps_nk, np.ones_like(ps_nk)], axis=1)
+        xy_nmk = np.matmul(xy_coeffs_nm4, ps_n4k)
+        xs_nk, ys_nk, xs_dot_nk, ys_dot_nk = xy_nmk[:, 0], xy_nmk[:, 1], xy_nmk[:, 2], xy_nmk[:, 3]
 
         self._position_nk2 = np.stack([xs_nk, ys_nk], axis=2)
         self._heading_nk1 = np.arctan2(ys_dot_nk, xs_dot_nk)[:, :, None]
 
-        if calculate_speeds:
-            ts_dot_n4k = np.stack([3.0 * np.power(ts_nk, 2), 2.0 * ts_nk,
-                                   np.ones_like(ts_nk), np.zeros_like(ts_nk)],
-                                  axis=1)
-            ps_ddot_n4k = np.stack([6.0 * ps_nk, 2.0 * np.ones_like(ps_nk),
-                                    np.zeros_like(ps_nk),
-                                    np.zeros_like(ps_nk)], axis=1)
-
-            ps_dot_nk = np.squeeze(
-                np.matmul(p_coeffs_n14, ts_dot_n4k), axis=1)
-
-            xs_ddot_nk = np.squeeze(
-                np.matmul(x_coeffs_n14, ps_ddot_n4k), axis=1)
-            ys_ddot_nk = np.squeeze(
-                np.matmul(y_coeffs_n14, ps_ddot_n4k), axis=1)
+        if ps_dot_nk is not None:
+            xs_ddot_nk, ys_ddot_nk = xy_nmk[:, 4], xy_nmk[:, 5]
 
             speed_ps_nk = np.sqrt(xs_dot_nk**2 + ys_dot_nk**2)
             speed_nk = (speed_ps_nk * ps_dot_nk)
@@ -191,7 +277,11 @@ class Spline3rdOrder(Spline):
         self.valid_horizons_n1 = np.ceil(self.final_times_n1 / self.dt)
 
         # Reevaluate the spline to be consistent with the new horizon
-        self.eval_spline(self.ts_nk)
+        # (reusing the cached basis if it was evaluated on a time grid)
+        if self._time_grid is not None:
+            self.eval_spline_on_time_grid(self._time_grid[1], self._time_grid[0])
+        else:
+            self.eval_spline(self.ts_nk)
 
     def find_trajectories_within_a_horizon(self, horizon_s):
         """
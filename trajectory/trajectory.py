@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import copy
+from utils.precision import get_float_dtype, as_float
 
 
 class Trajectory(object):
@@ -11,10 +12,13 @@ class Trajectory(object):
 
     def __init__(self, dt, n, k, position_nk2=None, speed_nk1=None, acceleration_nk1=None, heading_nk1=None,
                  angular_speed_nk1=None, angular_acceleration_nk1=None,
-                 dtype=np.float32, variable=True, direct_init=False,
+                 dtype=None, variable=True, direct_init=False,
                  valid_horizons_n1=None,
                  track_trajectory_acceleration=True,
                  check_dimens=True):
+        # Floating point precision of every array (defaults to the precision policy, see utils.precision)
+        dtype = get_float_dtype() if dtype is None else dtype
+        self.dtype = dtype
 
         # Check dimensions now to make your life easier later
         if position_nk2 is not None and check_dimens:
@@ -35,9 +39,9 @@ class Trajectory(object):
         # Number of timesteps
         self.k = k
         if valid_horizons_n1 is None:
-            self.valid_horizons_n1 = np.ones((n, 1), dtype=np.float32) * k
+            self.valid_horizons_n1 = np.full((n, 1), k, dtype=dtype)
         else:
-            self.valid_horizons_n1 = np.array(valid_horizons_n1)
+            self.valid_horizons_n1 = np.array(valid_horizons_n1, dtype=dtype)
 
         # Batch Size
         self.n = n
@@ -46,18 +50,19 @@ class Trajectory(object):
         # then set them to be arrays of size
         # (1, 1, 0) to save memory
         if not track_trajectory_acceleration:
-            angular_acceleration_nk1 = np.array([[[]]], dtype=np.float32)
-            acceleration_nk1 = np.array([[[]]], dtype=np.float32)
+            angular_acceleration_nk1 = np.array([[[]]], dtype=dtype)
+            acceleration_nk1 = np.array([[[]]], dtype=dtype)
 
         self.vars = []
         # When these are already all tensorflow object use direct-init
+        # (the arrays are used as is, i.e. not copied, unless they have to be cast to dtype)
         if direct_init:
-            self._position_nk2 = position_nk2
-            self._speed_nk1 = speed_nk1
-            self._acceleration_nk1 = acceleration_nk1
-            self._heading_nk1 = heading_nk1
-            self._angular_speed_nk1 = angular_speed_nk1
-            self._angular_acceleration_nk1 = angular_acceleration_nk1
+            self._position_nk2 = as_float(position_nk2, dtype)
+            self._speed_nk1 = as_float(speed_nk1, dtype)
+            self._acceleration_nk1 = as_float(acceleration_nk1, dtype)
+            self._heading_nk1 = as_float(heading_nk1, dtype)
+            self._angular_speed_nk1 = as_float(angular_speed_nk1, dtype)
+            self._angular_acceleration_nk1 = as_float(angular_acceleration_nk1, dtype)
         else:
             # Translational trajectories
             self._position_nk2 = np.zeros([n, k, 2], dtype=dtype) if position_nk2 is None \
@@ -83,32 +88,34 @@ class Trajectory(object):
         var_names = [self._position_nk2, self.valid_horizons_n1, self._speed_nk1,
                      self._acceleration_nk1, self._heading_nk1, self._angular_speed_nk1,
                      self._angular_acceleration_nk1]
-        return np.sum([var_name.numpy().nbytes for var_name in var_names])
+        return np.sum([var_name.nbytes for var_name in var_names])
 
     @classmethod
     def init_from_numpy_repr(cls, dt, n, k, position_nk2, speed_nk1,
                              acceleration_nk1, heading_nk1, angular_speed_nk1,
                              angular_acceleration_nk1, valid_horizons_n1,
-                             track_trajectory_acceleration=True):
+                             track_trajectory_acceleration=True, direct_init=False):
         """Utility function to initialize a trajectory object from its numpy
-        representation. Useful for loading pickled trajectories"""
+        representation. Useful for loading pickled trajectories. With direct_init
+        the arrays are used as is (without copying), i.e. for memory-mapped arrays."""
         return cls(dt=dt, n=n, k=k, position_nk2=position_nk2,
                    speed_nk1=speed_nk1, acceleration_nk1=acceleration_nk1,
                    heading_nk1=heading_nk1,
                    angular_speed_nk1=angular_speed_nk1,
                    angular_acceleration_nk1=angular_acceleration_nk1,
                    valid_horizons_n1=valid_horizons_n1,
-                   variable=False,
+                   variable=False, direct_init=direct_init,
                    track_trajectory_acceleration=track_trajectory_acceleration)
 
     def update_valid_mask_nk(self):
         """Update this trajectories valid mask. The valid mask is a mask of 1's
         and 0's at the trajectories sampling interval where 1's represent
         trajectory data within the valid horizon and 0's otherwise."""
+        dtype = self._position_nk2.dtype
         all_valid_nk = np.broadcast_to(
-            np.arange(self.k, dtype=np.float32) + 1, (self.n, self.k))
+            np.arange(self.k, dtype=dtype) + 1, (self.n, self.k))
         self.valid_mask_nk = (
-            all_valid_nk <= self.valid_horizons_n1).astype(np.float32)
+            all_valid_nk <= self.valid_horizons_n1).astype(dtype)
 
     def assign_from_trajectory_batch_idx(self, trajectory, batch_idx):
         """Assigns a trajectory object's instance variables from the trajectory stored
@@ -413,6 +420,23 @@ class Trajectory(object):
                    angular_speed_nk1=angular_speed_nk1,
                    angular_acceleration_nk1=trajectory.angular_acceleration_nk1()[:, :horizon])
 
+    @classmethod
+    def new_traj_clip_from_time_index(cls, trajectory, t):
+        """
+        Utility function for dropping the first t time steps of
+        a trajectory (i.e. the part that has already been followed).
+        The valid horizons are shortened accordingly.
+        """
+        return cls(dt=trajectory.dt, n=trajectory.n, k=trajectory.k - t,
+                   position_nk2=trajectory.position_nk2()[:, t:],
+                   speed_nk1=trajectory.speed_nk1()[:, t:],
+                   acceleration_nk1=trajectory.acceleration_nk1()[:, t:],
+                   heading_nk1=trajectory.heading_nk1()[:, t:],
+                   angular_speed_nk1=trajectory.angular_speed_nk1()[:, t:],
+                   angular_acceleration_nk1=trajectory.angular_acceleration_nk1()[:, t:],
+                   valid_horizons_n1=np.maximum(trajectory.valid_horizons_n1 - t, 0.),
+                   variable=False, direct_init=True)
+
     def __getitem__(self, index):
         """Allow for indexing along the batch dimension similar
         to a regular tensor. Returns a new object corresponding
@@ -491,14 +515,14 @@ class SystemConfig(Trajectory):
 
     def __init__(self, dt, n, k, position_nk2=None, speed_nk1=None, acceleration_nk1=None, heading_nk1=None,
                  angular_speed_nk1=None, angular_acceleration_nk1=None,
-                 dtype=np.float32, variable=True, direct_init=False,
+                 dtype=None, variable=True, direct_init=False,
                  valid_horizons_n1=None,
                  track_trajectory_acceleration=True, check_dimens=True):
         assert(k == 1)
         # Don't pass on valid_horizons_n1 as a SystemConfig has no horizon
         super(SystemConfig, self).__init__(dt, n, k, position_nk2, speed_nk1, acceleration_nk1,
                                            heading_nk1, angular_speed_nk1,
-                                           angular_acceleration_nk1, dtype=np.float32,
+                                           angular_acceleration_nk1, dtype=dtype,
                                            variable=variable, direct_init=direct_init,
                                            track_trajectory_acceleration=track_trajectory_acceleration,
                                            check_dimens=check_dimens)
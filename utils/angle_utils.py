@@ -2,8 +2,14 @@ import numpy as np
 
 
 # Angle normalization function
-def angle_normalize(x):
-    return (((x + np.pi) % (2 * np.pi)) - np.pi)
+def angle_normalize(x, out=None):
+    """Wraps the angles x to [-pi, pi), into out (which may be x) if given."""
+    if out is None:
+        return (((x + np.pi) % (2 * np.pi)) - np.pi)
+    np.add(x, np.pi, out=out)
+    np.mod(out, 2 * np.pi, out=out)
+    out -= np.pi
+    return out
 
 
 def rotate_pos_nk2(pos_nk2, theta_n11):
@@ -5,6 +5,7 @@ if sys.version[0] == '2':
     from voxel_map_utils import VoxelMap
 else:  # python3
     from utils.voxel_map_utils import VoxelMap
+from utils.precision import as_float, get_float_dtype
 
 
 class FmmMap(object):
@@ -12,7 +13,8 @@ class FmmMap(object):
     Maintain a FMM distance and angle map corresponding to a given goal and occupancy grid.
     """
 
-    def __init__(self, goal_grid_mn, dx=1, map_origin_2=np.zeros([2], dtype=np.float32), mask_grid_mn=None):
+    def __init__(self, goal_grid_mn, dx=1, map_origin_2=np.zeros([2], dtype=np.float32), mask_grid_mn=None,
+                 cache=None):
         """
         Args:
             goal_grid_mn: A mxn grid containing the goal positions. Typically, it should have 0s at the goal positions
@@ -21,12 +23,15 @@ class FmmMap(object):
             map_origin_2: The origin of the goal grid.
             mask_grid_mn: The part of the goal array to be masked before computing the fmm distance. Typically, the
                           array should have 1 at the grid points to be masked and 0 everywhere else.
+            cache: An FmmMapCache the (read only) distance and angle maps are shared through (None always computes
+                   them). Only meant for goal grids of _create_fmm_map_goal_array_mn.
         """
         m, n = goal_grid_mn.shape[0], goal_grid_mn.shape[1]
         self.mask_grid_mn = mask_grid_mn
         self.goal_grid_mn = goal_grid_mn
         self.map_origin_2 = map_origin_2
         self.dx = dx
+        self.cache = cache
 
         # generate blank distance/angle voxel (3d pixel) maps
         self.fmm_distance_map = VoxelMap(scale=dx,
@@ -45,6 +50,14 @@ class FmmMap(object):
         """
         Compute the fmm distance based on the goal array and mask array.
         """
+        if self.cache is not None:
+            key = self.cache.key(self.goal_grid_mn, self.dx, self.map_origin_2, self.mask_grid_mn, mask_value,
+                                 get_float_dtype())
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.fmm_distance_map.voxel_function_mn, self.fmm_angle_map.voxel_function_mn = entry
+                return
+
         # Mask the goal array
         # If the mask grid was given, mask the goal grid to flip the 1's and 0's
         # (goal_grid_mn seems to be the best here)
@@ -67,10 +80,10 @@ class FmmMap(object):
         fmm_angle = np.arctan2(-gradient_y, -gradient_x)
 
         # Assign fmm distance map and angle
-        self.fmm_distance_map.voxel_function_mn = np.array(
-            fmm_distance, dtype=np.float32)
-        self.fmm_angle_map.voxel_function_mn = np.array(
-            fmm_angle, dtype=np.float32)
+        self.fmm_distance_map.voxel_function_mn = as_float(fmm_distance)
+        self.fmm_angle_map.voxel_function_mn = as_float(fmm_angle)
+        if self.cache is not None:
+            self.cache.put(key, self.fmm_distance_map.voxel_function_mn, self.fmm_angle_map.voxel_function_mn)
 
     def change_goal(self, goal_positions_n2, mask_value=1000):
         """
@@ -108,7 +121,7 @@ class FmmMap(object):
         return goal_array_mn
 
     @classmethod
-    def create_fmm_map_based_on_goal_position(cls, goal_positions_n2, map_size_2, dx=1, map_origin_2=np.zeros([2], dtype=np.float32), mask_grid_mn=None):
+    def create_fmm_map_based_on_goal_position(cls, goal_positions_n2, map_size_2, dx=1, map_origin_2=np.zeros([2], dtype=np.float32), mask_grid_mn=None, cache=None):
         """
         Create a new fmm map instance based on a given goal position.
         """
@@ -119,4 +132,5 @@ class FmmMap(object):
         return cls(goal_grid_mn=goal_array_mn,
                    dx=dx,
                    map_origin_2=map_origin_2,
-                   mask_grid_mn=mask_grid_mn)
+                   mask_grid_mn=mask_grid_mn,
+                   cache=cache)
@@ -0,0 +1,117 @@
+import numpy as np
+import hashlib
+import os
+import weakref
+from collections import OrderedDict
+
+
+class FmmMapCache(object):
+    """
+    A cache of the fmm distance and angle maps (i.e. their voxel functions) shared by every FmmMap that uses it, so
+    that agents (and episodes) with the same goal cell in the same building solve the fmm once and share the (read
+    only) arrays instead of each owning a copy.
+
+    The maps are keyed by (a hash of) the traversible (i.e. the mask grid), dx, the origin, the goal cells, the mask
+    value and the dtype. The least recently used maps are evicted once the total size of the cached arrays exceeds
+    max_bytes, and if cache_dir is given every map is also saved there (compressed) and reloaded from there after
+    being evicted (or in a later run).
+    """
+    # the cache shared by all the agents (see get_shared_cache)
+    shared = None
+
+    # hashes of the traversibles, indexed by id (they are assumed to not be modified in place)
+    _traversible_hashes = {}
+
+    def __init__(self, max_bytes=512 * 2**20, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get_shared_cache(cls, params):
+        """
+        The cache shared by all the agents, (re)created if params (max_bytes and cache_dir) change. Returns None if
+        the cache is disabled (max_bytes is 0).
+        """
+        if not params or params.get('max_bytes', 0) <= 0:
+            return None
+        c = cls.shared
+        if c is None or c.max_bytes != params.max_bytes or c.cache_dir != params.get('cache_dir', None):
+            cls.shared = cls(max_bytes=params.max_bytes, cache_dir=params.get('cache_dir', None))
+        return cls.shared
+
+    @classmethod
+    def traversible_hash(cls, mask_grid_mn):
+        if mask_grid_mn is None:
+            return None
+        ref_hash = cls._traversible_hashes.get(id(mask_grid_mn), None)
+        if ref_hash is not None and ref_hash[0]() is mask_grid_mn:
+            return ref_hash[1]
+        mask_grid_mn = np.asarray(mask_grid_mn)
+        h = hashlib.sha1(np.ascontiguousarray(mask_grid_mn != 0).tobytes())
+        h.update(str(mask_grid_mn.shape).encode())
+        traversible_hash = h.hexdigest()
+        try:
+            cls._traversible_hashes[id(mask_grid_mn)] = (weakref.ref(mask_grid_mn), traversible_hash)
+        except TypeError:
+            pass
+        return traversible_hash
+
+    @classmethod
+    def key(cls, goal_grid_mn, dx, map_origin_2, mask_grid_mn, mask_value, dtype):
+        """
+        The key of the maps of goal_grid_mn, which is expected to be a goal array of
+        FmmMap._create_fmm_map_goal_array_mn (i.e. only the goal cells are below 0).
+        """
+        goal_cells = np.flatnonzero(np.asarray(goal_grid_mn) < 0).astype(np.int64)
+        return (cls.traversible_hash(mask_grid_mn), tuple(np.shape(goal_grid_mn)), float(dx),
+                tuple(np.asarray(map_origin_2, dtype=np.float64).ravel()), goal_cells.tobytes(),
+                float(mask_value), np.dtype(dtype).name)
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, 'fmm_%s.npz' % hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key):
+        """The (read only) distance and angle maps of key or None if they are not cached"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.cache_dir is not None and os.path.exists(self._filename(key)):
+            with np.load(self._filename(key)) as data:
+                entry = self.put(key, data['distance'], data['angle'], save=False)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, distance_mn, angle_mn, save=True):
+        """Caches the distance and angle maps of key, returns them as read only arrays (to be shared)"""
+        entry = (distance_mn, angle_mn)
+        for array in entry:
+            array.setflags(write=False)
+        if save and self.cache_dir is not None:
+            np.savez_compressed(self._filename(key), distance=distance_mn, angle=angle_mn)
+        if key in self.entries:
+            self.nbytes -= sum(array.nbytes for array in self.entries.pop(key))
+        nbytes = distance_mn.nbytes + angle_mn.nbytes
+        if nbytes <= self.max_bytes:
+            self.entries[key] = entry
+            self.nbytes += nbytes
+            # evict the least recently used maps
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= sum(array.nbytes for array in evicted)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
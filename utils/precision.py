@@ -0,0 +1,30 @@
+import numpy as np
+
+""" The floating point precision policy of the planning stack. Trajectories, SystemConfigs, splines, the voxel
+(i.e. fmm) maps and the objectives create their arrays with (or cast their inputs to) this dtype at construction,
+so the hot paths that combine them never silently upcast. The policy is global (like the seed) and set from the
+precision in [socnav_params] (see central_params).
+"""
+
+FLOAT_DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+_float_dtype = np.float32
+
+
+def set_float_dtype(dtype):
+    """Sets the precision policy to dtype, either float32 or float64 (or their names)"""
+    global _float_dtype
+    if isinstance(dtype, str):
+        assert(dtype in FLOAT_DTYPES)
+        dtype = FLOAT_DTYPES[dtype]
+    assert(np.dtype(dtype) in [np.dtype(np.float32), np.dtype(np.float64)])
+    _float_dtype = np.dtype(dtype).type
+
+
+def get_float_dtype():
+    return _float_dtype
+
+
+def as_float(arr, dtype=None):
+    """arr as an array of the policy dtype (or dtype), only copied if it is not one already"""
+    return np.asarray(arr, dtype=get_float_dtype() if dtype is None else dtype)
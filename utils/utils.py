@@ -299,6 +299,44 @@ def conn_recv(connection, buffr_amnt: int = 1024):
     return data, response_len
 
 
+def session_name(name: str, session_id=None):
+    """Distinguishes a name (socket identifier, algorithm title, etc.) between
+    the sessions hosted by a single simulator server.
+
+    Args:
+        name (str): the name shared by all sessions
+        session_id (optional): the session's unique identifier. Defaults to None (no session).
+
+    Returns:
+        The name unchanged if there is no session, else the name suffixed by the session id
+    """
+    if session_id is None:
+        return name
+    return "%s_session%s" % (name, session_id)
+
+
+def request_session(server_ID: str, message: str):
+    """Requests a new episode session from a running simulator server
+
+    Args:
+        server_ID (str): The AF_UNIX socket identifier the server is listening on.
+        message (str): The session request (ie. "session: <algorithm name>").
+
+    Returns:
+        The server's reply as a dictionary with the "session_id", "recv_ID" and
+        "send_ID" (from the robot's perspective) of the new session.
+    """
+    import socket
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(server_ID)
+    s.sendall(bytes(message, "utf-8"))
+    # signal the end of the request so the server can reply on the same connection
+    s.shutdown(socket.SHUT_WR)
+    data_b, _ = conn_recv(s)
+    s.close()
+    return json.loads(data_b.decode("utf-8"))
+
+
 def mkdir_if_missing(dirname):
     if not os.path.exists(dirname):
         os.makedirs(dirname)
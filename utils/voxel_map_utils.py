@@ -1,4 +1,5 @@
 import numpy as np
+from utils.precision import as_float
 
 
 class VoxelMap(object):
@@ -15,8 +16,9 @@ class VoxelMap(object):
             function_array_mn: The function stored in the voxel grid. The size of the grid is assumed to be mxn, where
             m is the size in the y-dimension and n is in the x-dimension.
         """
-        self.map_scale = np.array(scale, dtype=np.float32)
-        self.map_origin_2 = origin_2
+        # (in the dtype of the precision policy so that the positions are never upcast)
+        self.map_scale = as_float(scale)
+        self.map_origin_2 = as_float(origin_2)
         self.map_size_int32_2 = map_size_2.astype(np.int32)
         self.map_size_float32_2 = map_size_2.astype(np.float32)
         self.voxel_function_mn = function_array_mn
@@ -36,8 +38,8 @@ class VoxelMap(object):
         upper_voxel_indices_nk2_xy = np.mod(
             lower_voxel_indices_nk2_xy + 1, self.map_size_int32_2)
 
-        lower_voxel_float_nk2 = lower_voxel_indices_nk2_xy.astype(np.float32)
-        upper_voxel_float_nk2 = upper_voxel_indices_nk2_xy.astype(np.float32)
+        lower_voxel_float_nk2 = lower_voxel_indices_nk2_xy.astype(voxel_space_position_nk2.dtype)
+        upper_voxel_float_nk2 = upper_voxel_indices_nk2_xy.astype(voxel_space_position_nk2.dtype)
 
         # Voxel indices for 4 corner voxels. Note that indices are stacked out of order for voxel_indices11 to make
         # sure that the first element along axis2 represents y-value (since the voxel map's first dimension is y and
@@ -95,6 +97,14 @@ class VoxelMap(object):
         """
         return position_nk2 / self.map_scale
 
+    def has_same_grid(self, voxel_map):
+        """
+        Check if voxel_map is defined on the same voxel grid (scale, origin and size) as this voxel map.
+        """
+        return np.array_equal(self.map_scale, voxel_map.map_scale) and \
+            np.array_equal(self.map_origin_2, voxel_map.map_origin_2) and \
+            np.array_equal(self.map_size_int32_2, voxel_map.map_size_int32_2)
+
     def is_valid_voxel(self, position_nk2):
         """
         Check if a given set of positions are within the voxel map or not.
@@ -104,3 +114,122 @@ class VoxelMap(object):
             position_nk2) - self.map_origin_2
         return np.logical_and(np.all(voxel_space_position_nk2 >= 0., axis=2),
                               np.all(voxel_space_position_nk2 < (self.map_size_float32_2 - 1.), axis=2))
+
+
+def compute_voxel_functions(voxel_maps, position_mnk2, invalid_value=100.):
+    """
+    Compute the voxel function of every voxel map i at the positions position_mnk2[i] in one pass. The voxel maps must
+    share the same scale, origin and size (i.e. be maps of the same environment, such as the fmm maps of many agents).
+    """
+    voxel_map = voxel_maps[0]
+    assert(position_mnk2.shape[0] == len(voxel_maps))
+    # Compute the position in the voxel space.
+    voxel_space_position_mnk2 = voxel_map.grid_world_to_voxel_world(
+        position_mnk2) - voxel_map.map_origin_2
+
+    # Define the lower and upper voxels (see VoxelMap.compute_voxel_function)
+    lower_voxel_indices_mnk2_xy = np.mod(
+        np.floor(voxel_space_position_mnk2).astype(np.int32), voxel_map.map_size_int32_2)
+    upper_voxel_indices_mnk2_xy = np.mod(
+        lower_voxel_indices_mnk2_xy + 1, voxel_map.map_size_int32_2)
+
+    # Voxel function values at corner points, gathered from the map of every agent
+    data11_mnk = np.empty(position_mnk2.shape[:-1],
+                          dtype=voxel_map.voxel_function_mn.dtype)
+    data21_mnk = np.empty_like(data11_mnk)
+    data12_mnk = np.empty_like(data11_mnk)
+    data22_mnk = np.empty_like(data11_mnk)
+    for i, vm in enumerate(voxel_maps):
+        data = vm.voxel_function_mn
+        lower_x, lower_y = lower_voxel_indices_mnk2_xy[i, ..., 0], lower_voxel_indices_mnk2_xy[i, ..., 1]
+        upper_x, upper_y = upper_voxel_indices_mnk2_xy[i, ..., 0], upper_voxel_indices_mnk2_xy[i, ..., 1]
+        data11_mnk[i] = data[lower_y, lower_x]
+        data21_mnk[i] = data[lower_y, upper_x]
+        data12_mnk[i] = data[upper_y, lower_x]
+        data22_mnk[i] = data[upper_y, upper_x]
+
+    lower_voxel_float_mnk2 = lower_voxel_indices_mnk2_xy.astype(voxel_space_position_mnk2.dtype)
+    upper_voxel_float_mnk2 = upper_voxel_indices_mnk2_xy.astype(voxel_space_position_mnk2.dtype)
+
+    # Define gammas for x interpolation
+    gamma1 = upper_voxel_float_mnk2[..., 0] - voxel_space_position_mnk2[..., 0]
+    gamma2 = voxel_space_position_mnk2[..., 0] - lower_voxel_float_mnk2[..., 0]
+
+    # Define betas for y interpolation
+    beta1 = upper_voxel_float_mnk2[..., 1] - voxel_space_position_mnk2[..., 1]
+    beta2 = voxel_space_position_mnk2[..., 1] - lower_voxel_float_mnk2[..., 1]
+
+    # Interpolation in the x-direction and then the y-direction
+    f_mnk = beta1 * (gamma1 * data11_mnk + gamma2 * data21_mnk) + \
+        beta2 * (gamma1 * data12_mnk + gamma2 * data22_mnk)
+
+    # Discard the invalid voxels
+    valid_voxels_mnk = np.logical_and(np.all(voxel_space_position_mnk2 >= 0., axis=-1),
+                                      np.all(voxel_space_position_mnk2 < (voxel_map.map_size_float32_2 - 1.), axis=-1))
+    return np.where(valid_voxels_mnk, f_mnk, invalid_value)
+
+
+class StackedVoxelMap(object):
+    """
+    Many voxel maps of the same voxel grid looked up together as the channels of one grid, so that the voxel indices
+    and the bilinear interpolation weights of the positions are computed once and only the gathers are done per
+    channel. The function arrays are read straight from the voxel maps (which may share them between agents, see
+    FmmMapCache) rather than copied into a stacked array.
+    """
+
+    def __init__(self, voxel_maps):
+        voxel_map = voxel_maps[0]
+        assert(all(voxel_map.has_same_grid(vm) for vm in voxel_maps))
+        self.voxel_maps = voxel_maps
+        self.map_scale = voxel_map.map_scale
+        self.map_origin_2 = voxel_map.map_origin_2
+        self.map_size_int32_2 = voxel_map.map_size_int32_2
+        self.map_size_float32_2 = voxel_map.map_size_float32_2
+
+    def compute_voxel_functions(self, position_nk2, invalid_value=100.):
+        """
+        Compute the voxel function of every voxel map (channel) at the specified positions, returned as a (n, k, c)
+        array. The values are the same as VoxelMap.compute_voxel_function of each map.
+        """
+        # Compute the position in the voxel space.
+        voxel_space_position_nk2 = position_nk2 / self.map_scale - self.map_origin_2
+
+        # Define the lower and upper voxels (see VoxelMap.compute_voxel_function)
+        lower_voxel_indices_nk2_xy = np.mod(
+            np.floor(voxel_space_position_nk2).astype(np.int32), self.map_size_int32_2)
+        upper_voxel_indices_nk2_xy = np.mod(
+            lower_voxel_indices_nk2_xy + 1, self.map_size_int32_2)
+
+        # Flat indices of the 4 corner voxels in the (row major, y first) grid of every map
+        size_x = self.map_size_int32_2[0]
+        lower_x, lower_y = lower_voxel_indices_nk2_xy[:, :, 0], lower_voxel_indices_nk2_xy[:, :, 1]
+        upper_x, upper_y = upper_voxel_indices_nk2_xy[:, :, 0], upper_voxel_indices_nk2_xy[:, :, 1]
+        idx11_nk = lower_y * size_x + lower_x
+        idx21_nk = lower_y * size_x + upper_x
+        idx12_nk = upper_y * size_x + lower_x
+        idx22_nk = upper_y * size_x + upper_x
+
+        lower_voxel_float_nk2 = lower_voxel_indices_nk2_xy.astype(voxel_space_position_nk2.dtype)
+        upper_voxel_float_nk2 = upper_voxel_indices_nk2_xy.astype(voxel_space_position_nk2.dtype)
+
+        # Define gammas for x interpolation and betas for y interpolation (shared by every channel)
+        gamma1_nk = upper_voxel_float_nk2[:, :, 0] - voxel_space_position_nk2[:, :, 0]
+        gamma2_nk = voxel_space_position_nk2[:, :, 0] - lower_voxel_float_nk2[:, :, 0]
+        beta1_nk = upper_voxel_float_nk2[:, :, 1] - voxel_space_position_nk2[:, :, 1]
+        beta2_nk = voxel_space_position_nk2[:, :, 1] - lower_voxel_float_nk2[:, :, 1]
+
+        # Discard the invalid voxels
+        valid_voxels_nk = np.logical_and(np.all(voxel_space_position_nk2 >= 0., axis=2),
+                                         np.all(voxel_space_position_nk2 < (self.map_size_float32_2 - 1.), axis=2))
+
+        f_nkc = None
+        for c, voxel_map in enumerate(self.voxel_maps):
+            # (a view of the function array of the map, not a copy)
+            data = voxel_map.voxel_function_mn.ravel()
+            # Interpolation in the x-direction and then the y-direction
+            f_nk = beta1_nk * (gamma1_nk * data[idx11_nk] + gamma2_nk * data[idx21_nk]) + \
+                beta2_nk * (gamma1_nk * data[idx12_nk] + gamma2_nk * data[idx22_nk])
+            if f_nkc is None:
+                f_nkc = np.empty(f_nk.shape + (len(self.voxel_maps),), dtype=f_nk.dtype)
+            f_nkc[:, :, c] = np.where(valid_voxels_nk, f_nk, invalid_value)
+        return f_nkc